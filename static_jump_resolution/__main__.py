@@ -0,0 +1,6 @@
+from .pipeline import main
+
+import sys
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import asyncio
+import inspect
+import time
+import logging
+
+l = logging.getLogger(__name__)
+
+class AnalysisProgress:
+    """ The progress of an analysis run by an `AsyncAnalysisDriver`, after a slice.
+
+    :ivar int slices: The number of slices run so far.
+    :ivar int visits: The number of node visits so far.
+    :ivar int nodes: The number of distinct nodes visited so far.
+    :ivar float elapsed: Seconds since the run started.
+    :ivar bool finished: Whether the fixpoint has been reached.
+    """
+
+    __slots__ = ('slices', 'visits', 'nodes', 'elapsed', 'finished')
+
+    def __init__(self, slices, visits, nodes, elapsed, finished):
+        self.slices = slices
+        self.visits = visits
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.finished = finished
+
+    def __repr__(self):
+        return '<AnalysisProgress: %d slices, %d visits, %d nodes, %.2fs%s>' % \
+                (self.slices, self.visits, self.nodes, self.elapsed,
+                        ', finished' if self.finished else '')
+
+class AsyncAnalysisDriver:
+    """ Run a `StaticJumpResolutionAnalysis` from a coroutine, without blocking the event loop for
+    the whole fixpoint.
+
+    The fixpoint is computed in slices of at most `slice_visits` node visits (see
+    `StaticJumpResolutionAnalysis.step()`). Slices run either on the event loop thread, yielding to
+    the loop between slices, or in an executor. Between slices, the driver reports progress and
+    checks for cancellation and for the time budget; a slice in progress always runs to its end, so
+    the slice size bounds how long the loop is blocked, and how far a budget may be overrun.
+
+    A run stopped by `cancel()` or by the time budget still returns its analysis, with the jumps at
+    the nodes visited so far resolved, and `status` set to 'cancelled' or 'timeout' respectively.
+    So does a run stopped by the analysis' own budget (`max_visits` in `analysis_options`), with
+    `status` set to 'budget'.
+    Cancelling the task awaiting `run()` instead raises `CancelledError` as usual, after the slice
+    in progress, without resolving any jumps.
+
+    :param project: The angr project.
+    :param cfg: A CFG analysis object for the binary.
+    :param int slice_visits: The number of node visits per slice.
+    :param float time_budget: (Optional) Stop after the first slice to end this many seconds after
+        the run started.
+    :param bool offload: If True, run the construction of the analysis and each slice in
+        `executor`.
+    :param executor: (Optional) The `concurrent.futures.Executor` used when offloading. Defaults to
+        the loop's default executor.
+    :param progress_callback: (Optional) Called with an `AnalysisProgress` after each slice. May be
+        a coroutine function.
+    :param analysis_options: Passed to `StaticJumpResolutionAnalysis`.
+    """
+
+    def __init__(self, project, cfg, slice_visits=1000, time_budget=None, offload=False,
+            executor=None, progress_callback=None, **analysis_options):
+        if slice_visits < 1:
+            raise ValueError('slice_visits must be positive')
+
+        self.project = project
+        self.cfg = cfg
+        self.slice_visits = slice_visits
+        self.time_budget = time_budget
+        self.offload = offload
+        self.executor = executor
+        self.progress_callback = progress_callback
+
+        self._resolve = analysis_options.pop('resolve', True)
+        self._analysis_options = analysis_options
+
+        self.analysis = None
+        self.progress = None
+        self.status = None
+        self._cancel_requested = False
+
+    def cancel(self):
+        """ Stop the run after the slice in progress, and return partial results. """
+        self._cancel_requested = True
+
+    async def run(self):
+        """ Run the analysis to its fixpoint, or until cancelled or out of time.
+
+        :return: The `StaticJumpResolutionAnalysis`.
+        """
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        self.status = 'running'
+
+        try:
+            if self.analysis is None:
+                self.analysis = await self._call(loop, self._construct)
+
+            slices = 0
+            while True:
+                if self._cancel_requested:
+                    self.status = 'cancelled'
+                    break
+                if self.time_budget is not None and time.monotonic() - start >= self.time_budget:
+                    self.status = 'timeout'
+                    break
+
+                finished = await self._call(loop, self.analysis.step, self.slice_visits)
+                slices += 1
+
+                self.progress = AnalysisProgress(slices, self.analysis.iterations,
+                        len(self.analysis.visited_nodes), time.monotonic() - start, finished)
+                await self._report(self.progress)
+
+                if finished:
+                    self.status = 'finished'
+                    break
+                if self.analysis.budget_exceeded is not None:
+                    self.status = 'timeout' if self.analysis.budget_exceeded == 'time' else 'budget'
+                    break
+                if not self.offload:
+                    await asyncio.sleep(0)
+
+            if self.status == 'finished':
+                await self._call(loop, self.analysis.finish)
+            else:
+                l.info('Analysis %s after %s, resolving jumps at %d visited nodes', self.status,
+                        self.progress, len(self.analysis.visited_nodes))
+                if self._resolve:
+                    await self._call(loop, self.analysis.resolve_jumps,
+                            self.analysis.visited_nodes)
+
+        except asyncio.CancelledError:
+            self.status = 'cancelled'
+            raise
+
+        return self.analysis
+
+    def _construct(self):
+        return self.project.analyses.StaticJumpResolutionAnalysis(self.cfg,
+                resolve=self._resolve, analyze=False, **self._analysis_options)
+
+    async def _call(self, loop, fn, *args):
+        if self.offload:
+            return await loop.run_in_executor(self.executor, fn, *args)
+        return fn(*args)
+
+    async def _report(self, progress):
+        if self.progress_callback is None:
+            return
+        result = self.progress_callback(progress)
+        if inspect.isawaitable(result):
+            await result
+
+async def analyze_async(project, cfg, **kwargs):
+    """ Run a `StaticJumpResolutionAnalysis` without blocking the event loop.
+
+    :param kwargs: Passed to `AsyncAnalysisDriver`.
+    :return: The `StaticJumpResolutionAnalysis`.
+    """
+    return await AsyncAnalysisDriver(project, cfg, **kwargs).run()
@@ -0,0 +1,342 @@
+from collections import deque
+import multiprocessing
+import multiprocessing.connection
+import argparse
+import json
+import os
+import pickle
+import resource
+import sys
+import time
+import logging
+
+l = logging.getLogger(__name__)
+
+def analyze_binary(binary, load_options=None, cfg_options=None, **analysis_options):
+    """ Run the full analysis on one binary and summarize the results.
+
+    :param str binary: The path to the binary.
+    :param dict load_options: (Optional) Extra keyword arguments to `angr.Project`.
+    :param dict cfg_options: (Optional) Extra keyword arguments to `CFGFast`.
+    :param analysis_options: Passed to `StaticJumpResolutionAnalysis`.
+    :return: A JSON-serializable dict.
+    """
+    import angr
+    from .resolve import format_jumps
+    from .static_jump_resolution import StaticJumpResolutionAnalysis
+
+    load_options = dict(load_options or {})
+    load_options.setdefault('auto_load_libs', False)
+
+    proj = angr.Project(binary, **load_options)
+    cfg = proj.analyses.CFGFast(**(cfg_options or {}))
+    analysis = proj.analyses.StaticJumpResolutionAnalysis(cfg, **analysis_options)
+
+    return {
+        'functions': len(cfg.kb.functions),
+        'nodes': len(cfg.graph),
+        'jumps': format_jumps(analysis.jump_resolutions),
+    }
+
+def read_manifest(lines):
+    """ Parse a manifest of binaries to analyse.
+
+    Each non-empty line that does not start with '#' is either a path to a binary, or a JSON object
+    with a 'binary' key and optional 'options' (a dict of keyword arguments to the job).
+
+    :param lines: Iterable of str.
+    :return: list of (binary, options) pairs.
+    """
+    tasks = []
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            continue
+
+        if line.startswith('{'):
+            entry = json.loads(line)
+            tasks.append((entry['binary'], entry.get('options', {})))
+        else:
+            tasks.append((line, {}))
+
+    return tasks
+
+def _current_rss():
+    """ The resident set size of the current process in bytes, or None if unknown. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _reset_peak_rss():
+    """ Reset the peak resident set size of the current process, so that the next
+    `_peak_rss()` covers only what runs in between. Needs Linux 4.0 or later.
+
+    :return: True if the peak was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss():
+    """ The peak resident set size of the current process in bytes since it started or since the
+    last `_reset_peak_rss()`, or None if unknown.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def _prewarm():
+    try:
+        import angr
+        from . import static_jump_resolution
+    except ImportError as e:
+        l.warning('Could not pre-import analysis modules: %s', e)
+
+def _worker_main(conn, job, memory_limit, prewarm):
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if prewarm:
+        _prewarm()
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        (binary, options) = task
+        reset = _reset_peak_rss()
+        start = time.time()
+        try:
+            record = {'status': 'ok', 'result': job(binary, **options)}
+        except MemoryError:
+            record = {'status': 'memory', 'error': 'memory limit exceeded'}
+        except Exception as e:
+            record = {'status': 'error', 'error': '%s: %s' % (type(e).__name__, e)}
+
+        record['time'] = time.time() - start
+        # Without a reset, the peak would cover every binary this worker has analysed
+        record['peak_rss'] = _peak_rss() if reset else None
+        record['rss'] = _current_rss()
+
+        try:
+            conn.send(record)
+        except (TypeError, ValueError, pickle.PicklingError) as e:
+            conn.send({'status': 'error', 'error': 'unserializable result: %s' % e,
+                'time': record['time'], 'peak_rss': record['peak_rss'], 'rss': record['rss']})
+
+class _Worker:
+    """ Parent-side handle on a worker process. """
+
+    def __init__(self, ctx, job, memory_limit, prewarm):
+        (self.conn, child_conn) = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                args=(child_conn, job, memory_limit, prewarm), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.task = None
+        self.started = None
+        self.completed = 0
+
+    @property
+    def busy(self):
+        return self.task is not None
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.time()
+        self.conn.send(task)
+
+    def finish(self):
+        task = self.task
+        self.task = None
+        self.started = None
+        self.completed += 1
+        return task
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.conn.close()
+
+class BatchDriver:
+    """ Analyse many binaries over a pool of reusable, isolated worker processes.
+
+    Each binary is analysed in a worker process, so that a crash, runaway memory use or timeout on
+    one binary only costs that binary. Workers are started once and reused across binaries, to
+    amortize interpreter startup and the import of angr, and are recycled after a configurable
+    number of binaries or once their resident memory grows past a limit.
+
+    :param int workers: The number of worker processes. Defaults to the number of CPUs.
+    :param float timeout: (Optional) Per-binary wall-clock limit in seconds. A worker exceeding it
+        is killed and replaced.
+    :param int memory_limit: (Optional) Per-worker address space limit in bytes.
+    :param int max_tasks_per_worker: (Optional) Recycle a worker after this many binaries.
+    :param int recycle_rss: (Optional) Recycle a worker once its resident memory after a binary
+        exceeds this many bytes, to contain leaks.
+    :param job: The function run on each binary, called as `job(binary, **options)`. Must be
+        picklable. Defaults to `analyze_binary`.
+    :param str start_method: (Optional) The multiprocessing start method.
+    :param bool prewarm: Whether workers import angr before accepting work.
+    """
+
+    def __init__(self, workers=None, timeout=None, memory_limit=None, max_tasks_per_worker=None,
+            recycle_rss=None, job=analyze_binary, start_method=None, prewarm=True):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.recycle_rss = recycle_rss
+        self.job = job
+        self.prewarm = prewarm
+
+        self._ctx = multiprocessing.get_context(start_method)
+
+    def _spawn(self):
+        return _Worker(self._ctx, self.job, self.memory_limit, self.prewarm)
+
+    def run(self, tasks, out=None):
+        """ Analyse each binary, yielding one result record per binary as it completes.
+
+        :param tasks: Iterable of (binary, options) pairs, e.g. from `read_manifest()`.
+        :param out: (Optional) A text stream to which each record is also written as a JSON line.
+        :return: An iterator over result dicts, each with at least 'binary', 'status' and 'time'
+            keys. Status is one of 'ok', 'error', 'memory', 'timeout' or 'crashed'. Records from
+            workers that finished the binary also have 'peak_rss', the peak resident memory of the
+            worker in bytes while it analysed that binary (None where the platform cannot measure
+            it), and 'rss', its resident memory afterwards.
+        """
+        pending = deque(tasks)
+        pool = [self._spawn() for _ in range(min(self.workers, max(1, len(pending))))]
+
+        try:
+            while len(pending) > 0 or any(w.busy for w in pool):
+                for w in pool:
+                    if not w.busy and len(pending) > 0:
+                        w.submit(pending.popleft())
+
+                busy = [w for w in pool if w.busy]
+                waitables = [w.conn for w in busy] + [w.process.sentinel for w in busy]
+                multiprocessing.connection.wait(waitables, timeout=self._poll_interval(busy))
+
+                for (i, w) in enumerate(pool):
+                    if not w.busy:
+                        continue
+
+                    record = self._collect(w)
+                    if record is None:
+                        continue
+
+                    (binary, options) = w.finish()
+                    record['binary'] = binary
+                    if len(options) > 0:
+                        record['options'] = options
+
+                    if out is not None:
+                        out.write(json.dumps(record) + '\n')
+                        out.flush()
+
+                    if record['status'] in ('timeout', 'crashed') or self._should_recycle(w, record):
+                        w.kill()
+                        pool[i] = self._spawn()
+
+                    yield record
+        finally:
+            for w in pool:
+                w.stop()
+
+    def _poll_interval(self, busy):
+        if self.timeout is None or len(busy) == 0:
+            return None
+        now = time.time()
+        return max(0, min(w.started + self.timeout - now for w in busy))
+
+    def _collect(self, w):
+        """ Get the result record of a busy worker, if it has finished, crashed or timed out. """
+        try:
+            if w.conn.poll():
+                return w.conn.recv()
+        except (EOFError, OSError):
+            return {'status': 'crashed', 'error': 'worker exited with code %s' % w.process.exitcode,
+                    'time': time.time() - w.started}
+
+        if not w.process.is_alive():
+            return {'status': 'crashed', 'error': 'worker exited with code %s' % w.process.exitcode,
+                    'time': time.time() - w.started}
+
+        if self.timeout is not None and time.time() - w.started >= self.timeout:
+            return {'status': 'timeout', 'error': 'exceeded %gs' % self.timeout,
+                    'time': time.time() - w.started}
+
+        return None
+
+    def _should_recycle(self, w, record):
+        if self.max_tasks_per_worker is not None and w.completed >= self.max_tasks_per_worker:
+            return True
+        rss = record.get('rss')
+        return self.recycle_rss is not None and rss is not None and rss > self.recycle_rss
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='static_jump_resolution.batch',
+            description='Analyse the binaries listed in a manifest, one JSON line per binary.')
+    parser.add_argument('manifest', help="manifest file, or '-' for stdin")
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=None, help='per-binary timeout in seconds')
+    parser.add_argument('--memory-limit', type=int, default=None,
+            help='per-worker memory limit in MiB')
+    parser.add_argument('--max-tasks-per-worker', type=int, default=None)
+    parser.add_argument('--recycle-rss', type=int, default=None,
+            help='recycle workers whose resident memory exceeds this many MiB')
+    args = parser.parse_args(argv)
+
+    if args.manifest == '-':
+        tasks = read_manifest(sys.stdin)
+    else:
+        with open(args.manifest) as f:
+            tasks = read_manifest(f)
+
+    mib = lambda n: None if n is None else n * 1024 * 1024
+    driver = BatchDriver(workers=args.workers, timeout=args.timeout,
+            memory_limit=mib(args.memory_limit), max_tasks_per_worker=args.max_tasks_per_worker,
+            recycle_rss=mib(args.recycle_rss))
+
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    failed = 0
+    try:
+        for record in driver.run(tasks, out):
+            if record['status'] != 'ok':
+                failed += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    return 1 if failed > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
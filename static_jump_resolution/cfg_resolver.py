@@ -0,0 +1,198 @@
+from angr.analyses.cfg.indirect_jump_resolvers.resolver import IndirectJumpResolver
+
+from .engine import SimEngineSJRVEX, is_indirect_jump
+from .jump_table import JumpTableResolver, ReadOnlyMemory
+from .resolve import TargetResolver
+from .stack import StackDeltas
+from .supergraph import DummyNode
+
+import weakref
+import logging
+
+l = logging.getLogger(__name__)
+
+class FunctionView:
+    """ The part of the supergraph within one function, read from a CFG that may still be under
+    recovery.
+
+    Only the predecessors of the function's nodes are provided. As in the supergraph, the return
+    site of a call is preceded by the dummy return node of the call site, and the entry node by
+    the dummy call nodes of its callers; return edges from callees are left out.
+
+    :param cfg: The CFG analysis.
+    :param int fn_addr:
+    """
+
+    def __init__(self, cfg, fn_addr):
+        self._graph = cfg.model.graph
+        self.fn_addr = fn_addr
+        self.nodes = []
+
+        fn = cfg.kb.functions.function(addr=fn_addr)
+        if fn is not None:
+            for addr in fn.block_addrs_set:
+                self.nodes.extend(n for n in cfg.model.get_all_nodes(addr) \
+                        if n.function_address == fn_addr)
+
+    def node_at(self, addr):
+        """ The node of the function at a block address, or None. """
+        for n in self.nodes:
+            if n.addr == addr:
+                return n
+        return None
+
+    def predecessors(self, node):
+        preds = []
+        for (pred, _, data) in self._graph.in_edges(node, data=True):
+            jumpkind = data.get('jumpkind')
+            if jumpkind == 'Ijk_FakeRet':
+                preds.append(DummyNode(pred, 'Dummy_Ret'))
+            elif jumpkind == 'Ijk_Call':
+                preds.append(DummyNode(pred, 'Dummy_Call'))
+            elif jumpkind != 'Ijk_Ret':
+                preds.append(pred)
+        return preds
+
+def _function_version(cfg, fn_addr):
+    """ A value that changes whenever the recovered graph of a function grows. """
+    fn = cfg.kb.functions.function(addr=fn_addr)
+    if fn is None:
+        return None
+    graph = fn.transition_graph
+    return (len(fn.block_addrs_set), graph.number_of_nodes(), graph.number_of_edges())
+
+class _FunctionResults:
+    """ The resolver and resolutions of the jumps in one function, at one version of its graph. """
+
+    __slots__ = ('version', 'view', 'resolver', 'resolutions')
+
+    def __init__(self, version, view, resolver):
+        self.version = version
+        self.view = view
+        self.resolver = resolver
+        self.resolutions = {}
+
+class ResolverCache:
+    """ The state shared by `StaticJumpResolver`s: per-function resolution results, and the engine
+    caching the lifted and substituted statements of every block.
+
+    The results of a function are reused across calls for as long as its recovered graph is
+    unchanged, so that the jumps of one function share its view of the graph, and a jump queried
+    again is answered without resolving it again. Since targets are only traced within a function,
+    a function's results are invalidated only when its own graph grows. Blocks whose sizes have
+    changed since they were last seen, e.g. after being split, are dropped from the engine.
+
+    :param project: The angr project.
+    :param SimEngineSJRVEX engine: (Optional) The engine to use, e.g. one already holding the
+        block caches of an earlier analysis.
+    """
+
+    def __init__(self, project, engine=None):
+        self.project = project
+        self.engine = engine if engine is not None else SimEngineSJRVEX()
+        self.memory = ReadOnlyMemory(project.loader)
+
+        # CFG -> function address -> _FunctionResults
+        self._functions = weakref.WeakKeyDictionary()
+        self._block_sizes = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def function_results(self, cfg, fn_addr):
+        """ Get the current results of a function, rebuilding them if its graph has changed.
+
+        :rtype: _FunctionResults
+        """
+        functions = self._functions.setdefault(cfg, {})
+        version = _function_version(cfg, fn_addr)
+        results = functions.get(fn_addr)
+        if results is not None and results.version == version:
+            return results
+
+        view = FunctionView(cfg, fn_addr)
+        self._check_block_sizes(view.nodes)
+
+        deltas = StackDeltas.compute(fn_addr, view.nodes, view.predecessors, self.engine,
+                self.project.arch)
+        jump_tables = JumpTableResolver(self.project, self.engine, view, memory=self.memory)
+        resolver = TargetResolver(self.project, self.engine, view, jump_tables=jump_tables,
+                contexts=lambda n: deltas.ctx(n.addr))
+        results = _FunctionResults(version, view, resolver)
+        functions[fn_addr] = results
+        return results
+
+    def _check_block_sizes(self, nodes):
+        stale = []
+        for n in nodes:
+            size = self._block_sizes.get(n.addr)
+            if size is not None and size != n.size:
+                stale.append(n.addr)
+            self._block_sizes[n.addr] = n.size
+
+        if len(stale) > 0:
+            l.debug('Dropping %d resized blocks', len(stale))
+            self.engine.forget_blocks(stale)
+
+    def resolve(self, cfg, fn_addr, addr):
+        """ Resolve the jump ending the block at an address of a function.
+
+        :return: A `JumpResolution`, or None if the block is not known or does not end in an
+            indirect jump.
+        """
+        results = self.function_results(cfg, fn_addr)
+        if addr in results.resolutions:
+            self.hits += 1
+            return results.resolutions[addr]
+
+        self.misses += 1
+        node = results.view.node_at(addr)
+        resolution = None if node is None else results.resolver.resolve(node)
+        results.resolutions[addr] = resolution
+        return resolution
+
+    def clear(self):
+        """ Drop all cached results and blocks. """
+        self._functions.clear()
+        self._block_sizes.clear()
+        self.engine = SimEngineSJRVEX()
+
+    def close(self):
+        """ Release the memory mappings of the binaries. """
+        self.memory.close()
+
+class StaticJumpResolver(IndirectJumpResolver):
+    """ An angr indirect jump resolver backed by static target resolution, for `CFGFast` to call
+    while recovering the CFG, e.g.:
+
+        resolver = StaticJumpResolver(proj)
+        cfg = proj.analyses.CFGFast(indirect_jump_resolvers=[resolver])
+
+    Jump targets are resolved as by `StaticJumpResolutionAnalysis.resolve_jumps()` (see
+    `TargetResolver`), over the part of the function recovered so far. Since `CFGFast` resolves the
+    jumps of a function once its direct jumps have been followed, and adds the resolved targets to
+    the same CFG, whole-program recovery converges in a single pass.
+
+    Resolvers created with the same `ResolverCache` share their results; see `ResolverCache`.
+
+    :param project: The angr project.
+    :param ResolverCache cache: (Optional) The cache to use. By default, a new one is created.
+    """
+
+    def __init__(self, project, cache=None):
+        super(StaticJumpResolver, self).__init__(project, timeless=False)
+        self.cache = cache if cache is not None else ResolverCache(project)
+
+    def filter(self, cfg, addr, func_addr, block, jumpkind):
+        return jumpkind == 'Ijk_Boring' and is_indirect_jump(block) is not None
+
+    def resolve(self, cfg, addr, func_addr, block, jumpkind, func_graph_complete=True, **kwargs):
+        resolution = self.cache.resolve(cfg, func_addr, addr)
+        if resolution is None or not resolution.resolved:
+            return (False, [])
+
+        targets = sorted(t for t in resolution.targets if self._is_target_valid(cfg, t))
+        if len(targets) < len(resolution.targets):
+            l.debug('Discarded %d invalid targets of 0x%x', len(resolution.targets) - len(targets),
+                    resolution.addr)
+        return (len(targets) > 0, targets)
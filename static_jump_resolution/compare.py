@@ -0,0 +1,290 @@
+from .batch import BatchDriver
+
+import argparse
+import json
+import sys
+import time
+import logging
+
+l = logging.getLogger(__name__)
+
+TOOLS = ('angr', 'sjr')
+
+def _hex_targets(targets):
+    if targets is None:
+        return None
+    return ['0x%x' % t for t in sorted(targets)]
+
+def _run_angr(proj, cfg_options):
+    """ Recover a CFG with angr's own indirect jump resolvers. """
+    start = time.time()
+    cfg = proj.analyses.CFGFast(**dict(cfg_options, resolve_indirect_jumps=True))
+    cfg_time = time.time() - start
+
+    jumps = {}
+    for ij in cfg.indirect_jumps.values():
+        if ij.jumpkind != 'Ijk_Boring':
+            continue
+        targets = set(ij.resolved_targets)
+        jumps['0x%x' % ij.ins_addr] = _hex_targets(targets) if len(targets) > 0 else None
+
+    return {
+        'functions': len(cfg.kb.functions),
+        'nodes': len(cfg.graph),
+        'cfg_time': cfg_time,
+        'jumps': jumps,
+    }
+
+def _run_sjr(proj, cfg_options, analysis_options):
+    """ Recover a CFG without resolving indirect jumps, then resolve them with the analysis. """
+    from .resolve import format_jumps
+    from .static_jump_resolution import StaticJumpResolutionAnalysis
+
+    start = time.time()
+    cfg = proj.analyses.CFGFast(**dict(cfg_options, resolve_indirect_jumps=False))
+    cfg_time = time.time() - start
+
+    start = time.time()
+    analysis = proj.analyses.StaticJumpResolutionAnalysis(cfg, **analysis_options)
+    analysis_time = time.time() - start
+
+    return {
+        'functions': len(cfg.kb.functions),
+        'nodes': len(cfg.graph),
+        'cfg_time': cfg_time,
+        'analysis_time': analysis_time,
+        'jumps': format_jumps(analysis.jump_resolutions),
+    }
+
+def run_tool(binary, tool, load_options=None, cfg_options=None, **analysis_options):
+    """ Resolve the indirect jumps of a binary with one tool. This is the job run by `compare()` in
+    each worker process.
+
+    :param str binary: The path to the binary.
+    :param str tool: 'angr' for `CFGFast` with its built-in resolvers, or 'sjr' for `CFGFast`
+        without them followed by `StaticJumpResolutionAnalysis`.
+    :param dict load_options: (Optional) Extra keyword arguments to `angr.Project`.
+    :param dict cfg_options: (Optional) Extra keyword arguments to `CFGFast`.
+    :param analysis_options: Passed to `StaticJumpResolutionAnalysis`, for the 'sjr' tool.
+    :return: A JSON-serializable dict, with 'jumps' mapping hex jump instruction addresses to sorted
+        lists of hex targets, or None for unresolved jumps.
+    """
+    import angr
+
+    if tool not in TOOLS:
+        raise ValueError('Unknown tool %r' % tool)
+
+    load_options = dict(load_options or {})
+    load_options.setdefault('auto_load_libs', False)
+    proj = angr.Project(binary, **load_options)
+
+    if tool == 'angr':
+        return _run_angr(proj, dict(cfg_options or {}))
+    return _run_sjr(proj, dict(cfg_options or {}), analysis_options)
+
+def read_ground_truth(path):
+    """ Read the expected targets of each jump site from a JSON file, e.g. the manifest written
+    with a generated test fixture.
+
+    :param str path: A JSON file with a 'jump_tables' object mapping hex jump addresses to lists of
+        hex targets.
+    :return: dict mapping hex jump addresses to sorted lists of hex targets.
+    """
+    with open(path) as f:
+        truth = json.load(f)
+    return dict((a, _hex_targets(int(t, 16) for t in ts)) \
+            for (a, ts) in truth['jump_tables'].items())
+
+def compare_jumps(angr_jumps, sjr_jumps, truth=None):
+    """ Compare the targets found by each tool at each jump site.
+
+    Any argument may be None if that tool failed, or there is no ground truth.
+
+    :param dict angr_jumps: The 'jumps' of the 'angr' tool.
+    :param dict sjr_jumps: The 'jumps' of the 'sjr' tool.
+    :param dict truth: (Optional) The expected targets, from `read_ground_truth()`.
+    :return: A pair of a dict mapping each jump site to the targets found by each tool, and a
+        summary dict of counts.
+    """
+    sources = [('angr', angr_jumps), ('sjr', sjr_jumps), ('truth', truth)]
+    sources = [(name, jumps) for (name, jumps) in sources if jumps is not None]
+
+    sites = {}
+    for (name, jumps) in sources:
+        for addr in jumps:
+            sites.setdefault(addr, {})
+    for (addr, site) in sites.items():
+        for (name, jumps) in sources:
+            site[name] = jumps.get(addr)
+
+    summary = {'sites': len(sites)}
+    for (name, _) in sources:
+        if name == 'truth':
+            continue
+
+        found = [set(s[name]) for s in sites.values() if s[name] is not None]
+        summary[name + '_resolved'] = len(found)
+        summary[name + '_targets'] = sum(len(ts) for ts in found)
+
+        if truth is not None:
+            exact = missed = spurious = 0
+            for site in sites.values():
+                if site['truth'] is None:
+                    continue
+                (expected, got) = (set(site['truth']), set(site[name] or ()))
+                exact += expected == got
+                missed += len(expected - got)
+                spurious += len(got - expected)
+            summary[name + '_exact'] = exact
+            summary[name + '_missed'] = missed
+            summary[name + '_spurious'] = spurious
+
+    if angr_jumps is not None and sjr_jumps is not None:
+        summary['agree'] = sum(1 for s in sites.values() if s['angr'] == s['sjr'])
+        summary['angr_only'] = sum(1 for s in sites.values() \
+                if s['angr'] is not None and s['sjr'] is None)
+        summary['sjr_only'] = sum(1 for s in sites.values() \
+                if s['sjr'] is not None and s['angr'] is None)
+
+    return (sites, summary)
+
+def _tool_record(record):
+    """ The timing and memory of one tool run, from its batch record. """
+    tool = {
+        'status': record['status'],
+        'time': record['time'],
+        'peak_rss': record.get('peak_rss'),
+    }
+    if record['status'] == 'ok':
+        result = record['result']
+        for key in ('functions', 'nodes', 'cfg_time', 'analysis_time'):
+            if key in result:
+                tool[key] = result[key]
+    else:
+        tool['error'] = record.get('error')
+    return tool
+
+def compare(binaries, ground_truth=None, load_options=None, cfg_options=None, workers=1,
+        timeout=None, memory_limit=None, out=None, **analysis_options):
+    """ Resolve the indirect jumps of each binary with angr's built-in resolvers and with this
+    analysis, and compare their cost and results.
+
+    Each tool runs on each binary in a fresh worker process, so that its peak resident memory is
+    measured in isolation, and so that a crash or timeout of one tool still reports the other.
+    Peak memory includes the baseline of the interpreter with angr imported, which is the same for
+    both tools.
+
+    Wall times are for the whole run of a tool, including loading the binary. The CFG recovery time
+    of the 'sjr' tool, which does not resolve indirect jumps, is the baseline against which the
+    cost of angr's resolvers within its `CFGFast` can be estimated, though the two CFGs may differ
+    in the code they reach.
+
+    :param binaries: Iterable of paths to binaries.
+    :param dict ground_truth: (Optional) Mapping from binary paths to expected targets, as returned
+        by `read_ground_truth()`.
+    :param dict load_options: (Optional) Extra keyword arguments to `angr.Project`.
+    :param dict cfg_options: (Optional) Extra keyword arguments to `CFGFast`.
+    :param int workers: The number of worker processes. With more than one, the tools run
+        concurrently and their wall times may be affected.
+    :param float timeout: (Optional) Per-run wall-clock limit in seconds.
+    :param int memory_limit: (Optional) Per-run address space limit in bytes.
+    :param out: (Optional) A text stream to which each report is also written as a JSON line.
+    :param analysis_options: Passed to `StaticJumpResolutionAnalysis`.
+    :return: An iterator over one report dict per binary, in the order of `binaries`, each with
+        'binary', 'angr', 'sjr', 'sites' and 'summary' keys.
+    """
+    binaries = list(binaries)
+    ground_truth = ground_truth or {}
+    options = {'load_options': load_options, 'cfg_options': cfg_options}
+
+    tasks = []
+    for binary in binaries:
+        tasks.append((binary, dict(options, tool='angr')))
+        tasks.append((binary, dict(options, tool='sjr', **analysis_options)))
+
+    driver = BatchDriver(workers=workers, timeout=timeout, memory_limit=memory_limit,
+            max_tasks_per_worker=1, job=run_tool)
+
+    records = {}
+    for record in driver.run(tasks):
+        records[(record['binary'], record['options']['tool'])] = record
+
+    for binary in binaries:
+        runs = dict((tool, records[(binary, tool)]) for tool in TOOLS)
+        jumps = dict((tool, r['result']['jumps'] if r['status'] == 'ok' else None) \
+                for (tool, r) in runs.items())
+        (sites, summary) = compare_jumps(jumps['angr'], jumps['sjr'], ground_truth.get(binary))
+
+        report = {
+            'binary': binary,
+            'angr': _tool_record(runs['angr']),
+            'sjr': _tool_record(runs['sjr']),
+            'sites': sites,
+            'summary': summary,
+        }
+        if out is not None:
+            out.write(json.dumps(report) + '\n')
+            out.flush()
+
+        yield report
+
+def format_report(report):
+    """ Format the comparison of one binary as text. """
+    lines = ['== %s' % report['binary']]
+    for tool in TOOLS:
+        r = report[tool]
+        if r['status'] != 'ok':
+            lines.append('  %-4s %s: %s' % (tool, r['status'], r.get('error')))
+            continue
+
+        times = 'cfg %.2fs' % r['cfg_time']
+        if 'analysis_time' in r:
+            times += ', analysis %.2fs' % r['analysis_time']
+        peak = '-' if r['peak_rss'] is None else '%.1f MiB' % (r['peak_rss'] / 1048576.)
+        lines.append('  %-4s %7.2fs (%s), peak %s' % (tool, r['time'], times, peak))
+
+    summary = report['summary']
+    lines.append('  %d jump sites' % summary['sites'] + ''.join(', %s %d' % (k, summary[k]) \
+            for k in sorted(summary) if k != 'sites'))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='static_jump_resolution.compare',
+            description="Compare the speed, memory use and targets of angr's built-in indirect "
+                'jump resolvers with this analysis, one JSON line per binary.')
+    parser.add_argument('binaries', nargs='+')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('--ground-truth', action='store_true',
+            help="read the expected targets of each binary from '<binary>.json' if it exists")
+    parser.add_argument('-j', '--workers', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None, help='per-run timeout in seconds')
+    parser.add_argument('--memory-limit', type=int, default=None,
+            help='per-run memory limit in MiB')
+    parser.add_argument('--sparse', action='store_true', help='use sparse evaluation')
+    args = parser.parse_args(argv)
+
+    ground_truth = {}
+    if args.ground_truth:
+        for binary in args.binaries:
+            try:
+                ground_truth[binary] = read_ground_truth(binary + '.json')
+            except FileNotFoundError:
+                l.warning('No ground truth for %s', binary)
+
+    memory_limit = None if args.memory_limit is None else args.memory_limit * 1024 * 1024
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    failed = 0
+    try:
+        for report in compare(args.binaries, ground_truth=ground_truth, workers=args.workers,
+                timeout=args.timeout, memory_limit=memory_limit, out=out, sparse=args.sparse):
+            sys.stderr.write(format_report(report) + '\n')
+            if any(report[tool]['status'] != 'ok' for tool in TOOLS):
+                failed += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    return 1 if failed > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,10 @@
-class CtxRecord:
+from .interning import Interned
+
+class CtxRecord(Interned):
     """ A call record in a calling context string.
 
     Consists of the associated dummy call node, and the pseudo-values of the
-    stack and base pointers at the time it was recorded.
+    stack and base pointers at the time it was recorded. Interned (see `Interned`).
 
     :param DummyNode node:
     :param int sp:
@@ -11,11 +13,14 @@ class CtxRecord:
 
     __slots__ = ("_node", "_sp", "_bp")
 
-    def __init__(self, node, sp, bp):
+    def _init(self, node, sp, bp):
         self._node = node
         self._sp = sp
         self._bp = bp
 
+    def _args(self):
+        return (self._node, self._sp, self._bp)
+
     @property
     def stack_ptr(self):
         """ The value of the stack pointer associated with this record. """
@@ -44,9 +49,11 @@ class CtxRecord:
     def __eq__(self, other):
         """ For the purposes of equality testing, the values of the stack and base pointers are
         ignored. """
-        return self._node == other._node
+        return self is other or (type(other) is CtxRecord and self._node is other._node)
 
-    def __hash__(self):
+    __hash__ = Interned.__hash__
+
+    def _compute_hash(self):
         """ For the purposes of hashing, the values of the stack and base pointers are ignored. """
         return hash(("CtxRecord", self._node))
 
@@ -0,0 +1,229 @@
+from .vars import Register, StackVar
+
+import logging
+import math
+
+l = logging.getLogger(__name__)
+
+def may_alias(var1, var2):
+    """ Conservatively determine whether two variables may refer to overlapping storage.
+
+    Registers alias if their byte ranges in the register file overlap, and `StackVar`s alias if
+    their frame regions overlap. Any two `MemoryLocation`s are assumed to alias, since their
+    addresses are symbolic. Variables of different kinds never alias.
+
+    :param Var var1:
+    :param Var var2:
+    :rtype: bool
+    """
+    if type(var1) is not type(var2):
+        return False
+
+    if type(var1) is Register:
+        return var1.offset < var2.offset + var2.size and \
+                var2.offset < var1.offset + var1.size
+
+    elif type(var1) is StackVar:
+        return var1.overlaps(var2)
+
+    else:
+        return True
+
+def var_key(var):
+    """ An index key for a variable. Any two `StackVar`s or `MemoryLocation`s that may alias share a
+    key. `Register`s are keyed by offset, so aliasing registers are found by looking up every offset
+    they overlap (see `DefUseIndex`).
+
+    :param Var var:
+    """
+    if type(var) is Register:
+        return ('Register', var.offset)
+    elif type(var) is StackVar:
+        return ('StackVar', var.fn_addr)
+    else:
+        return ('MemoryLocation',)
+
+class StmtSummary:
+    """ The variables defined and used by a single (tmp-substituted) IR statement.
+
+    :param int idx: The index of the statement in its block.
+    :param defs: Iterable of `Var` modified by the statement.
+    :param uses: Iterable of `Var` used by the statement.
+    :param bool is_jump: Whether the statement is a (conditional) indirect jump.
+    """
+    __slots__ = ('idx', 'defs', 'uses', 'is_jump')
+
+    def __init__(self, idx, defs, uses, is_jump=False):
+        self.idx = idx
+        self.defs = frozenset(defs)
+        self.uses = frozenset(uses)
+        self.is_jump = is_jump
+
+    def defines_any(self, vars):
+        """ Does this statement define any variable that may alias one of the given variables?
+
+        :param vars: Iterable of `Var`.
+        """
+        return any(may_alias(d, v) for d in self.defs for v in vars)
+
+    def __repr__(self):
+        return '<StmtSummary %d defs=%s uses=%s%s>' % \
+                (self.idx, set(self.defs), set(self.uses), ' jump' if self.is_jump else '')
+
+class BlockSummary:
+    """ The def/use summary of a lifted block, as computed by `SimEngineSJRVEX.summarize()`.
+
+    :param int addr: The address of the summarized block.
+    :param stmts: Iterable of `StmtSummary`, in statement order.
+    :param jump_uses: Iterable of `Var` used by the block's indirect jump target, if the block ends
+        in an indirect jump. Empty otherwise.
+    """
+    __slots__ = ('addr', 'stmts', 'jump_uses', 'defs', 'uses')
+
+    def __init__(self, addr, stmts, jump_uses=None):
+        self.addr = addr
+        self.stmts = tuple(stmts)
+        self.jump_uses = frozenset() if jump_uses is None else frozenset(jump_uses)
+        self.defs = frozenset(d for s in self.stmts for d in s.defs)
+        self.uses = frozenset(u for s in self.stmts for u in s.uses) | self.jump_uses
+
+    @property
+    def has_jump(self):
+        """ Does this block contain an indirect jump (conditional or otherwise)? """
+        return len(self.jump_uses) > 0 or any(s.is_jump for s in self.stmts)
+
+    def is_relevant(self, live_vars):
+        """ Does this block contain a gen or kill point for any of the given live variables?
+
+        Blocks containing indirect jumps are always relevant, since they unconditionally generate
+        uses.
+
+        :param live_vars: Collection of `Var`.
+        """
+        if self.has_jump:
+            return True
+        return any(may_alias(d, v) for d in self.defs for v in live_vars)
+
+    def relevant_stmts(self, live_vars):
+        """ Compute the indices of statements that contribute to the slice of the given variables.
+
+        Walks the block backward, as the engine does, tracking the set of variables in the slice.
+        A statement is included if it is an indirect jump or defines a variable in the current
+        slice.
+
+        :param live_vars: Collection of `Var` live at the end of the block.
+        :return: A pair (whitelist, live_in), where whitelist is a set of statement indices and
+            live_in is the set of `Var` in the slice at the start of the block.
+        """
+        live = set(live_vars) | self.jump_uses
+        whitelist = set()
+
+        for stmt in reversed(self.stmts):
+            if stmt.is_jump:
+                whitelist.add(stmt.idx)
+                live |= stmt.uses
+            elif stmt.defines_any(live):
+                whitelist.add(stmt.idx)
+                live = set(v for v in live if v not in stmt.defs) | stmt.uses
+
+        return whitelist, live
+
+    def __repr__(self):
+        return '<BlockSummary 0x%x (%d stmts)>' % (self.addr, len(self.stmts))
+
+class DefUseIndex:
+    """ A per-function index of the variables defined and used by each block.
+
+    Built once from the block summaries of a function's nodes, and used by the sparse evaluation
+    mode of `StaticJumpResolutionAnalysis` to skip blocks that neither define any variable in the
+    slice being computed nor contain an indirect jump.
+
+    :param int fn_addr: The address of the indexed function.
+    :param summaries: Mapping from nodes to their `BlockSummary`.
+    """
+    __slots__ = ('fn_addr', '_summaries', '_defs', '_uses', '_jumps', '_reg_size')
+
+    def __init__(self, fn_addr, summaries):
+        self.fn_addr = fn_addr
+        self._summaries = dict(summaries)
+        self._defs = {}
+        self._uses = {}
+        self._jumps = frozenset(n for (n, s) in self._summaries.items() if s.has_jump)
+
+        # The widest indexed register, which bounds the offsets a register lookup must cover
+        self._reg_size = 1
+
+        for (node, summary) in self._summaries.items():
+            for var in summary.defs:
+                self._add(self._defs, var, node)
+            for var in summary.uses:
+                self._add(self._uses, var, node)
+
+    def _add(self, index, var, node):
+        index.setdefault(var_key(var), {}).setdefault(var, set()).add(node)
+        if type(var) is Register:
+            self._reg_size = max(self._reg_size, math.ceil(var.size))
+
+    def summary(self, node):
+        """ Get the `BlockSummary` of a node, or None if the node is not indexed. """
+        return self._summaries.get(node)
+
+    def summaries(self):
+        """ A mapping from each indexed node to its `BlockSummary`. """
+        return dict(self._summaries)
+
+    def _keys(self, var):
+        if type(var) is Register:
+            return [('Register', offset) for offset in \
+                    range(var.offset - self._reg_size + 1, var.offset + math.ceil(var.size))]
+        return [var_key(var)]
+
+    def _lookup(self, index, var):
+        nodes = set()
+        for key in self._keys(var):
+            for (other, other_nodes) in index.get(key, {}).items():
+                if may_alias(var, other):
+                    nodes |= other_nodes
+        return nodes
+
+    def defs_of(self, var):
+        """ The set of nodes in this function that may define the given variable. """
+        return self._lookup(self._defs, var)
+
+    def uses_of(self, var):
+        """ The set of nodes in this function that may use the given variable. """
+        return self._lookup(self._uses, var)
+
+    def jump_nodes(self):
+        """ The set of nodes in this function that contain indirect jumps. """
+        return set(self._jumps)
+
+    def relevant_nodes(self, live_vars):
+        """ The set of nodes in this function that are gen/kill points for any of the given live
+        variables: those that may define one, and those containing indirect jumps.
+
+        :param live_vars: Collection of `Var`.
+        """
+        nodes = set(self._jumps)
+        for var in live_vars:
+            nodes |= self._lookup(self._defs, var)
+        return nodes
+
+    def is_relevant(self, node, live_vars):
+        """ Is the given node a gen/kill point for any of the given live variables?
+
+        Nodes that are not indexed are conservatively considered relevant.
+
+        :param node:
+        :param live_vars: Collection of `Var`.
+        """
+        summary = self._summaries.get(node)
+        if summary is None:
+            return True
+        return summary.is_relevant(live_vars)
+
+    def __len__(self):
+        return len(self._summaries)
+
+    def __repr__(self):
+        return '<DefUseIndex 0x%x (%d blocks)>' % (self.fn_addr, len(self._summaries))
@@ -0,0 +1,597 @@
+from .context import CallString, CtxRecord
+from .live_vars import LiveVars, QualifiedLiveSet
+from .pipeline import Checkpoints
+from .resolve import format_jumps
+from .results import write_results
+from .supergraph import SupergraphVisitor, DummyNode, return_index
+
+from multiprocessing.connection import Listener, Client, wait
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import logging
+
+l = logging.getLogger(__name__)
+
+COORDINATOR = 0
+
+class Transport:
+    """ The message transport between the endpoints of a distributed fixpoint.
+
+    Endpoints are numbered: the coordinator is endpoint 0, and the workers 1 to n. Messages are
+    picklable tuples. Implementations must deliver every message sent, but need not preserve order.
+    """
+
+    def send(self, dest, message):
+        """ Send a message to an endpoint. Must not block on the receiver. """
+        raise NotImplementedError()
+
+    def receive(self, timeout=None):
+        """ Receive the next message for this endpoint.
+
+        :param float timeout: (Optional) Seconds to wait for a message. Waits indefinitely if None.
+        :return: The message, or None on timeout.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+class Broker:
+    """ Routes messages between endpoints connected over Unix or TCP sockets. A stand-in for a
+    message broker, for running a distributed fixpoint on one machine.
+
+    Endpoints connect with `BrokerTransport`. Messages for an endpoint that has not connected yet
+    are held until it does. The broker serves from a background thread until `close()`.
+
+    :param address: (Optional) The address to listen on, e.g. a path for a Unix socket or a
+        (host, port) pair for TCP. Defaults to a free address of `family`.
+    :param str family: (Optional) 'AF_UNIX' or 'AF_INET'. Defaults to the family of `address`.
+    :param bytes authkey: (Optional) The key endpoints authenticate with. Defaults to a random key.
+    """
+
+    def __init__(self, address=None, family=None, authkey=None):
+        self.authkey = authkey if authkey is not None else os.urandom(16)
+        self._listener = Listener(address, family, authkey=self.authkey)
+
+        # Endpoint -> Connection, and endpoint -> queue of messages to it. Each connected endpoint
+        # is written to by a thread of its own, so that a slow reader cannot stall routing.
+        self._conns = {}
+        self._outboxes = {}
+        self._writers = []
+        self._accepted = queue.Queue()
+        self._closed = threading.Event()
+
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._route_thread = threading.Thread(target=self._route, daemon=True)
+        self._accept_thread.start()
+        self._route_thread.start()
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    @property
+    def family(self):
+        return multiprocessing.connection.address_type(self.address)
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                continue
+            self._accepted.put(conn)
+
+    def _outbox(self, endpoint):
+        outbox = self._outboxes.get(endpoint)
+        if outbox is None:
+            outbox = queue.Queue()
+            self._outboxes[endpoint] = outbox
+        return outbox
+
+    @staticmethod
+    def _write(conn, outbox):
+        while True:
+            message = outbox.get()
+            if message is None:
+                break
+            try:
+                conn.send(message)
+            except OSError:
+                break
+
+    def _route(self):
+        unnamed = []
+        while not self._closed.is_set():
+            while not self._accepted.empty():
+                unnamed.append(self._accepted.get())
+
+            conns = list(self._conns.values()) + unnamed
+            for conn in wait(conns, timeout=0.05):
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._drop(conn, unnamed)
+                    continue
+
+                if conn in unnamed:
+                    # The first message of a connection names its endpoint
+                    unnamed.remove(conn)
+                    self._conns[message] = conn
+                    writer = threading.Thread(target=self._write,
+                            args=(conn, self._outbox(message)), daemon=True)
+                    writer.start()
+                    self._writers.append(writer)
+                    continue
+
+                (dest, message) = message
+                self._outbox(dest).put(message)
+
+        for conn in unnamed:
+            conn.close()
+
+    def _drop(self, conn, unnamed):
+        if conn in unnamed:
+            unnamed.remove(conn)
+        for (endpoint, c) in list(self._conns.items()):
+            if c is conn:
+                del self._conns[endpoint]
+                self._outbox(endpoint).put(None)
+
+    def close(self):
+        """ Stop serving, and close all connections. """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._route_thread.join()
+
+        # Unblock the accepting thread
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+        self._accept_thread.join()
+        while not self._accepted.empty():
+            self._accepted.get().close()
+
+        for outbox in self._outboxes.values():
+            outbox.put(None)
+        for writer in self._writers:
+            writer.join()
+        for conn in self._conns.values():
+            conn.close()
+        self._conns.clear()
+
+class BrokerTransport(Transport):
+    """ A `Transport` connected to a `Broker`.
+
+    :param address: The address of the broker.
+    :param int endpoint: The number of this endpoint.
+    :param bytes authkey: The key of the broker.
+    :param str family: (Optional) The address family.
+    """
+
+    def __init__(self, address, endpoint, authkey, family=None):
+        self.endpoint = endpoint
+        self._conn = Client(address, family, authkey=authkey)
+        self._conn.send(endpoint)
+
+    def send(self, dest, message):
+        self._conn.send((dest, message))
+
+    def receive(self, timeout=None):
+        if timeout is not None and not self._conn.poll(timeout):
+            return None
+        return self._conn.recv()
+
+    def close(self):
+        self._conn.close()
+
+def shard_functions(cfg, shards):
+    """ Split the functions of a CFG into shards of about equal numbers of nodes.
+
+    :param cfg: A CFG analysis object.
+    :param int shards: The number of shards.
+    :return: list of lists of function addresses.
+    """
+    rets = return_index(cfg)
+    sizes = sorted(((len(rets.function_nodes(f)), f) for f in rets.functions()),
+            key=lambda p: (-p[0], p[1]))
+    result = [[] for _ in range(shards)]
+    loads = [0] * shards
+    for (size, f) in sizes:
+        i = loads.index(min(loads))
+        result[i].append(f)
+        loads[i] += size
+    return [sorted(s) for s in result]
+
+def node_key(node):
+    """ A picklable key naming a supergraph node across processes: dummy nodes are interned per
+    process, by the identity of their parent, so they are named by the type, function and address
+    of the parent instead. See `NodeIndex`.
+
+    :param (CFGNode or DummyNode) node:
+    :rtype: tuple
+    """
+    if type(node) is DummyNode:
+        return (node.dummy_type, node.fn_addr, node.parent_node.addr)
+    return (None, node.function_address, node.addr)
+
+class NodeIndex:
+    """ Finds the nodes of a CFG's supergraph by their `node_key()`.
+
+    :param cfg: A CFG analysis object.
+    """
+
+    def __init__(self, cfg):
+        self._rets = return_index(cfg)
+        self._nodes = {}
+
+    def node(self, key):
+        """ The node with the given key.
+
+        :param tuple key:
+        :rtype: CFGNode or DummyNode
+        :raises KeyError: If no such node exists.
+        """
+        (dummy_type, fn_addr, addr) = key
+        if dummy_type == 'Dummy_Exit':
+            return self._rets.exit_node(fn_addr)
+
+        nodes = self._nodes.get(fn_addr)
+        if nodes is None:
+            nodes = dict((n.addr, n) for n in self._rets.function_nodes(fn_addr))
+            self._nodes[fn_addr] = nodes
+        node = nodes[addr]
+        return node if dummy_type is None else DummyNode(node, dummy_type)
+
+def encode_state(state):
+    """ Encode a `LiveVars` for sending to another process, naming the call nodes of its contexts
+    by `node_key()`.
+
+    :param LiveVars state:
+    :rtype: tuple
+    """
+    livesets = tuple((tuple((node_key(r.call_node), r.stack_ptr, r.base_ptr) for r in ls.ctx.stack),
+        tuple(ls.uses)) for ls in state.livesets)
+    return (state.fn_addr, state.sp, state.bp, livesets)
+
+def decode_state(data, arch, nodes):
+    """ Decode a state encoded by `encode_state()`.
+
+    :param tuple data:
+    :param arch: The architecture of the project.
+    :param NodeIndex nodes:
+    :rtype: LiveVars
+    """
+    (fn_addr, sp, bp, livesets) = data
+    livesets = [QualifiedLiveSet(CallString(CtxRecord(nodes.node(k), rsp, rbp) \
+            for (k, rsp, rbp) in records), uses) for (records, uses) in livesets]
+    return LiveVars(arch, fn_addr, livesets, sp, bp)
+
+class Shard:
+    """ Runs the fixpoint of `StaticJumpResolutionAnalysis` over the functions of one shard of a
+    program, exchanging boundary states with the other shards.
+
+    The analysis traverses a lazy supergraph restricted to the shard's functions (see the
+    `functions` parameter of `SupergraphVisitor`), so that only their blocks are summarized and
+    given states. A boundary node is a node of the shard with a successor in another shard: a call
+    node's dummy call node, calling the entry of a remote callee, a function's exit node, returning
+    to the dummy return nodes of remote callers, or a block jumping into another function. Whenever
+    the output of a boundary node grows, the uses it gained are sent to the shards owning its
+    remote successors, which add them to their inputs (see `add_boundary_state()`). The first
+    output of a boundary node is sent whole, even if empty, so that its successors are visited.
+
+    The fixpoint is run in slices of `slice_visits` node visits, between which messages are
+    received and boundary states sent. When idle, the shard waits for messages, and answers the
+    termination probes of the coordinator with its message counts, see `DistributedFixpoint`. Once
+    stopped, it resolves the jumps in its functions (unless `resolve` is False in
+    `analysis_options`), and writes the states of its nodes to a
+    results file of its own (see `write_results()`).
+
+    :param project: The angr project.
+    :param cfg: The CFG analysis object.
+    :param list shards: The function addresses of every shard, by endpoint number minus one.
+    :param int endpoint: The endpoint number of this shard.
+    :param Transport transport:
+    :param str workdir: The directory to write the results file to.
+    :param int slice_visits: The number of node visits between exchanges of messages.
+    :param dict analysis_options: (Optional) Passed to `StaticJumpResolutionAnalysis`.
+    """
+
+    def __init__(self, project, cfg, shards, endpoint, transport, workdir, slice_visits=1000,
+            analysis_options=None):
+        self.project = project
+        self.cfg = cfg
+        self.endpoint = endpoint
+        self.transport = transport
+        self.workdir = workdir
+        self.slice_visits = slice_visits
+
+        self._owners = dict((f, i + 1) for (i, fns) in enumerate(shards) for f in fns)
+        self._functions = frozenset(shards[endpoint - 1])
+        self._nodes = NodeIndex(cfg)
+
+        self.visitor = SupergraphVisitor(cfg, lazy=True, functions=self._functions)
+        options = dict(analysis_options or {})
+        self._resolve = options.pop('resolve', True)
+        options.update(analyze=False, resolve=False)
+        self.analysis = project.analyses.StaticJumpResolutionAnalysis(cfg,
+                graph_visitor=self.visitor, **options)
+
+        # Boundary node -> list of (remote successor, owner), for each function seen so far
+        self._boundary = {}
+        self._bounded = set()
+        # Boundary node -> the last output sent
+        self._sent = {}
+
+        self.messages_sent = 0
+        self.messages_received = 0
+
+    @property
+    def busy(self):
+        """ Is there work left to do before the next message? """
+        return self.analysis.budget_exceeded is None and self.visitor.has_next()
+
+    def run(self):
+        """ Serve until stopped by the coordinator, then send it the report of the shard. """
+        while True:
+            message = self.transport.receive(0 if self.busy else None)
+            if message is not None:
+                if not self._handle(message):
+                    break
+            elif self.busy:
+                self.analysis.step(self.slice_visits)
+                self._flush()
+
+        self.transport.send(COORDINATOR, ('result', self.endpoint, self._finish()))
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == 'state':
+            self.messages_received += 1
+            node = self._nodes.node(message[1])
+            state = decode_state(message[2], self.project.arch, self._nodes)
+            self.analysis.add_boundary_state(node, state)
+        elif kind == 'probe':
+            self.transport.send(COORDINATOR, ('ack', message[1], self.endpoint,
+                not self.busy, self.messages_sent, self.messages_received))
+        elif kind == 'stop':
+            return False
+        else:
+            l.warning('Shard %d ignoring unknown message %r', self.endpoint, kind)
+        return True
+
+    def _find_boundary(self):
+        """ Find the boundary nodes of the shard's functions expanded since the last call. """
+        graph = self.visitor.graph
+        rets = return_index(self.cfg)
+
+        while True:
+            new = [f for f in graph.expanded_functions \
+                    if f in self._functions and f not in self._bounded]
+            if len(new) == 0:
+                break
+
+            for f in new:
+                self._bounded.add(f)
+                nodes = list(rets.function_nodes(f))
+                nodes.extend([s for n in nodes for s in graph.materialized.successors(n) \
+                        if type(s) is DummyNode])
+                if rets.exit_node(f) is not None:
+                    # Expands the callers of the function, whose dummy return nodes it returns to
+                    nodes.append(rets.exit_node(f))
+
+                for n in nodes:
+                    remote = [(s, self._owners.get(s.function_address)) \
+                            for s in graph.successors(n) if not self.visitor.traverses(s)]
+                    remote = [(s, owner) for (s, owner) in remote if owner is not None]
+                    if len(remote) > 0:
+                        self._boundary[n] = remote
+
+    def _flush(self):
+        """ Send what the outputs of the boundary nodes gained since they were last sent. """
+        self._find_boundary()
+
+        states = self.analysis.node_states
+        for (node, remote) in self._boundary.items():
+            output = states.get(node)
+            last = self._sent.get(node)
+            if output is None or output is last:
+                continue
+
+            self._sent[node] = output
+            if last is not None:
+                output = output.difference(last)
+                if len(output.livesets) == 0:
+                    continue
+
+            data = encode_state(output)
+            for (succ, owner) in remote:
+                self.messages_sent += 1
+                self.transport.send(owner, ('state', node_key(succ), data))
+
+    def _finish(self):
+        """ Resolve the jumps of the shard, as `StaticJumpResolutionAnalysis` would those of the
+        whole program, and write its results.
+
+        :return: The report of the shard, a dict.
+        """
+        if not self._resolve:
+            pass
+        elif self.analysis.budget_exceeded is None:
+            rets = return_index(self.cfg)
+            self.analysis.resolve_jumps([n for f in sorted(self._functions) \
+                    for n in rets.function_nodes(f)])
+        else:
+            self.analysis.resolve_jumps(self.analysis.visited_nodes)
+
+        path = os.path.join(self.workdir, 'shard-%d.sjr' % self.endpoint)
+        write_results(path, self.analysis.node_states)
+
+        return {
+            'endpoint': self.endpoint,
+            'functions': sorted(self._functions),
+            'results': path,
+            'jumps': format_jumps(self.analysis.jump_resolutions),
+            'iterations': self.analysis.iterations,
+            'budget_exceeded': self.analysis.budget_exceeded,
+        }
+
+class DistributedFixpoint:
+    """ Coordinates the `Shard`s of a distributed fixpoint, detects its termination, and collects
+    their reports.
+
+    Termination is detected with the four-counter method: the coordinator repeatedly probes every
+    shard for whether it is idle and for the numbers of boundary messages it has sent and received.
+    A wave in which all shards are idle and the totals balance may still have been read while a
+    message was in flight, but two consecutive such waves with equal totals can only have been read
+    once no messages were in flight and no shard could become busy again.
+
+    :param int shards: The number of shards.
+    :param Transport transport: The transport of the coordinator endpoint.
+    :param float poll_interval: Seconds between probe waves while the shards are busy.
+    :param float timeout: (Optional) Give up after this many seconds.
+    """
+
+    def __init__(self, shards, transport, poll_interval=0.01, timeout=None):
+        self.shards = shards
+        self.transport = transport
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.waves = 0
+        self.messages = 0
+
+    def _receive(self, deadline):
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError('Distributed fixpoint did not finish in time')
+            message = self.transport.receive(remaining)
+            if message is None:
+                continue
+            if message[0] == 'error':
+                raise RuntimeError('Shard %d failed:\n%s' % message[1:])
+            return message
+
+    def run(self):
+        """ Wait for the fixpoint, then stop the shards.
+
+        :return: The reports of the shards (see `Shard`), ordered by endpoint.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        endpoints = range(1, self.shards + 1)
+        last = None
+
+        while True:
+            self.waves += 1
+            for e in endpoints:
+                self.transport.send(e, ('probe', self.waves))
+
+            acks = {}
+            while len(acks) < self.shards:
+                message = self._receive(deadline)
+                if message[0] == 'ack' and message[1] == self.waves:
+                    acks[message[2]] = message[3:]
+
+            idle = all(a[0] for a in acks.values())
+            counts = (sum(a[1] for a in acks.values()), sum(a[2] for a in acks.values()))
+            counts = counts if idle and counts[0] == counts[1] else None
+            if counts is not None and counts == last:
+                self.messages = counts[0]
+                break
+            last = counts
+            if counts is None:
+                time.sleep(self.poll_interval)
+
+        for e in endpoints:
+            self.transport.send(e, ('stop',))
+
+        reports = {}
+        while len(reports) < self.shards:
+            message = self._receive(deadline)
+            if message[0] == 'result':
+                reports[message[1]] = message[2]
+
+        l.info('Distributed fixpoint over %d shards finished after %d waves, %d messages',
+                self.shards, self.waves, self.messages)
+        return [reports[e] for e in endpoints]
+
+def _shard_main(workdir, address, family, authkey, endpoint, shards, slice_visits,
+        analysis_options):
+    transport = BrokerTransport(address, endpoint, authkey, family)
+    try:
+        artifacts = Checkpoints(workdir).load('cfg')
+        Shard(artifacts['project'], artifacts['cfg'], shards, endpoint, transport, workdir,
+                slice_visits, analysis_options).run()
+    except Exception:
+        transport.send(COORDINATOR, ('error', endpoint, traceback.format_exc()))
+    finally:
+        transport.close()
+
+def solve_distributed(project, cfg, workdir, workers=2, address=None, family=None,
+        start_method=None, poll_interval=0.01, timeout=None, slice_visits=1000,
+        analysis_options=None):
+    """ Run `StaticJumpResolutionAnalysis` as a distributed fixpoint, sharded by function over
+    worker processes connected through a local `Broker`.
+
+    The project and CFG are the only input the shards share: they are checkpointed to `workdir`
+    (see `Checkpoints`), and each worker loads them from there. Everything else, from the supergraph
+    and block summaries to the states of the fixpoint, is built by each shard for its own
+    functions, and the results stay in one results file per shard. Workers on other machines would
+    run `Shard` with a `Transport` of their own, over a shared `workdir`.
+
+    :param project: The angr project.
+    :param cfg: A CFG analysis object for the binary.
+    :param str workdir: The directory for the checkpoint and the results files.
+    :param int workers: The number of shards and worker processes.
+    :param address: (Optional) The address of the broker. See `Broker`.
+    :param str family: (Optional) The address family of the broker.
+    :param str start_method: (Optional) The multiprocessing start method.
+    :param float poll_interval: Seconds between termination probes.
+    :param float timeout: (Optional) Give up after this many seconds.
+    :param int slice_visits: The number of node visits between exchanges of messages.
+    :param dict analysis_options: (Optional) Passed to `StaticJumpResolutionAnalysis`.
+    :return: A dict, with the reports of the shards (see `Shard`) under 'shards', the targets of
+        the jumps of all shards under 'jumps' (see `format_jumps()`), and the numbers of boundary
+        messages and probe waves under 'messages' and 'waves'.
+    """
+    Checkpoints(workdir).save('cfg', {'project': project, 'cfg': cfg})
+    shards = shard_functions(cfg, workers)
+
+    broker = Broker(address, family)
+    transport = BrokerTransport(broker.address, COORDINATOR, broker.authkey, broker.family)
+
+    ctx = multiprocessing.get_context(start_method)
+    procs = [ctx.Process(target=_shard_main, daemon=True, args=(workdir, broker.address,
+        broker.family, broker.authkey, e + 1, shards, slice_visits, analysis_options)) \
+                for e in range(workers)]
+    for p in procs:
+        p.start()
+
+    try:
+        fixpoint = DistributedFixpoint(workers, transport, poll_interval, timeout)
+        reports = fixpoint.run()
+    finally:
+        for p in procs:
+            p.join(1)
+            if p.is_alive():
+                p.terminate()
+        transport.close()
+        broker.close()
+
+    jumps = {}
+    for report in reports:
+        jumps.update(report['jumps'])
+
+    return {
+        'shards': reports,
+        'jumps': dict(sorted(jumps.items(), key=lambda j: int(j[0], 16))),
+        'messages': fixpoint.messages,
+        'waves': fixpoint.waves,
+    }
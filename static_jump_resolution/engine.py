@@ -1,9 +1,13 @@
 from angr.engines.light import SimEngineLight, SimEngineLightVEXMixin
+from angr.analyses.code_location import CodeLocation
 from angr.block import Block
 from angr.errors import SimEngineError
 
 from .context import ExecutionCtx
-from .live_vars import LiveVars, QualifiedLiveSet, vars_modified, vars_used, vars_used_expr
+from .def_use import StmtSummary, BlockSummary
+from .live_vars import LiveVars, QualifiedLiveSet, VarUse, vars_modified, vars_used, \
+        vars_used_expr
+from .transfer import BlockTransfer
 from .vars import Var, Register, StackVar, MemoryLocation, memory_location, get_type_size_bytes
 
 from functools import reduce
@@ -15,43 +19,85 @@ import logging
 
 l = logging.getLogger(__name__)
 
+# For each compound expression type, a function giving its operands and a function rebuilding it
+# from new operands
+_expr_operands = {
+    IRExpr.Qop: (lambda e: e.args, lambda e, args: IRExpr.Qop(e.op, args)),
+    IRExpr.Triop: (lambda e: e.args, lambda e, args: IRExpr.Triop(e.op, args)),
+    IRExpr.Binop: (lambda e: e.args, lambda e, args: IRExpr.Binop(e.op, args)),
+    IRExpr.Unop: (lambda e: e.args, lambda e, args: IRExpr.Unop(e.op, args)),
+    IRExpr.Load: (lambda e: (e.addr,), lambda e, args: IRExpr.Load(e.end, e.ty, args[0])),
+    IRExpr.ITE: (lambda e: (e.cond, e.iffalse, e.iftrue), lambda e, args: IRExpr.ITE(*args)),
+    IRExpr.CCall: (lambda e: e.args, lambda e, args: IRExpr.CCall(e.retty, e.cee, args)),
+}
+
 def replace_tmps(expr, tmps):
-    """ Recursively replace all IR temporaries in the given expression with their values in the
-    given bindings map.
+    """ Replace all IR temporaries in the given expression with their values in the given bindings
+    map, recursively.
+
+    The expression tree is walked without recursion. Subexpressions containing no temporaries are
+    returned as is rather than copied.
 
     :param IRExpr expr:
     :param tmps: A mapping from temp indices (int) to IRExpr values.
     :rtype: IRExpr
     """
-    if type(expr) is IRExpr.RdTmp:
-        val = tmps.get(expr.tmp)
-        if val is None:
-            l.error("[replace_tmps] t%d not bound in the given map" % expr.tmp)
-            return expr
-        else:
-            return replace_tmps(val, tmps)
-
-    elif type(expr) in \
-            (IRExpr.Qop, IRExpr.Triop, IRExpr.Binop, IRExpr.Unop):
-        return type(expr)(expr.op, tuple(replace_tmps(e, tmps) for e in expr.args))
-
-    elif type(expr) is IRExpr.Load:
-        return IRExpr.Load(expr.end, expr.ty, replace_tmps(expr.addr, tmps))
-
-    elif type(expr) is IRExpr.ITE:
-        return IRExpr.ITE(
-                replace_tmps(expr.cond, tmps),
-                replace_tmps(expr.iffalse, tmps),
-                replace_tmps(expr.iftrue, tmps))
-
-    elif type(expr) is IRExpr.CCall:
-        return IRExpr.CCall(expr.retty, expr.cee,
-                tuple(replace_tmps(e, tmps) for e in expr.args))
-
-    else:
-        if type(expr) not in [IRExpr.Get, IRExpr.Const]:
-            l.error("[replace_tmps] unimplemented for IRExpr type %s" % type(expr))
-        return expr
+    results = []
+    # Pairs of an expression and, once its operands have been pushed, its operand functions
+    pending = [(expr, None)]
+
+    while len(pending) > 0:
+        (e, rule) = pending.pop()
+
+        if rule is not None:
+            operands = rule[0](e)
+            args = tuple(results[len(results) - len(operands):])
+            del results[len(results) - len(operands):]
+            if all(a is o for (a, o) in zip(args, operands)):
+                results.append(e)
+            else:
+                results.append(rule[1](e, args))
+            continue
+
+        if type(e) is IRExpr.RdTmp:
+            val = tmps.get(e.tmp)
+            if val is None:
+                l.error("[replace_tmps] t%d not bound in the given map" % e.tmp)
+                results.append(e)
+            else:
+                pending.append((val, None))
+            continue
+
+        rule = _expr_operands.get(type(e))
+        if rule is None:
+            if type(e) not in (IRExpr.Get, IRExpr.Const):
+                l.error("[replace_tmps] unimplemented for IRExpr type %s" % type(e))
+            results.append(e)
+            continue
+
+        pending.append((e, rule))
+        pending.extend((o, None) for o in reversed(rule[0](e)))
+
+    return results[0]
+
+def _replace_put(stmt, tmps):
+    return IRStmt.Put(replace_tmps(stmt.data, tmps), stmt.offset)
+
+def _replace_store(stmt, tmps):
+    return IRStmt.Store(replace_tmps(stmt.addr, tmps), replace_tmps(stmt.data, tmps), stmt.end)
+
+def _replace_exit(stmt, tmps):
+    # Exit destinations are always constants (IRConst), never expressions
+    return IRStmt.Exit(replace_tmps(stmt.guard, tmps), stmt.dst, stmt.jk, stmt.offsIP)
+
+_stmt_replace = {
+    IRStmt.Put: _replace_put,
+    IRStmt.WrTmp: lambda stmt, tmps: IRStmt.NoOp(),
+    IRStmt.Store: _replace_store,
+    IRStmt.Exit: _replace_exit,
+    IRStmt.IMark: lambda stmt, tmps: stmt,
+    IRStmt.AbiHint: lambda stmt, tmps: stmt,
+}
 
 def replace_tmps_stmt(stmt, tmps):
     """ Recursively replace all IR temporaries in the given statement with their values in the given
@@ -61,29 +107,11 @@ def replace_tmps_stmt(stmt, tmps):
     :param tmps: A mapping from temp indices (int) to IRExpr values.
     :rtype: IRStmt
     """
-    if type(stmt) is IRStmt.Put:
-        return IRStmt.Put(replace_tmps(stmt.data, tmps), stmt.offset)
-
-    elif type(stmt) is IRStmt.WrTmp:
-        return IRStmt.NoOp()
-
-    elif type(stmt) is IRStmt.Store:
-        return IRStmt.Store( \
-                replace_tmps(stmt.addr, tmps), \
-                replace_tmps(stmt.data, tmps), \
-                stmt.end)
-
-    elif type(stmt) is IRStmt.Exit:
-        return IRStmt.Exit( \
-                replace_tmps(stmt.guard, tmps), \
-                replace_tmps(stmt.dst, tmps), \
-                stmt.jk, \
-                stmt.offsIP)
-
-    else:
-        if type(stmt) not in [IRStmt.IMark, IRStmt.AbiHint]:
-            l.error("[replace_tmps_stmt] unimplemented for IRStmt type %s" % type(stmt))
+    handler = _stmt_replace.get(type(stmt))
+    if handler is None:
+        l.error("[replace_tmps_stmt] unimplemented for IRStmt type %s" % type(stmt))
         return stmt
+    return handler(stmt, tmps)
 
 def is_indirect_jump(block_or_stmt):
     """ Determine whether the given object encodes an indirect jump, and return its target
@@ -115,7 +143,7 @@ def is_indirect_jump(block_or_stmt):
         if stmt.jumpkind not in ['Ijk_Boring', 'Ijk_Call']:
             return None
 
-        if type(stmt.dst) is not IRExpr.Const:
+        if not isinstance(stmt.dst, pyvex.const.IRConst) and type(stmt.dst) is not IRExpr.Const:
             return stmt.dst
         else:
             return None
@@ -126,21 +154,157 @@ def is_indirect_jump(block_or_stmt):
 class SimEngineSJRVEX(SimEngineLightVEXMixin, SimEngineLight):
     def __init__(self):
         self._block_tmps = {}
+        self._block_stmts = {}
+        self._block_summaries = {}
+        self._block_stmt_index = {}
+        self._block_transfers = {}
+        self._ctx = None
+        super(SimEngineSJRVEX, self).__init__()
+
+    def __getstate__(self):
+        # Keep the block caches, so that a pickled engine need not lift its blocks again
+        return (self._block_tmps, self._block_stmts, self._block_summaries)
+
+    def __setstate__(self, state):
+        (self._block_tmps, self._block_stmts, self._block_summaries) = state
+        self._block_stmt_index = {}
+        self._block_transfers = {}
+        self._ctx = None
         super(SimEngineSJRVEX, self).__init__()
 
     def _trace(self, name):
         self.l.debug('%s, self.state=%s' % (name, self.state))
 
     def process(self, state, *args, **kwargs):
+        """
+        :param LiveVars state:
+        :param angr.block.Block block:
+        :param whitelist: (Optional) Container/iterable of statement indices (int) to process.
+        :param ExecutionCtx ctx: (Optional) The execution context of the block, e.g. from
+            `StackDeltas`. Defaults to that of the state.
+        """
+        self._ctx = kwargs.pop('ctx', None)
         try:
-            self._process(state, None, block=kwargs.pop('block', None))
+            self._process(state, None, block=kwargs.pop('block', None),
+                    whitelist=kwargs.pop('whitelist', None))
         except SimEngineError as e:
             if kwargs.pop('fail_fast', False):
                 raise e
             self.l.error(e)
+        finally:
+            self._ctx = None
 
         return self.state
 
+    def substituted_stmts(self, block):
+        """ Get the statements of a block with all IR temporaries substituted by their values.
+
+        `WrTmp` and `IMark` statements are omitted. Reads of the stack and base pointers after the
+        block has written them are replaced by the values written, so that in the substituted
+        statements, both registers are only ever read as of block entry (see `StackDeltas`).
+        Results are cached per block address.
+
+        :param angr.block.Block block:
+        :return: A pair (stmts, next), where stmts is a tuple of (statement index, IRStmt) pairs in
+            statement order, and next is the substituted expression for the block's successor.
+        """
+        cached = self._block_stmts.get(block.addr)
+        if cached is not None:
+            return cached
+
+        arch = block.arch
+        frame_regs = (arch.sp_offset, arch.bp_offset)
+        word = 'Ity_I%d' % arch.bits
+
+        tmps = {}
+        frame = {}
+        stmts = []
+        for (idx, stmt) in enumerate(block.vex.statements):
+            if type(stmt) is IRStmt.WrTmp:
+                data = stmt.data
+                if type(data) is IRExpr.Get and data.offset in frame and data.ty == word:
+                    tmps[stmt.tmp] = frame[data.offset]
+                else:
+                    tmps[stmt.tmp] = replace_tmps(data, tmps)
+            elif type(stmt) is not IRStmt.IMark:
+                stmt = replace_tmps_stmt(stmt, tmps)
+                if type(stmt) is IRStmt.Put and stmt.offset in frame_regs:
+                    frame[stmt.offset] = stmt.data
+                stmts.append((idx, stmt))
+
+        cached = (tuple(stmts), replace_tmps(block.vex.next, tmps))
+        self._block_stmts[block.addr] = cached
+        self._block_tmps.setdefault(block.addr, tmps)
+        return cached
+
+    def forget_blocks(self, addrs):
+        """ Drop the cached statements and summaries of the blocks at the given addresses, e.g.
+        after a CFG recovery splits or extends them.
+
+        :param addrs: Iterable of int.
+        """
+        addrs = set(addrs)
+        for cache in (self._block_tmps, self._block_stmts, self._block_stmt_index):
+            for addr in addrs:
+                cache.pop(addr, None)
+        for cache in (self._block_summaries, self._block_transfers):
+            for key in [k for k in cache if k[0] in addrs]:
+                del cache[key]
+
+    def summarize(self, block, ctx, arch=None):
+        """ Compute the def/use summary of a block in the given execution context.
+
+        Summaries are cached per block address and execution context.
+
+        :param angr.block.Block block:
+        :param ExecutionCtx ctx:
+        :param Arch arch: The guest architecture. Defaults to the architecture of the block.
+        :rtype: BlockSummary
+        """
+        if arch is None:
+            arch = block.arch
+
+        key = (block.addr, ctx.fn_addr, ctx.sp, ctx.bp)
+        summary = self._block_summaries.get(key)
+        if summary is not None:
+            return summary
+
+        (substituted, next_expr) = self.substituted_stmts(block)
+        stmts = [StmtSummary(idx,
+                    vars_modified(stmt, ctx, arch),
+                    vars_used(stmt, ctx, arch),
+                    is_indirect_jump(stmt) is not None)
+                for (idx, stmt) in substituted]
+
+        if is_indirect_jump(block) is not None:
+            jump_uses = vars_used_expr(next_expr, ctx, arch)
+        else:
+            jump_uses = None
+
+        summary = BlockSummary(block.addr, stmts, jump_uses)
+        self._block_summaries[key] = summary
+        return summary
+
+    def transfer(self, block, ctx, arch=None):
+        """ Get the transfer function of a block in the given execution context, compiled from its
+        summary. Applying it has the same effect as `process()`, without walking the statements.
+
+        Transfer functions are cached as summaries are.
+
+        :param angr.block.Block block:
+        :param ExecutionCtx ctx:
+        :param Arch arch: The guest architecture. Defaults to the architecture of the block.
+        :rtype: BlockTransfer
+        """
+        key = (block.addr, ctx.fn_addr, ctx.sp, ctx.bp)
+        transfer = self._block_transfers.get(key)
+        if transfer is None:
+            summary = self.summarize(block, ctx, arch)
+            jump_ins_addr = block.instruction_addrs[-1] if len(summary.jump_uses) > 0 else None
+            transfer = BlockTransfer(summary, jump_ins_addr)
+            self._block_transfers[key] = transfer
+        return transfer
+
     def _process(self, new_state, successors, block=None, whitelist=None):
         """
         :param LiveVars new_state:
@@ -164,8 +328,11 @@ class SimEngineSJRVEX(SimEngineLightVEXMixin, SimEngineLight):
 
         # Unconditionally generate liveness for IJ targets
         if is_indirect_jump(self.block):
-            target_vars = vars_used_expr(self.block.vex.next)
-            self.state.gen_uses(*target_vars)
+            ctx = self._ctx if self._ctx is not None else self.state.execution_ctx
+            target_vars = vars_used_expr(self.substituted_stmts(self.block)[1], ctx,
+                    self.state.arch)
+            codeloc = CodeLocation(self.block.addr, None, ins_addr=self.block.instruction_addrs[-1])
+            self.state.gen_uses([VarUse(v, codeloc) for v in target_vars])
 
         for (idx, stmt) in reversed(list(enumerate(self.block.vex.statements))):
             if whitelist is not None and idx not in whitelist:
@@ -187,29 +354,37 @@ class SimEngineSJRVEX(SimEngineLightVEXMixin, SimEngineLight):
         if self.block.addr in self._block_tmps:
             return
 
-        tmps = {}
-
-        for stmt in self.block.vex.statements:
-            if type(stmt) is IRStmt.WrTmp:
-                tmps[stmt.tmp] = replace_tmps(stmt.data, tmps)
-
-        self._block_tmps[self.block.addr] = tmps
+        self.substituted_stmts(self.block)
 
     @property
     def _tmps(self):
         return self._block_tmps[self.block.addr]
 
+    def _substituted_stmt(self, idx):
+        """ The cached, tmp-substituted statement at an index of the current block, or None. """
+        index = self._block_stmt_index.get(self.block.addr)
+        if index is None:
+            index = dict(self.substituted_stmts(self.block)[0])
+            self._block_stmt_index[self.block.addr] = index
+        return index.get(idx)
+
     def _handle_Stmt(self, stmt):
         """ Process a single statement's effects on the current state.
 
+        The substituted statement is taken from the block's cache, so that the results of
+        `vars_used()` are reused across visits.
+
         :param IRStmt stmt:
         """
-        stmt = replace_tmps_stmt(stmt, self._tmps)
-        used = vars_used(stmt, self.state.execution_ctx, self.state.arch)
-        modified = vars_modified(stmt, self.state.execution_ctx, self.state.arch)
-        self.state.kill_vars(modified)
+        substituted = self._substituted_stmt(self.stmt_idx)
+        stmt = substituted if substituted is not None else replace_tmps_stmt(stmt, self._tmps)
+        ctx = self._ctx if self._ctx is not None else self.state.execution_ctx
+        codeloc = CodeLocation(self.block.addr, self.stmt_idx)
+        used = [VarUse(v, codeloc) for v in vars_used(stmt, ctx, self.state.arch)]
+        modified = vars_modified(stmt, ctx, self.state.arch)
 
         if is_indirect_jump(stmt):
+            self.state.kill_vars(modified)
             self.state.gen_uses(used)
         else:
-            self.state.gen_uses_if_live(used, modified)
+            self.state.gen_uses_if_killed(used, modified)
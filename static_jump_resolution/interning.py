@@ -0,0 +1,68 @@
+import weakref
+
+class Interned:
+    """ Base class for immutable value types with one canonical instance per value.
+
+    Constructing an instance returns the existing instance with the same constructor arguments, if
+    there is one. Since equal values are then the same object, equality is identity, and the hash
+    of each instance is computed once, on construction. Instances are held weakly, so values no
+    longer referenced elsewhere are dropped from the table.
+
+    Subclasses initialize their slots in `_init()`, given the constructor arguments (which must be
+    hashable, and passed positionally), and return those arguments from `_args()`. They may
+    override `_compute_hash()` to hash only part of their value, along with `__eq__`, and `_key()`
+    to look instances up by something other than the arguments' equality.
+    """
+
+    __slots__ = ('_hash', '__weakref__')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._instances = weakref.WeakValueDictionary()
+
+    def __new__(cls, *args):
+        key = cls._key(*args)
+        self = cls._instances.get(key)
+        if self is None or not self._is_value(*args):
+            self = object.__new__(cls)
+            self._init(*args)
+            self._hash = self._compute_hash()
+            cls._instances[key] = self
+        return self
+
+    @classmethod
+    def _key(cls, *args):
+        """ The key of the instance with the given constructor arguments in the table. """
+        return args
+
+    def _is_value(self, *args):
+        """ Is this the instance with the given constructor arguments? Only needs checking when
+        `_key()` is overridden. """
+        return True
+
+    def _init(self, *args):
+        raise NotImplementedError()
+
+    def _args(self):
+        raise NotImplementedError()
+
+    def _compute_hash(self):
+        return hash((type(self).__name__,) + self._args())
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # Unpickling goes through the constructor, and so through the table
+        return (type(self), self._args())
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @classmethod
+    def interned_count(cls):
+        """ The number of live canonical instances of this class. """
+        return len(cls._instances)
@@ -0,0 +1,342 @@
+from .vars import get_type_size_bytes
+
+from pyvex import IRExpr, IRStmt
+from pyvex.const import IRConst
+
+import numpy as np
+import mmap
+import re
+import logging
+
+l = logging.getLogger(__name__)
+
+_ext_op = re.compile(r'^Iop_(8|16|32|64)(U|S)to(8|16|32|64)$')
+_cmp_op = re.compile(r'^Iop_Cmp(LT|LE)(8|16|32|64)U$')
+_bool_op = re.compile(r'^Iop_(1Uto(8|16|32|64)|(8|16|32|64)to1)$')
+
+class JumpTable:
+    """ A recognized jump table access, of the form `[rel_base +] ext(Load(base + index * scale))`.
+
+    :param int base: The address of the table.
+    :param IRExpr index: The index expression.
+    :param int scale: The byte distance between consecutive entries.
+    :param int entry_size: The size of each entry in bytes.
+    :param bool signed: Whether entries are sign-extended when loaded.
+    :param str end: The endianness of entries ('Iend_LE' or 'Iend_BE').
+    :param int rel_base: (Optional) A base address added to each entry, for tables of relative
+        offsets.
+    """
+    __slots__ = ('base', 'index', 'scale', 'entry_size', 'signed', 'end', 'rel_base')
+
+    def __init__(self, base, index, scale, entry_size, signed=False, end='Iend_LE', rel_base=None):
+        self.base = base
+        self.index = index
+        self.scale = scale
+        self.entry_size = entry_size
+        self.signed = signed
+        self.end = end
+        self.rel_base = rel_base
+
+    def __repr__(self):
+        return '<JumpTable 0x%x [%s * %d] (%d bytes%s)>' % (self.base, self.index, self.scale,
+                self.entry_size, ', relative to 0x%x' % self.rel_base if self.rel_base else '')
+
+def _split_const(expr):
+    """ If `expr` is `Add(Const, e)` or `Add(e, Const)`, return (const value, e). """
+    if type(expr) is not IRExpr.Binop or not expr.op.startswith('Iop_Add'):
+        return None, expr
+
+    (a, b) = expr.args
+    if type(a) is IRExpr.Const:
+        return a.con.value, b
+    elif type(b) is IRExpr.Const:
+        return b.con.value, a
+    else:
+        return None, expr
+
+def _split_scale(expr):
+    """ Split an index term into (index expression, scale). """
+    if type(expr) is IRExpr.Binop:
+        (a, b) = expr.args
+        if expr.op.startswith('Iop_Shl') and type(b) is IRExpr.Const:
+            return a, 1 << b.con.value
+        elif expr.op.startswith('Iop_Mul'):
+            if type(b) is IRExpr.Const:
+                return a, b.con.value
+            elif type(a) is IRExpr.Const:
+                return b, a.con.value
+
+    return expr, 1
+
+def match_jump_table(expr):
+    """ Recognize a jump table access in a tmp-substituted jump target expression.
+
+    :param IRExpr expr: A tmp-substituted expression, as produced by `replace_tmps()`.
+    :rtype: JumpTable or None
+    """
+    (rel_base, load) = _split_const(expr)
+
+    signed = False
+    if type(load) is IRExpr.Unop:
+        m = _ext_op.match(load.op)
+        if m is None:
+            return None
+        signed = m.group(2) == 'S'
+        load = load.args[0]
+
+    if type(load) is not IRExpr.Load:
+        return None
+
+    (base, term) = _split_const(load.addr)
+    if base is None:
+        return None
+
+    (index, scale) = _split_scale(term)
+    return JumpTable(base, index, scale, int(get_type_size_bytes(load.ty)), signed, load.end,
+            rel_base)
+
+def _strip(expr):
+    """ Strip width conversions from an expression, to compare index expressions across blocks. """
+    while type(expr) is IRExpr.Unop and (_ext_op.match(expr.op) or expr.op.startswith('Iop_64to')):
+        expr = expr.args[0]
+    return expr
+
+def same_index(expr1, expr2):
+    """ Heuristically determine whether two expressions denote the same table index.
+
+    Both expressions are compared after stripping width conversions. Register reads compare equal
+    if they read the same register.
+
+    :param IRExpr expr1:
+    :param IRExpr expr2:
+    """
+    (expr1, expr2) = (_strip(expr1), _strip(expr2))
+
+    if type(expr1) is not type(expr2):
+        return False
+    elif type(expr1) is IRExpr.Get:
+        return expr1.offset == expr2.offset
+    elif type(expr1) is IRExpr.Load:
+        return same_index(expr1.addr, expr2.addr)
+    elif type(expr1) is IRExpr.Const:
+        return expr1.con.value == expr2.con.value
+    elif type(expr1) in (IRExpr.Unop, IRExpr.Binop):
+        return expr1.op == expr2.op and \
+                all(same_index(a, b) for (a, b) in zip(expr1.args, expr2.args))
+    else:
+        return False
+
+def guard_bound(guard, index, taken):
+    """ Derive an inclusive unsigned upper bound on `index` from an `Exit` guard.
+
+    :param IRExpr guard: The (tmp-substituted) guard of an `Exit` statement.
+    :param IRExpr index: The index expression to bound.
+    :param bool taken: Whether the path of interest takes the exit (guard true) or falls through
+        (guard false).
+    :rtype: int or None
+    """
+    while type(guard) is IRExpr.Unop and _bool_op.match(guard.op):
+        guard = guard.args[0]
+
+    if type(guard) is not IRExpr.Binop:
+        return None
+
+    m = _cmp_op.match(guard.op)
+    if m is None:
+        return None
+
+    strict = m.group(1) == 'LT'
+    (a, b) = (_strip(arg) for arg in guard.args)
+
+    if taken and type(b) is IRExpr.Const and same_index(a, index):
+        # index < c or index <= c
+        return b.con.value - 1 if strict else b.con.value
+    elif not taken and type(a) is IRExpr.Const and same_index(b, index):
+        # not (c < index) or not (c <= index)
+        return a.con.value if strict else a.con.value - 1
+    else:
+        return None
+
+def index_bound(engine, graph, node, index):
+    """ Bound a jump table index using the guarding `Exit` statements of a node's predecessors.
+
+    Every intraprocedural path into `node` must pass through a guard bounding the index;
+    otherwise the index is considered unbounded.
+
+    :param SimEngineSJRVEX engine: Used for its cached tmp-substituted block statements.
+    :param networkx.DiGraph graph: The supergraph.
+    :param node: The node ending in the jump.
+    :param IRExpr index: The index expression.
+    :rtype: int or None
+    """
+    bound = None
+    preds = list(graph.predecessors(node))
+    if len(preds) == 0:
+        return None
+
+    for pred in preds:
+        if getattr(pred, 'block', None) is None:
+            return None
+
+        (stmts, _) = engine.substituted_stmts(pred.block)
+        pred_bound = None
+
+        for (_, stmt) in reversed(stmts):
+            if type(stmt) is not IRStmt.Exit or not isinstance(stmt.dst, IRConst):
+                continue
+
+            taken = stmt.dst.value == node.addr
+            pred_bound = guard_bound(stmt.guard, index, taken)
+            if pred_bound is not None:
+                break
+
+        if pred_bound is None:
+            return None
+
+        bound = pred_bound if bound is None else max(bound, pred_bound)
+
+    return bound
+
+class ReadOnlyMemory:
+    """ Bulk reads of read-only data, straight from memory-mapped views of the loaded files.
+
+    Each object's backing file is mapped once, on first access, and whole tables are decoded from
+    the mapping with NumPy rather than read entry by entry. Data that is not backed by a file, or
+    that the loader has relocated, is read in one piece from the loader's memory instead.
+
+    :param loader: The CLE loader of the project.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._maps = {}
+        self._relocs = {}
+
+    def _map(self, obj):
+        if obj in self._maps:
+            return self._maps[obj]
+
+        mapped = None
+        if type(obj.binary) is str:
+            try:
+                with open(obj.binary, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                l.warning('Could not map %s: %s', obj.binary, e)
+
+        self._maps[obj] = mapped
+        return mapped
+
+    def _is_relocated(self, obj, start, end):
+        relocs = self._relocs.get(obj)
+        if relocs is None:
+            relocs = np.array(sorted(r.rebased_addr for r in obj.relocs), dtype=np.uint64)
+            self._relocs[obj] = relocs
+
+        i = np.searchsorted(relocs, np.uint64(start), side='left')
+        return i < len(relocs) and relocs[i] < end
+
+    def read_array(self, addr, entry_size, count, signed=False, end='Iend_LE'):
+        """ Read `count` consecutive integers of `entry_size` bytes starting at `addr`.
+
+        :return: A NumPy array of int64 (if signed) or uint64, or None if the range is not wholly
+            contained in a single read-only region.
+        """
+        if entry_size not in (1, 2, 4, 8) or count <= 0:
+            return None
+
+        size = entry_size * count
+        obj = self._loader.find_object_containing(addr)
+        if obj is None:
+            return None
+
+        region = obj.find_section_containing(addr)
+        if region is None:
+            region = obj.find_segment_containing(addr)
+        if region is None or region.is_writable or not region.contains_addr(addr + size - 1):
+            return None
+
+        dtype = np.dtype('%s%s%d' % ('<' if end == 'Iend_LE' else '>', 'i' if signed else 'u',
+            entry_size))
+
+        mapped = self._map(obj)
+        offset = obj.addr_to_offset(addr)
+        if mapped is not None and offset is not None and offset + size <= len(mapped) \
+                and not self._is_relocated(obj, addr, addr + size):
+            data = np.frombuffer(mapped, dtype=dtype, count=count, offset=offset)
+        else:
+            try:
+                data = np.frombuffer(self._loader.memory.load(addr, size), dtype=dtype)
+            except KeyError:
+                return None
+            if len(data) != count:
+                return None
+
+        return data.astype(np.int64 if signed else np.uint64)
+
+    def close(self):
+        """ Release all memory mappings. """
+        for mapped in self._maps.values():
+            if mapped is not None:
+                mapped.close()
+        self._maps.clear()
+
+class JumpTableResolver:
+    """ Resolves indirect jumps through jump tables.
+
+    :param project: The angr project.
+    :param SimEngineSJRVEX engine: Used for its cached tmp-substituted block statements.
+    :param networkx.DiGraph graph: The supergraph.
+    :param int max_entries: The largest table to read.
+    :param ReadOnlyMemory memory: (Optional) The read-only memory to read tables from, e.g. one
+        shared between resolvers. By default, a new one is created.
+    """
+
+    def __init__(self, project, engine, graph, max_entries=4096, memory=None):
+        self._project = project
+        self._engine = engine
+        self._graph = graph
+        self.max_entries = max_entries
+        self.memory = memory if memory is not None else ReadOnlyMemory(project.loader)
+
+    def resolve(self, node, expr):
+        """ Try to resolve a jump target expression as a jump table access.
+
+        :param node: The node ending in the jump.
+        :param IRExpr expr: The tmp-substituted target expression.
+        :return: A set of int targets, or None if `expr` is not a recognized, bounded jump table.
+        """
+        table = match_jump_table(expr)
+        if table is None:
+            return None
+
+        bound = index_bound(self._engine, self._graph, node, table.index)
+        if bound is None or bound < 0 or bound >= self.max_entries:
+            l.debug('Unbounded jump table index at 0x%x: %s', node.addr, table)
+            return None
+
+        # Entries that overlap or are not aligned to each other are not a table we can read as
+        # an array
+        if table.scale % table.entry_size != 0:
+            l.debug('Jump table scale %d is not a multiple of entry size %d at 0x%x', table.scale,
+                    table.entry_size, node.addr)
+            return None
+
+        stride = table.scale // table.entry_size
+        count = bound * stride + 1
+        entries = self.memory.read_array(table.base, table.entry_size, count,
+                table.signed, table.end)
+        if entries is None:
+            return None
+
+        if stride != 1:
+            entries = entries[::stride]
+
+        bits = self._project.arch.bits
+        if table.rel_base is not None:
+            entries = entries.astype(np.int64) + np.int64(table.rel_base)
+        targets = set(int(t) & ((1 << bits) - 1) for t in np.unique(entries))
+
+        l.debug('Jump table at 0x%x for 0x%x: %d entries, %d targets', table.base, node.addr,
+                bound + 1, len(targets))
+        return targets
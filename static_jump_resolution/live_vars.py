@@ -1,9 +1,12 @@
 from angr.analyses.code_location import CodeLocation
 
 from .context import CtxRecord, CallString, ExecutionCtx
-from .vars import Var, Register, StackVar, MemoryLocation, memory_location, get_type_size_bytes
+from .interning import Interned
+from .vars import Var, Register, StackVar, MemoryLocation, MEMORY_SUMMARY, memory_location, \
+        get_type_size_bytes
 
 import operator
+import itertools
 from functools import reduce
 
 import pyvex
@@ -12,23 +15,20 @@ import logging
 
 l = logging.getLogger(__name__)
 
-class VarUse:
-    """ A use of a variable at a particular program point.
+class VarUse(Interned):
+    """ A use of a variable at a particular program point. Interned (see `Interned`).
 
     :param Var var:
     :param CodeLocation codeloc:
     """
     __slots__ = ('var', 'codeloc')
 
-    def __init__(self, var, codeloc):
+    def _init(self, var, codeloc):
         self.var = var
         self.codeloc = codeloc
 
-    def __eq__(self, other):
-        return self.var == other.var and self.codeloc == other.codeloc
-
-    def __hash__(self):
-        return hash(('VarUse', self.var, self.codeloc))
+    def _args(self):
+        return (self.var, self.codeloc)
 
     def __repr__(self):
         return '<Use of %s at %s>' % (self.var, self.codeloc)
@@ -79,7 +79,7 @@ class QualifiedLiveSet:
         return self.uses == other.uses and self.ctx == other.ctx
 
     def __hash__(self):
-        return hash(("QualifiedLiveSet", *sorted(list(self.uses)), self.ctx))
+        return hash(("QualifiedLiveSet", frozenset(self.uses), self.ctx))
 
     def __repr__(self):
         if len(self.ctx) > 4:
@@ -119,7 +119,7 @@ class LiveVars:
         if livesets is None:
             self._livesets = { QualifiedLiveSet(CallString()) }
         else:
-            self._livesets = set(uses)
+            self._livesets = set(livesets)
 
     @property
     def livesets(self):
@@ -140,6 +140,13 @@ class LiveVars:
         """
         return set(u for unqualed in self.unqualified_uses() for u in unqualed if u.var == var)
 
+    def live_vars(self):
+        """ Get the set of variables that have at least one live use in any context.
+
+        :rtype: set of `Var`
+        """
+        return set(u.var for ls in self._livesets for u in ls.uses)
+
     def representative(self, liveset):
         """ Get the representative of the given QualifiedLiveSet in this LiveVars.
 
@@ -212,17 +219,111 @@ class LiveVars:
 
         self._livesets = new_livesets
 
+    def gen_uses_if_killed(self, uses, vars):
+        """ In each live set that holds a use of at least one of `vars`, replace the uses of `vars`
+        by `uses`. Other live sets are left as they are.
+
+        A use of `MEMORY_SUMMARY` counts as a use of every `MemoryLocation`, but is not replaced.
+
+        :param uses: Iterable of `VarUse`
+        :param vars: Collection of `Var`
+        """
+        uses = set(uses)
+        defined = set(vars)
+        if any(type(v) is MemoryLocation for v in defined):
+            defined.add(MEMORY_SUMMARY)
+        new_livesets = set()
+
+        for liveset in self.livesets:
+            if any(u.var in defined for u in liveset.uses):
+                liveset.kill_vars(vars)
+                liveset.gen_uses(uses)
+            new_livesets.add(liveset)
+
+        self._livesets = new_livesets
+
     @property
     def execution_ctx(self):
         """ Wrap this `LiveVars`s function address and stack frame pointers in an ExecutionCtx. """
         return ExecutionCtx(self.fn_addr, self.sp, self.bp)
 
+    def __eq__(self, other):
+        return type(other) is LiveVars and self._livesets == other._livesets
+
+    def __or__(self, other):
+        """ Merge two LiveVars, taking the union of the live sets qualified by each context. """
+        by_ctx = {}
+        for liveset in itertools.chain(self._livesets, other._livesets):
+            merged = by_ctx.get(liveset.ctx)
+            if merged is None:
+                by_ctx[liveset.ctx] = liveset.copy()
+            else:
+                merged.gen_uses(liveset.uses)
+
+        return LiveVars(self.arch, self.fn_addr, by_ctx.values(), self.sp, self.bp)
+
     def __repr__(self):
         return 'LiveVars(%s)' % self._livesets
 
+    def difference(self, other):
+        """ Get a LiveVars holding what this LiveVars adds to another: for each context, the uses
+        not live in that context in `other`. Live sets whose context is not in `other` are kept
+        whole, even if empty; others are dropped once nothing is left of them.
+
+        :param LiveVars other:
+        :rtype: LiveVars
+        """
+        by_ctx = dict((ls.ctx, ls.uses) for ls in other._livesets)
+        livesets = []
+        for liveset in self._livesets:
+            uses = by_ctx.get(liveset.ctx)
+            if uses is None:
+                livesets.append(liveset.copy())
+            elif not liveset.uses <= uses:
+                livesets.append(QualifiedLiveSet(liveset.ctx.copy(), liveset.uses - uses))
+
+        return LiveVars(self.arch, self.fn_addr, livesets, self.sp, self.bp)
+
+    def collapsed(self):
+        """ Get a LiveVars with the uses of all live sets merged into one, qualified by the empty
+        call string, and with every `MemoryLocation` replaced by `MEMORY_SUMMARY`.
+
+        The result over-approximates this LiveVars in every context. Used to widen the states of
+        nodes whose contexts or memory locations keep growing.
+        """
+        uses = set(VarUse(MEMORY_SUMMARY, u.codeloc) if type(u.var) is MemoryLocation else u \
+                for u in self.unqualified_uses())
+        liveset = QualifiedLiveSet(CallString(), uses)
+        return LiveVars(self.arch, self.fn_addr, [liveset], self.sp, self.bp)
+
     def copy(self):
-        """ Get a shallow copy of this LiveVars. """
-        return LiveVars(self.arch, self.fn_addr, self._livesets, self.sp, self.bp)
+        """ Get a copy of this LiveVars. The contained live sets are copied, so that the copy may
+        be modified without affecting the original. """
+        return LiveVars(self.arch, self.fn_addr, (ls.copy() for ls in self._livesets),
+                self.sp, self.bp)
+
+def _modified_put(stmt, ctx, arch):
+    if arch is None or stmt.offset not in (arch.sp_offset, arch.bp_offset, arch.ip_offset):
+        return { Register(stmt.offset, get_type_size_bytes(stmt.data.result_type(None))) }
+    else:
+        return set()
+
+def _modified_store(stmt, ctx, arch):
+    ty = stmt.data.result_type(None)
+    return { memory_location(stmt.addr, ctx, arch, ty) }
+
+def _modified_none(stmt, ctx, arch):
+    return set()
+
+_stmt_modified = {
+    IRStmt.Put: _modified_put,
+    IRStmt.Store: _modified_store,
+    IRStmt.NoOp: _modified_none,
+    IRStmt.AbiHint: _modified_none,
+    IRStmt.IMark: _modified_none,
+    # Only writes the instruction pointer, if taken
+    IRStmt.Exit: _modified_none,
+}
 
 def vars_modified(stmt, ctx, arch=None):
     """ Get the set of variables modified by the given statement.
@@ -232,69 +333,112 @@ def vars_modified(stmt, ctx, arch=None):
     :param Arch arch: The guest architecture. If provided, used to create more accurate results.
     :rtype: Iterable of Var
     """
-    if type(stmt) is IRStmt.Put:
-        if arch is None or stmt.offset not in (arch.sp_offset, arch.bp_offset, arch.ip_offset):
-            return { Register(stmt.offset, get_type_size_bytes(stmt.data.result_type(None))) }
-        else:
-            return set()
-
-    elif type(stmt) is IRStmt.Store:
-        ty = stmt.data.result_type(None)
-        return { memory_location(stmt.addr, ctx, arch, ty) }
-
-    else:
-        if type(stmt) not in [IRStmt.NoOp, IRStmt.AbiHint, IRStmt.IMark]:
-            l.error("[vars_modified] Unimplemented for statement type %s" % type(stmt))
+    handler = _stmt_modified.get(type(stmt))
+    if handler is None:
+        l.error("[vars_modified] Unimplemented for statement type %s" % type(stmt))
         return set()
+    return handler(stmt, ctx, arch)
+
+def _used_get(expr, ctx, arch, used, pending):
+    if arch is None or expr.offset not in (arch.sp_offset, arch.bp_offset):
+        used.add(Register(expr.offset, get_type_size_bytes(expr.ty)))
+
+def _used_load(expr, ctx, arch, used, pending):
+    used.add(memory_location(expr.addr, ctx, arch, expr.ty))
+    pending.append(expr.addr)
+
+def _used_args(expr, ctx, arch, used, pending):
+    pending.extend(expr.args)
+
+def _used_ite(expr, ctx, arch, used, pending):
+    pending.extend((expr.cond, expr.iffalse, expr.iftrue))
+
+def _used_none(expr, ctx, arch, used, pending):
+    pass
+
+_expr_used = {
+    IRExpr.Get: _used_get,
+    IRExpr.Load: _used_load,
+    IRExpr.Unop: _used_args,
+    IRExpr.Binop: _used_args,
+    IRExpr.Triop: _used_args,
+    IRExpr.Qop: _used_args,
+    IRExpr.CCall: _used_args,
+    IRExpr.ITE: _used_ite,
+    IRExpr.Const: _used_none,
+}
+
+# The expressions whose operands are read by each statement type. Exit destinations are always
+# constants.
+_stmt_operands = {
+    IRStmt.Put: lambda s: (s.data,),
+    IRStmt.Store: lambda s: (s.addr, s.data),
+    IRStmt.Exit: lambda s: (s.guard,),
+    IRStmt.NoOp: lambda s: (),
+    IRStmt.AbiHint: lambda s: (),
+    IRStmt.IMark: lambda s: (),
+}
+
+def _collect_used(exprs, ctx, arch):
+    """ Walk expression trees without recursion, collecting the variables they use. """
+    used = set()
+    pending = list(exprs)
+    while len(pending) > 0:
+        expr = pending.pop()
+        handler = _expr_used.get(type(expr))
+        if handler is None:
+            l.error("[vars_used_expr] unimplemented for expression type %s" % type(expr))
+        else:
+            handler(expr, ctx, arch, used, pending)
+    return frozenset(used)
+
+# Results of `vars_used_expr()` and `vars_used()`, keyed by the identity of the expression or
+# statement and by the execution context. Each entry keeps its expression alive, so that its id is
+# not reused while cached.
+_used_memo = {}
+_used_memo_limit = 1 << 16
+
+def _memoized_used(obj, ctx, arch, compute):
+    key = (id(obj), ctx.fn_addr, ctx.sp, ctx.bp, None if arch is None else arch.name)
+    entry = _used_memo.get(key)
+    if entry is not None and entry[0] is obj:
+        return entry[1]
+
+    used = compute()
+    if len(_used_memo) >= _used_memo_limit:
+        _used_memo.clear()
+    _used_memo[key] = (obj, used)
+    return used
+
+def clear_vars_used_cache():
+    """ Empty the cache of `vars_used_expr()` and `vars_used()` results. """
+    _used_memo.clear()
 
 def vars_used_expr(expr, ctx, arch=None):
     """ Get the set of variables whose values are used in the given expression.
 
+    Results are cached per expression object and execution context, so expressions that are reused,
+    e.g. the cached statements of `SimEngineSJRVEX.substituted_stmts()`, are only walked once.
+
     :param IRExpr stmt:
     :param ExecutionCtx ctx:
     :param Arch arch: The guest architecture. If provided, used to create more accurate results.
-    :rtype: Iterable of Var
+    :rtype: frozenset of Var
     """
-    recurse = lambda e: vars_used_expr(e, ctx, arch)
-
-    if type(expr) is IRExpr.Get \
-            and (arch is None or expr.offset not in [arch.sp_offset, arch.bp_offset]):
-        return { Register(expr.offset, get_type_size_bytes(expr.ty)) }
-
-    elif type(expr) is IRExpr.Load:
-        return { memory_location(expr.addr, ctx, arch, expr.ty) } | recurse(expr.addr)
-
-    elif type(expr) in [IRExpr.Unop, IRExpr.Binop, IRExpr.Triop, IRExpr.Qop]:
-        return reduce(operator.or_, (recurse(e) for e in expr.args))
-
-    elif type(expr) is IRExpr.ITE:
-        return recurse(expr.cond) | recurse(expr.iffalse) | recurse(expr.iftrue)
-
-    else:
-        if type(expr) is not IRExpr.Const:
-            l.error("[vars_used_expr] unimplemented for expression type %s" % type(expr))
-        return set()
+    return _memoized_used(expr, ctx, arch, lambda: _collect_used((expr,), ctx, arch))
 
 def vars_used(stmt, ctx, arch=None):
     """ Get the set of variables whose values are used by the given statement.
 
+    Results are cached as for `vars_used_expr()`.
+
     :param IRStmt stmt:
     :param ExecutionCtx ctx:
     :param Arch arch: The guest architecture. If provided, used to create more accurate results.
-    :rtype: Iterable of Var
+    :rtype: frozenset of Var
     """
-    from_expr = lambda e: vars_used_expr(e, ctx, arch)
-
-    if type(stmt) is IRStmt.Put:
-        return from_expr(stmt.data)
-
-    elif type(stmt) is IRStmt.Store:
-        return from_expr(stmt.addr) | from_expr(stmt.data)
-
-    elif type(stmt) is IRStmt.Exit:
-        return from_expr(stmt.guard) | from_expr(stmt.dst)
-
-    else:
-        if type(stmt) not in [IRStmt.NoOp, IRStmt.AbiHint, IRStmt.IMark]:
-            l.error("[vars_used] unimplemented for statement type %s" % type(stmt))
-        return set()
+    operands = _stmt_operands.get(type(stmt))
+    if operands is None:
+        l.error("[vars_used] unimplemented for statement type %s" % type(stmt))
+        return frozenset()
+    return _memoized_used(stmt, ctx, arch, lambda: _collect_used(operands(stmt), ctx, arch))
@@ -0,0 +1,167 @@
+from angr.analyses.code_location import CodeLocation
+
+from .supergraph import DummyNode
+
+import sys
+import logging
+
+l = logging.getLogger(__name__)
+
+_primitives = (int, float, bool, str, bytes, type(None))
+_sequences = (list, tuple, set, frozenset)
+
+# Objects of these modules are walked through their slots. Anything else is counted, but not
+# descended into.
+_walked_modules = ('static_jump_resolution.', 'pyvex.')
+
+class ClassStats:
+    """ Instance counts and sizes for one class.
+
+    :ivar int refs: The number of references to instances of the class.
+    :ivar int objects: The number of distinct instances (by identity).
+    :ivar int values: The number of distinct instances by equality, i.e. the number that would
+        remain if instances were interned. None if the class is not hashable.
+    :ivar int bytes: The total shallow size of the distinct instances.
+    """
+
+    __slots__ = ('refs', 'objects', 'values', 'bytes')
+
+    def __init__(self):
+        self.refs = 0
+        self.objects = 0
+        self.values = 0
+        self.bytes = 0
+
+    def __repr__(self):
+        return '<ClassStats: %d refs, %d objects, %s values, %d bytes>' % \
+                (self.refs, self.objects, self.values, self.bytes)
+
+class MemoryReport:
+    """ An estimate of the memory held by the state of an analysis.
+
+    Sizes are shallow sizes from `sys.getsizeof()`, summed over distinct objects, so an object
+    shared between several structures is counted once, in the first category (and function) in
+    which it is found. The sizes of ints, floats and strings are not counted.
+
+    :ivar dict classes: Mapping from class names to `ClassStats`.
+    :ivar dict categories: Mapping from category names ('states', 'engine', 'graph') to bytes.
+    :ivar dict functions: Mapping from function addresses to the bytes of their node states.
+    """
+
+    def __init__(self):
+        self.classes = {}
+        self.categories = {}
+        self.functions = {}
+
+        self._seen = set()
+        self._values = {}
+
+    @property
+    def total(self):
+        return sum(self.categories.values())
+
+    def _stats(self, cls):
+        stats = self.classes.get(cls.__name__)
+        if stats is None:
+            stats = ClassStats()
+            self.classes[cls.__name__] = stats
+        return stats
+
+    def _count(self, obj, category, fn_addr=None):
+        """ Count a reference to an object. Return True if the object had not been seen before. """
+        stats = self._stats(type(obj))
+        stats.refs += 1
+
+        if id(obj) in self._seen:
+            return False
+        self._seen.add(id(obj))
+
+        size = sys.getsizeof(obj)
+        stats.objects += 1
+        stats.bytes += size
+        self.categories[category] = self.categories.get(category, 0) + size
+        if fn_addr is not None:
+            self.functions[fn_addr] = self.functions.get(fn_addr, 0) + size
+
+        if type(obj).__hash__ is not None and type(obj) not in _sequences:
+            values = self._values.setdefault(type(obj), set())
+            values.add(obj)
+            stats.values = len(values)
+        else:
+            stats.values = None
+
+        return True
+
+    def walk(self, root, category, fn_addr=None):
+        """ Count the objects reachable from `root`. """
+        stack = [root]
+        while len(stack) > 0:
+            obj = stack.pop()
+            if isinstance(obj, _primitives):
+                continue
+            if not self._count(obj, category, fn_addr):
+                continue
+
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, _sequences):
+                stack.extend(obj)
+            elif type(obj) is CodeLocation \
+                    or type(obj).__module__.startswith(_walked_modules):
+                stack.extend(_slot_values(obj))
+
+    def summary(self, top=10):
+        """ Format the largest classes, and the bytes per category, as text. """
+        lines = ['%.1f KiB in total: %s' % (self.total / 1024., ', '.join('%s %.1f KiB' % \
+                (c, b / 1024.) for (c, b) in sorted(self.categories.items())))]
+
+        largest = sorted(self.classes.items(), key=lambda i: i[1].bytes, reverse=True)
+        for (name, stats) in largest[:top]:
+            lines.append('  %-20s %9d refs %9d objects %9s values %10.1f KiB' % (name, stats.refs,
+                stats.objects, '-' if stats.values is None else stats.values, stats.bytes / 1024.))
+
+        return '\n'.join(lines)
+
+def _slot_values(obj):
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            value = getattr(obj, name, None)
+            if value is not None:
+                yield value
+
+def memory_report(node_states, engine=None, graph=None):
+    """ Estimate the memory held by the per-node states of an analysis, by the block caches of its
+    engine and by its supergraph.
+
+    The nodes of the graph are counted in the 'graph' category, but not walked.
+
+    :param dict node_states: Mapping from nodes to `LiveVars`.
+    :param SimEngineSJRVEX engine: (Optional)
+    :param networkx.DiGraph graph: (Optional)
+    :rtype: MemoryReport
+    """
+    report = MemoryReport()
+
+    if graph is not None:
+        for n in graph.nodes:
+            report._count(n, 'graph')
+
+    for (n, state) in node_states.items():
+        fn_addr = n.fn_addr if type(n) is DummyNode else n.function_address
+        report._count(n, 'graph')
+        report.walk(state, 'states', fn_addr)
+
+    if engine is not None:
+        for cache in (engine._block_tmps, engine._block_stmts, engine._block_summaries,
+                engine._block_transfers):
+            report.walk(cache, 'engine')
+
+    if graph is not None:
+        for adj in (graph._adj, graph._pred, graph._node):
+            report.walk(adj, 'graph')
+
+    return report
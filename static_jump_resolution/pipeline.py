@@ -0,0 +1,362 @@
+from .engine import SimEngineSJRVEX
+from .resolve import format_jumps
+from .stack import StackDeltas
+from .supergraph import SupergraphVisitor, DummyNode
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import tempfile
+import logging
+
+l = logging.getLogger(__name__)
+
+STAGES = ('load', 'cfg', 'supergraph', 'lift', 'fixpoint', 'resolve', 'report')
+
+# Stages whose checkpoint holds every artifact built so far, latest first
+_ARTIFACT_STAGES = ('lift', 'supergraph', 'cfg', 'load')
+
+class _GraphPickler(pickle.Pickler):
+    """ Pickles references to the nodes of a graph, and to an `Arch`, by identifier only. """
+
+    def __init__(self, file, graph, arch):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._arch = arch
+        self._ids = dict((n, i) for (i, n) in enumerate(graph.nodes))
+        self._node_types = set(type(n) for n in self._ids)
+
+    def persistent_id(self, obj):
+        if obj is self._arch:
+            return ('arch',)
+        if type(obj) in self._node_types:
+            i = self._ids.get(obj)
+            if i is not None:
+                return ('node', i)
+        return None
+
+class _GraphUnpickler(pickle.Unpickler):
+    def __init__(self, file, graph, arch):
+        super().__init__(file)
+        self._arch = arch
+        self._nodes = list(graph.nodes)
+
+    def persistent_load(self, pid):
+        if pid[0] == 'arch':
+            return self._arch
+        elif pid[0] == 'node':
+            return self._nodes[pid[1]]
+        raise pickle.UnpicklingError('Unknown persistent id %r' % (pid,))
+
+def _node_label(node):
+    if type(node) is DummyNode:
+        return '%s@0x%x' % (node.dummy_type, node.parent_node.addr)
+    return '0x%x' % node.addr
+
+class Checkpoints:
+    """ A directory of named checkpoints.
+
+    Checkpoints are written to a temporary file and then renamed into place, so a process killed
+    while writing one leaves the previous checkpoint of the same name intact.
+
+    :param str directory: The directory, created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.pickle')
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def save(self, name, obj, pickler=None):
+        """ Write a checkpoint.
+
+        :param str name:
+        :param obj: The object to pickle.
+        :param pickler: (Optional) Called with a binary file to get the `pickle.Pickler` to use.
+        """
+        (fd, tmp) = tempfile.mkstemp(prefix='.' + name, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if pickler is None:
+                    pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+                else:
+                    pickler(f).dump(obj)
+            os.replace(tmp, self.path(name))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self, name, unpickler=None):
+        """ Read a checkpoint.
+
+        :param str name:
+        :param unpickler: (Optional) Called with a binary file to get the `pickle.Unpickler` to use.
+        """
+        with open(self.path(name), 'rb') as f:
+            if unpickler is None:
+                return pickle.load(f)
+            return unpickler(f).load()
+
+    def remove(self, *names):
+        for name in names:
+            if self.exists(name):
+                os.unlink(self.path(name))
+
+    def clear(self):
+        """ Remove all checkpoints. """
+        for entry in os.listdir(self.directory):
+            if entry.endswith('.pickle'):
+                os.unlink(os.path.join(self.directory, entry))
+
+class Pipeline:
+    """ The analysis of one binary as a sequence of resumable stages.
+
+    The stages are, in order:
+
+    * load: load the binary into an angr project,
+    * cfg: recover a CFG with `CFGFast`,
+    * supergraph: build the supergraph and its visitor,
+    * lift: lift every block and fill the engine's caches of substituted statements and def/use
+      summaries,
+    * fixpoint: compute the jump target slices,
+    * resolve: resolve the targets of each indirect jump, and write the per-node results to
+      `results.sjr` in the working directory (see `ResultsFile`), and
+    * report: write the report to `report.json` in the working directory.
+
+    The output of each stage is checkpointed to the working directory, and a run started over an
+    existing working directory resumes after the last completed stage. During the fixpoint, the
+    per-node states and the worklist are additionally snapshotted every `snapshot_interval` node
+    visits, so an interrupted fixpoint resumes from its last snapshot. Snapshots refer to graph
+    nodes by position, and must be resumed over the graph restored from the 'lift' checkpoint.
+
+    :param str binary: The path to the binary.
+    :param str workdir: The directory for checkpoints and the report.
+    :param dict load_options: (Optional) Extra keyword arguments to `angr.Project`.
+    :param dict cfg_options: (Optional) Extra keyword arguments to `CFGFast`.
+    :param dict analysis_options: (Optional) Extra keyword arguments to
+        `StaticJumpResolutionAnalysis`.
+    :param int snapshot_interval: (Optional) The number of node visits between fixpoint snapshots.
+        If None, the fixpoint is only checkpointed once complete.
+    """
+
+    def __init__(self, binary, workdir, load_options=None, cfg_options=None, analysis_options=None,
+            snapshot_interval=10000):
+        self.binary = binary
+        self.checkpoints = Checkpoints(workdir)
+        self.load_options = dict(load_options or {})
+        self.load_options.setdefault('auto_load_libs', False)
+        self.cfg_options = dict(cfg_options or {})
+        self.analysis_options = dict(analysis_options or {})
+        self.snapshot_interval = snapshot_interval
+
+        self.project = None
+        self.cfg = None
+        self.visitor = None
+        self.engine = None
+        self.analysis = None
+        self.results = None
+        self.report = None
+
+        self.stages_run = []
+
+    @property
+    def report_path(self):
+        return os.path.join(self.checkpoints.directory, 'report.json')
+
+    @property
+    def results_path(self):
+        return os.path.join(self.checkpoints.directory, 'results.sjr')
+
+    def run(self, resume=True, until='report'):
+        """ Run the stages of the pipeline.
+
+        :param bool resume: If True, continue after the last checkpointed stage. Otherwise, discard
+            all checkpoints and start over.
+        :param str until: The last stage to run.
+        :return: The report, if the 'report' stage was run.
+        """
+        if until not in STAGES:
+            raise ValueError('Unknown stage %r' % until)
+
+        if resume:
+            first = self._restore()
+        else:
+            self.checkpoints.clear()
+            first = 0
+
+        for stage in STAGES[first:STAGES.index(until) + 1]:
+            l.info('Running stage %s on %s', stage, self.binary)
+            getattr(self, '_run_' + stage)()
+            self.stages_run.append(stage)
+
+        return self.report
+
+    def _restore(self):
+        """ Restore the latest checkpoint, and return the index of the first stage left to run. """
+        if self.checkpoints.exists('resolve'):
+            self.results = self.checkpoints.load('resolve')
+            return STAGES.index('report')
+
+        for stage in _ARTIFACT_STAGES:
+            if self.checkpoints.exists(stage):
+                l.info('Resuming %s after stage %s', self.binary, stage)
+                artifacts = self.checkpoints.load(stage)
+                self.project = artifacts.get('project')
+                self.cfg = artifacts.get('cfg')
+                self.visitor = artifacts.get('visitor')
+                self.engine = artifacts.get('engine')
+                return STAGES.index(stage) + 1
+
+        return 0
+
+    def _checkpoint_artifacts(self, stage):
+        artifacts = {
+            'project': self.project,
+            'cfg': self.cfg,
+            'visitor': self.visitor,
+            'engine': self.engine,
+        }
+        self.checkpoints.save(stage, dict((k, v) for (k, v) in artifacts.items() if v is not None))
+
+        # Each artifact checkpoint subsumes the earlier ones
+        i = _ARTIFACT_STAGES.index(stage)
+        self.checkpoints.remove(*_ARTIFACT_STAGES[i + 1:])
+
+    def _pickler(self, f):
+        return _GraphPickler(f, self.visitor.graph, self.project.arch)
+
+    def _unpickler(self, f):
+        return _GraphUnpickler(f, self.visitor.graph, self.project.arch)
+
+    def _save_snapshot(self, snapshot):
+        l.info('Snapshot of the fixpoint after %d iterations', snapshot['iterations'])
+        self.checkpoints.save('fixpoint.partial', snapshot, self._pickler)
+
+    def _run_load(self):
+        import angr
+        self.project = angr.Project(self.binary, **self.load_options)
+        self._checkpoint_artifacts('load')
+
+    def _run_cfg(self):
+        self.cfg = self.project.analyses.CFGFast(**self.cfg_options)
+        self._checkpoint_artifacts('cfg')
+
+    def _run_supergraph(self):
+        self.visitor = SupergraphVisitor(self.cfg)
+        self._checkpoint_artifacts('supergraph')
+
+    def _run_lift(self):
+        arch = self.project.arch
+        graph = self.visitor.graph
+        self.engine = SimEngineSJRVEX()
+        functions = {}
+
+        for n in graph.nodes:
+            if type(n) is DummyNode:
+                continue
+            functions.setdefault(n.function_address, []).append(n)
+            if not n.is_simprocedure:
+                self.engine.substituted_stmts(n.block)
+
+        # Summaries in the contexts the analysis will ask for
+        for (fn_addr, nodes) in functions.items():
+            deltas = StackDeltas.compute(fn_addr, nodes, graph.predecessors, self.engine, arch)
+            for n in nodes:
+                if not n.is_simprocedure:
+                    self.engine.summarize(n.block, deltas.ctx(n.addr), arch)
+
+        self._checkpoint_artifacts('lift')
+
+    def _run_fixpoint(self):
+        snapshot = None
+        for name in ('fixpoint', 'fixpoint.partial'):
+            if self.checkpoints.exists(name):
+                snapshot = self.checkpoints.load(name, self._unpickler)
+                l.info('Resuming the fixpoint after %d iterations', snapshot['iterations'])
+                break
+
+        self.analysis = self.project.analyses.StaticJumpResolutionAnalysis(self.cfg,
+                graph_visitor=self.visitor, engine=self.engine,
+                snapshot_interval=self.snapshot_interval, snapshot_callback=self._save_snapshot,
+                resume_from=snapshot, resolve=False, **self.analysis_options)
+
+        self.checkpoints.save('fixpoint', self.analysis.fixpoint_snapshot(), self._pickler)
+        self.checkpoints.remove('fixpoint.partial')
+
+    def _run_resolve(self):
+        if self.analysis.budget_exceeded is None:
+            self.analysis.resolve_jumps()
+        else:
+            self.analysis.resolve_jumps(self.analysis.visited_nodes)
+        self.analysis.save_results(self.results_path)
+        self.results = {
+            'results': self.results_path,
+            'functions': len(self.cfg.kb.functions),
+            'nodes': len(self.cfg.graph),
+            'jumps': format_jumps(self.analysis.jump_resolutions),
+            'budget_exceeded': self.analysis.budget_exceeded,
+            'widened': sorted(_node_label(n) for n in self.analysis.widened_nodes),
+        }
+        self.checkpoints.save('resolve', self.results)
+
+    def _run_report(self):
+        self.report = dict(self.results, binary=self.binary)
+
+        tmp = self.report_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        os.replace(tmp, self.report_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='static_jump_resolution',
+            description='Statically resolve the indirect jumps of a binary, checkpointing each '
+                'stage of the analysis so that an interrupted run can be resumed.')
+    parser.add_argument('binary')
+    parser.add_argument('-w', '--workdir', default=None,
+            help='checkpoint directory (default: <binary>.sjr)')
+    parser.add_argument('-o', '--output', help='also write the report to this file')
+    parser.add_argument('--restart', action='store_true',
+            help='discard existing checkpoints and start over')
+    parser.add_argument('--until', choices=STAGES, default='report',
+            help='stop after this stage')
+    parser.add_argument('--snapshot-interval', type=int, default=10000,
+            help='node visits between fixpoint snapshots (0 to disable)')
+    parser.add_argument('--sparse', action='store_true', help='use sparse evaluation')
+    parser.add_argument('--max-visits', type=int, default=None,
+            help='stop the fixpoint after this many node visits')
+    parser.add_argument('--max-merges', type=int, default=None,
+            help='widen the state of a node after this many merges')
+    parser.add_argument('--time-budget', type=float, default=None,
+            help='stop the fixpoint after this many seconds')
+    parser.add_argument('--profile-interval', type=int, default=None,
+            help='log a memory report every this many node visits')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir if args.workdir is not None else args.binary + '.sjr'
+    analysis_options = {
+        'sparse': args.sparse,
+        'max_visits': args.max_visits,
+        'max_merges': args.max_merges,
+        'time_budget': args.time_budget,
+        'profile_interval': args.profile_interval,
+    }
+    pipeline = Pipeline(args.binary, workdir,
+            analysis_options=analysis_options,
+            snapshot_interval=args.snapshot_interval or None)
+    report = pipeline.run(resume=not args.restart, until=args.until)
+
+    if report is not None:
+        if args.output is None:
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    return 0
@@ -0,0 +1,245 @@
+from .engine import is_indirect_jump
+from .supergraph import DummyNode
+from .supergraph.traversal import CSRGraph
+
+from collections.abc import Sequence
+import logging
+
+l = logging.getLogger(__name__)
+
+class BlockResults:
+    """ The analysis state at a single node.
+
+    :param fn: The `Function` containing the node, or None if it is not in the knowledge base.
+    :param node: The node.
+    :param LiveVars state:
+    """
+
+    def __init__(self, fn, node, state):
+        self.fn = fn
+        self.node = node
+        self.state = state
+
+    @property
+    def addr(self):
+        return self.node.addr
+
+    @property
+    def function_addr(self):
+        if self.fn is None:
+            return self.node.function_address
+        return self.fn.addr
+
+    @property
+    def block(self):
+        return self.node.block
+
+    def __str__(self):
+        fn = '0x%x' % self.function_addr if self.fn is None else self.fn.__repr__()
+        s  = "== Results for block at 0x%x in %s:" % (self.addr, fn)
+        for defn in self.state.livesets:
+            s += "\n    %s" % defn
+
+        return s
+
+class ResultsView(Sequence):
+    """ A lazy sequence of `BlockResults` over a list of nodes. Each `BlockResults` is constructed
+    on access.
+    """
+
+    __slots__ = ('_index', '_nodes')
+
+    def __init__(self, index, nodes):
+        self._index = index
+        self._nodes = nodes
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ResultsView(self._index, self._nodes[i])
+        return self._index.block_results(self._nodes[i])
+
+    def __repr__(self):
+        return '<ResultsView of %d nodes>' % len(self._nodes)
+
+_empty = ()
+
+class ResultIndex:
+    """ An index over the per-node results of an analysis, for repeated queries.
+
+    Nodes are indexed by function and by block address on construction. The indexes by variable
+    and by jump site are built on first use.
+
+    A variable is taken to feed a jump site if it has a live use in a block from which the jump
+    site is reachable in the supergraph. Since the analysis only computes liveness for the slices of
+    jump targets, this over-approximates the slice of each individual jump.
+
+    :param dict node_states: Mapping from nodes to `LiveVars`.
+    :param dict jump_resolutions: (Optional) Mapping from jump addresses to `JumpResolution`. If
+        not given or empty, e.g. when jumps have not been resolved yet, the jump sites are found by
+        scanning the graph.
+    :param graph: (Optional) The supergraph, for queries by jump site.
+    :param kb: (Optional) The knowledge base, to attach functions to `BlockResults`.
+    """
+
+    def __init__(self, node_states, jump_resolutions=None, graph=None, kb=None):
+        self._states = node_states
+        self._jump_resolutions = jump_resolutions
+        self._graph = graph
+        self._kb = kb
+
+        self._by_function = {}
+        self._by_block = {}
+        for n in node_states:
+            if type(n) is DummyNode:
+                continue
+            self._by_function.setdefault(n.function_address, []).append(n)
+            self._by_block.setdefault(n.addr, []).append(n)
+
+        for nodes in self._by_function.values():
+            nodes.sort(key=lambda n: n.addr)
+
+        self._by_var = None
+        self._jump_nodes = None
+        self._csr = None
+        self._graph_blocks = None
+        self._jump_reach = {}
+        self._fed_by = {}
+
+    def block_results(self, node):
+        """ Get the `BlockResults` of a node. """
+        fn = None
+        if self._kb is not None:
+            fn = self._kb.functions.function(addr=node.function_address)
+        return BlockResults(fn, node, self._states[node])
+
+    def functions(self):
+        """ The sorted addresses of the functions with results. """
+        return sorted(self._by_function)
+
+    def for_function(self, fn_addr):
+        """ The results of the nodes of a function, by block address.
+
+        :rtype: ResultsView
+        """
+        return ResultsView(self, self._by_function.get(fn_addr, _empty))
+
+    def for_block(self, addr):
+        """ The results of the nodes of the block at an address, one per function containing it.
+
+        :rtype: ResultsView
+        """
+        return ResultsView(self, self._by_block.get(addr, _empty))
+
+    def jump_sites(self, fn_addr=None):
+        """ The sorted addresses of the indirect jump instructions, optionally only those in a
+        function.
+        """
+        nodes = self._jump_sites()
+        return sorted(a for (a, n) in nodes.items() \
+                if fn_addr is None or n.function_address == fn_addr)
+
+    def for_jump(self, jump_addr):
+        """ The results of the node ending in the jump at an address, or None. """
+        node = self._jump_sites().get(jump_addr)
+        if node is None or node not in self._states:
+            return None
+        return self.block_results(node)
+
+    def jump_resolution(self, jump_addr):
+        """ The `JumpResolution` of the jump at an address, or None. """
+        if self._jump_resolutions is None:
+            return None
+        return self._jump_resolutions.get(jump_addr)
+
+    def for_var(self, var):
+        """ The results of the nodes at which a variable has a live use.
+
+        :param Var var:
+        :rtype: ResultsView
+        """
+        return ResultsView(self, self._var_index().get(var, _empty))
+
+    def uses_of(self, var):
+        """ The live uses of a variable at any node, discarding their contexts.
+
+        :param Var var:
+        :return: set of `VarUse`.
+        """
+        return set(u for n in self._var_index().get(var, _empty) \
+                for ls in self._states[n].livesets for u in ls.uses if u.var == var)
+
+    def jump_sites_fed_by(self, var):
+        """ The sorted addresses of the jump sites whose targets a variable may feed.
+
+        :param Var var:
+        """
+        cached = self._fed_by.get(var)
+        if cached is not None:
+            return cached
+
+        blocks = set(u.codeloc.block_addr for u in self.uses_of(var))
+        use_nodes = [n for b in blocks for n in self._graph_nodes_at(b)]
+
+        csr = self._csr_graph()
+        indexes = csr.indexes_of(use_nodes)
+        fed = []
+        if len(indexes) > 0:
+            for (addr, node) in sorted(self._jump_sites().items()):
+                if self._reaching(node)[indexes].any():
+                    fed.append(addr)
+
+        self._fed_by[var] = fed
+        return fed
+
+    def _var_index(self):
+        if self._by_var is None:
+            self._by_var = {}
+            for (n, state) in self._states.items():
+                if type(n) is DummyNode:
+                    continue
+                for var in state.live_vars():
+                    self._by_var.setdefault(var, []).append(n)
+        return self._by_var
+
+    def _jump_sites(self):
+        if self._jump_nodes is not None:
+            return self._jump_nodes
+
+        if self._jump_resolutions:
+            self._jump_nodes = dict((a, r.node) for (a, r) in self._jump_resolutions.items())
+        else:
+            nodes = self._graph.nodes if self._graph is not None else self._states
+            self._jump_nodes = dict((n.instruction_addrs[-1], n) for n in nodes \
+                    if type(n) is not DummyNode and not n.is_simprocedure \
+                    and is_indirect_jump(n.block) is not None)
+        return self._jump_nodes
+
+    def _csr_graph(self):
+        if self._graph is None:
+            raise ValueError('Queries by jump site need the supergraph')
+        if self._csr is None:
+            self._csr = CSRGraph(self._graph)
+            self._graph_blocks = {}
+            for n in self._csr.nodes:
+                if type(n) is not DummyNode:
+                    self._graph_blocks.setdefault(n.addr, []).append(n)
+        return self._csr
+
+    def _graph_nodes_at(self, addr):
+        self._csr_graph()
+        return self._graph_blocks.get(addr, _empty)
+
+    def _reaching(self, node):
+        """ The nodes from which a node is reachable, as a boolean array. """
+        reach = self._jump_reach.get(node)
+        if reach is None:
+            reach = self._csr_graph().reachable([node], reverse=True)
+            self._jump_reach[node] = reach
+        return reach
@@ -0,0 +1,415 @@
+from .context import ExecutionCtx
+from .def_use import may_alias
+from .engine import is_indirect_jump
+from .live_vars import vars_modified
+from .supergraph import DummyNode
+from .vars import Register, StackVar, memory_location, get_type_size_bytes
+
+from pyvex import IRExpr
+
+import itertools
+import re
+import logging
+
+l = logging.getLogger(__name__)
+
+_arith_op = re.compile(r'^Iop_(Add|Sub|Mul|And|Or|Xor|Shl|Shr|Sar)(8|16|32|64)$')
+_conv_op = re.compile(r'^Iop_(1|8|16|32|64)(U|S|HI|)to(1|8|16|32|64)$')
+
+def _mask(value, bits):
+    return value & ((1 << bits) - 1)
+
+def _sign_extend(value, bits):
+    value = _mask(value, bits)
+    if value >> (bits - 1):
+        return value - (1 << bits)
+    return value
+
+def apply_op(op, args):
+    """ Apply a VEX operator to concrete integer arguments.
+
+    Only the integer arithmetic, bitwise and width conversion operators commonly found in address
+    computations are supported.
+
+    :param str op: The VEX operator name, e.g. 'Iop_Add64'.
+    :param args: Tuple of int.
+    :return: The (unsigned) result, or None if the operator is not supported.
+    """
+    m = _arith_op.match(op)
+    if m is not None and len(args) == 2:
+        (name, bits) = (m.group(1), int(m.group(2)))
+        (a, b) = (_mask(args[0], bits), _mask(args[1], bits))
+
+        if name == 'Add':
+            result = a + b
+        elif name == 'Sub':
+            result = a - b
+        elif name == 'Mul':
+            result = a * b
+        elif name == 'And':
+            result = a & b
+        elif name == 'Or':
+            result = a | b
+        elif name == 'Xor':
+            result = a ^ b
+        elif name == 'Shl':
+            result = a << _mask(args[1], 8)
+        elif name == 'Shr':
+            result = a >> _mask(args[1], 8)
+        else:
+            result = _sign_extend(a, bits) >> _mask(args[1], 8)
+
+        return _mask(result, bits)
+
+    m = _conv_op.match(op)
+    if m is not None and len(args) == 1:
+        (src, kind, dst) = (int(m.group(1)), m.group(2), int(m.group(3)))
+
+        if kind == 'S':
+            return _mask(_sign_extend(args[0], src), dst)
+        elif kind == 'HI':
+            return _mask(args[0] >> (src - dst), dst)
+        else:
+            return _mask(args[0], min(src, dst))
+
+    return None
+
+class JumpResolution:
+    """ The statically resolved targets of a single indirect jump site.
+
+    :param node: The CFGNode ending in the indirect jump.
+    :param targets: A frozenset of int target addresses, or None if the jump could not be resolved.
+    """
+    __slots__ = ('node', 'targets')
+
+    def __init__(self, node, targets):
+        self.node = node
+        self.targets = targets
+
+    @property
+    def addr(self):
+        """ The address of the jump instruction. """
+        return self.node.instruction_addrs[-1]
+
+    @property
+    def function_addr(self):
+        return self.node.function_address
+
+    @property
+    def resolved(self):
+        """ Were any targets resolved for this jump? """
+        return self.targets is not None and len(self.targets) > 0
+
+    def __repr__(self):
+        if self.targets is None:
+            return '<JumpResolution 0x%x unresolved>' % self.addr
+        return '<JumpResolution 0x%x -> [%s]>' % \
+                (self.addr, ', '.join('0x%x' % t for t in sorted(self.targets)))
+
+def format_jumps(jump_resolutions):
+    """ Convert jump resolutions to a JSON-serializable dict.
+
+    :param dict jump_resolutions: Mapping from jump addresses to `JumpResolution`.
+    :return: dict mapping hex jump addresses to sorted lists of hex targets, or None for unresolved
+        jumps.
+    """
+    jumps = {}
+    for (addr, resolution) in sorted(jump_resolutions.items()):
+        if resolution.targets is None:
+            jumps['0x%x' % addr] = None
+        else:
+            jumps['0x%x' % addr] = ['0x%x' % t for t in sorted(resolution.targets)]
+
+    return jumps
+
+class TargetResolver:
+    """ Statically evaluates indirect jump targets over the definitions in their slices.
+
+    Starting from a jump's (tmp-substituted) target expression, each variable the expression uses
+    is traced back to the statements defining it, within its block and then through intraprocedural
+    predecessors, and the defining expressions are evaluated in turn. Values are tracked as small
+    sets of constants:
+
+    * constants evaluate to themselves,
+    * `Register`s and `StackVar`s evaluate to the union of the values of their reaching
+      definitions,
+    * loads from any other `MemoryLocation` are evaluated by reading the loaded addresses from
+      read-only segments of the binary, e.g. jump table entries, and
+    * arithmetic is evaluated pointwise.
+
+    Anything else (function parameters, values computed by callees, writable memory) is unknown,
+    and makes the whole jump unresolved. A variable reached again along a cycle is evaluated
+    repeatedly, starting from no values, until its values are stable; one that does not stabilize
+    within `max_iterations` (e.g. a pointer advanced in a loop) is unknown.
+
+    If the fixpoint state of the jump's node is given, the walk out of the jump's block is seeded
+    from the jump's slice in that state: only the variables the slice has live at block entry are
+    traced into predecessors, and each of them only once.
+
+    :param project: The angr project.
+    :param SimEngineSJRVEX engine: Used for its cached tmp-substituted block statements.
+    :param networkx.DiGraph graph: The supergraph.
+    :param int max_values: The largest value set to track before giving up.
+    :param int max_depth: The deepest chain of definitions to follow before giving up.
+    :param int max_iterations: The most times to re-evaluate a variable on a cycle before giving
+        up.
+    :param JumpTableResolver jump_tables: (Optional) Used to resolve jumps through tables whose
+        index is not a known constant.
+    :param contexts: (Optional) A function giving the execution context of a node, e.g.
+        `StaticJumpResolutionAnalysis.block_ctx()`, so that stack variables are identified across
+        blocks. Defaults to the initial context of the node's function.
+    """
+
+    def __init__(self, project, engine, graph, max_values=256, max_depth=32, max_iterations=16,
+            jump_tables=None, contexts=None):
+        self._project = project
+        self._engine = engine
+        self._graph = graph
+        self._jump_tables = jump_tables
+        self._contexts = contexts
+        self.max_values = max_values
+        self.max_depth = max_depth
+        self.max_iterations = max_iterations
+
+        self._visiting = {}
+        self._jump = None
+        self._slice = None
+        self._seeds = {}
+
+    @property
+    def _arch(self):
+        return self._project.arch
+
+    def _ctx(self, node):
+        if self._contexts is not None:
+            return self._contexts(node)
+        return ExecutionCtx(node.function_address, 0, None)
+
+    def resolve(self, node, state=None):
+        """ Resolve the targets of the indirect jump ending the given node.
+
+        :param CFGNode node:
+        :param LiveVars state: (Optional) The fixpoint state of the node, holding the jump's slice.
+        :rtype: JumpResolution or None
+        :return: None if the node does not end in an indirect jump.
+        """
+        if is_indirect_jump(node.block) is None:
+            return None
+
+        (_, next_expr) = self._engine.substituted_stmts(node.block)
+        ctx = self._ctx(node)
+
+        self._visiting.clear()
+        self._seeds.clear()
+        self._jump = node
+        self._slice = None if state is None else \
+                set(u.var for u in state.unqualified_uses() if u.codeloc.block_addr == node.addr)
+
+        targets = self._values_of_expr(next_expr, node, None, 0, ctx)
+        if targets is None and self._jump_tables is not None:
+            targets = self._jump_tables.resolve(node, next_expr)
+        if targets is not None:
+            targets = frozenset(targets)
+
+        return JumpResolution(node, targets)
+
+    def _values_of_expr(self, expr, node, before, depth, ctx):
+        """ Evaluate an expression, read at the given statement of the given node.
+
+        :return: A set of int, or None if unknown.
+        """
+        if depth > self.max_depth:
+            return None
+
+        if type(expr) is IRExpr.Const:
+            return { expr.con.value }
+
+        elif type(expr) is IRExpr.Get:
+            var = Register(expr.offset, get_type_size_bytes(expr.ty))
+            return self._values_of_var(var, node, before, depth + 1, ctx)
+
+        elif type(expr) is IRExpr.Load:
+            loc = memory_location(expr.addr, ctx, self._arch, expr.ty)
+            if type(loc) is StackVar:
+                return self._values_of_var(loc, node, before, depth + 1, ctx)
+
+            addrs = self._values_of_expr(expr.addr, node, before, depth + 1, ctx)
+            if addrs is None:
+                return None
+
+            return self._read_values(addrs, int(get_type_size_bytes(expr.ty)), expr.end)
+
+        elif type(expr) in (IRExpr.Unop, IRExpr.Binop, IRExpr.Triop, IRExpr.Qop):
+            arg_sets = []
+            for arg in expr.args:
+                values = self._values_of_expr(arg, node, before, depth + 1, ctx)
+                if values is None:
+                    return None
+                arg_sets.append(values)
+
+            size = 1
+            for values in arg_sets:
+                size *= len(values)
+            if size > self.max_values:
+                return None
+
+            results = set()
+            for args in itertools.product(*arg_sets):
+                result = apply_op(expr.op, args)
+                if result is None:
+                    return None
+                results.add(result)
+            return results
+
+        elif type(expr) is IRExpr.ITE:
+            iftrue = self._values_of_expr(expr.iftrue, node, before, depth + 1, ctx)
+            iffalse = self._values_of_expr(expr.iffalse, node, before, depth + 1, ctx)
+            if iftrue is None or iffalse is None:
+                return None
+            return iftrue | iffalse
+
+        else:
+            return None
+
+    def _values_of_var(self, var, node, before, depth, ctx):
+        """ Evaluate a variable at the given statement of the given node, by finding and evaluating
+        its reaching definitions.
+
+        :param Var var:
+        :param int before: The index of the reading statement, or None for the end of the block.
+        :return: A set of int, or None if unknown.
+        """
+        (stmts, _) = self._engine.substituted_stmts(node.block)
+
+        for (idx, stmt) in reversed(stmts):
+            if before is not None and idx >= before:
+                continue
+
+            defs = vars_modified(stmt, ctx, self._arch)
+            if var in defs:
+                return self._values_of_expr(stmt.data, node, idx, depth, ctx)
+
+            for d in defs:
+                if not may_alias(d, var):
+                    continue
+
+                # A wider write to the same register, e.g. a 64-bit write read as 32 bits
+                if type(var) is Register and d.offset == var.offset and d.size > var.size:
+                    values = self._values_of_expr(stmt.data, node, idx, depth, ctx)
+                    if values is None:
+                        return None
+                    return set(_mask(v, int(var.size * 8)) for v in values)
+
+                return None
+
+        if node is self._jump and self._slice is not None:
+            return self._seeded_values(var, node, depth, ctx)
+
+        return self._values_at_preds(var, node, depth, ctx)
+
+    def _seeded_values(self, var, node, depth, ctx):
+        """ Evaluate a variable at the entry of the jump's block, if it is in the jump's slice. """
+        if var not in self._slice:
+            l.debug('%s is not in the slice of the jump at 0x%x', var, node.addr)
+            return None
+
+        if var in self._seeds:
+            return self._seeds[var]
+
+        values = self._values_at_preds(var, node, depth, ctx)
+        # Values found inside a cycle may rest on an assumption that does not hold yet
+        if len(self._visiting) == 0:
+            self._seeds[var] = values
+        return values
+
+    def _values_at_preds(self, var, node, depth, ctx):
+        preds = list(self._graph.predecessors(node))
+        if len(preds) == 0:
+            return None
+
+        values = set()
+        for pred in preds:
+            if type(pred) is DummyNode:
+                # Locals survive calls; registers may be clobbered by the callee
+                if pred.dummy_type == 'Dummy_Ret' and type(var) is StackVar:
+                    pred = pred.parent_node
+                else:
+                    return None
+            elif pred.function_address != node.function_address:
+                return None
+
+            pred_values = self._values_at_end(var, pred, depth + 1)
+            if pred_values is None:
+                return None
+
+            values |= pred_values
+            if len(values) > self.max_values:
+                return None
+
+        return values
+
+    def _values_at_end(self, var, node, depth):
+        """ Evaluate a variable at the end of a node.
+
+        If the evaluation reaches the same variable at the same node again along a cycle, the inner
+        evaluation is answered with the values assumed so far, starting from none, and the outer
+        one is repeated with its own result as the new assumption until that is stable.
+
+        :return: A set of int, or None if unknown.
+        """
+        key = (var, node)
+        if key in self._visiting:
+            (assumed, _) = self._visiting[key]
+            self._visiting[key] = (assumed, True)
+            return assumed
+
+        assumed = set()
+        try:
+            for _ in range(self.max_iterations):
+                self._visiting[key] = (assumed, False)
+                values = self._values_of_var(var, node, None, depth, self._ctx(node))
+                (_, cyclic) = self._visiting[key]
+                if values is None or not cyclic or values == assumed:
+                    return values
+                assumed = values | assumed
+        finally:
+            del self._visiting[key]
+
+        l.debug('%s does not stabilize around a cycle through 0x%x', var, node.addr)
+        return None
+
+    def _read_values(self, addrs, size, end):
+        """ Read the given addresses from read-only memory.
+
+        :return: A set of int, or None if any address is not in read-only memory.
+        """
+        values = set()
+        for addr in addrs:
+            value = self._read_const(addr, size, end)
+            if value is None:
+                return None
+            values.add(value)
+
+        return values
+
+    def _read_const(self, addr, size, end):
+        loader = self._project.loader
+        obj = loader.find_object_containing(addr)
+        if obj is None:
+            return None
+
+        region = obj.find_section_containing(addr)
+        if region is None:
+            region = obj.find_segment_containing(addr)
+        if region is None or region.is_writable:
+            return None
+
+        try:
+            data = loader.memory.load(addr, size)
+        except KeyError:
+            return None
+
+        if len(data) != size:
+            return None
+
+        return int.from_bytes(data, 'little' if end == 'Iend_LE' else 'big')
@@ -0,0 +1,368 @@
+from angr.analyses.code_location import CodeLocation
+
+from .live_vars import VarUse
+from .vars import Register, StackVar, MemoryLocation, MEMORY_SUMMARY
+
+import numpy as np
+import mmap
+import struct
+import logging
+
+l = logging.getLogger(__name__)
+
+MAGIC = b'SJRR'
+VERSION = 1
+
+# Header: magic, version, flags, number of sections
+_HEADER = struct.Struct('<4sHHI')
+# Section table entry: tag, byte offset, number of records
+_SECTION = struct.Struct('<4sQQ')
+
+_NONE = -1
+
+_VAR_REGISTER = 0
+_VAR_STACK = 1
+_VAR_MEMORY = 2
+
+# Record layouts. Every section starts on an 8-byte boundary.
+_dtypes = {
+    # Offsets into STRD of each string, plus one past the end
+    b'STRO': np.dtype('<u8'),
+    b'STRD': np.dtype('u1'),
+    # Register: a = offset. StackVar: a = fn_addr, b = offset. MemoryLocation: a = string index of
+    # the address expression, or -1 for MEMORY_SUMMARY.
+    b'VARS': np.dtype([('kind', '<u4'), ('size', '<u4'), ('a', '<i8'), ('b', '<i8')]),
+    # None is stored as -1
+    b'LOCS': np.dtype([('block_addr', '<i8'), ('stmt_idx', '<i8'), ('ins_addr', '<i8')]),
+    b'USES': np.dtype([('var', '<u4'), ('codeloc', '<u4')]),
+    # Call strings are ranges of CALL, the call site addresses from the bottom of the stack up
+    b'CSTR': np.dtype([('start', '<u8'), ('count', '<u8')]),
+    b'CALL': np.dtype('<u8'),
+    # Live sets are a call string and a window of words of BITS, a bitset over USES whose bit 0
+    # is the use with index `first_word * 64`
+    b'LSET': np.dtype([('callstring', '<u4'), ('first_word', '<u4'), ('words', '<u8'),
+        ('bits', '<u8')]),
+    b'BITS': np.dtype('<u8'),
+    # Nodes, sorted by (fn_addr, addr), each with a range of NLST indexing LSET. bp is None if
+    # has_bp is 0.
+    b'NODE': np.dtype([('fn_addr', '<u8'), ('addr', '<u8'), ('sp', '<i8'), ('bp', '<i8'),
+        ('has_bp', '<u8'), ('livesets', '<u8'), ('count', '<u8')]),
+    b'NLST': np.dtype('<u4'),
+}
+
+_section_order = (b'STRO', b'STRD', b'VARS', b'LOCS', b'USES', b'CSTR', b'CALL', b'LSET', b'BITS',
+        b'NODE', b'NLST')
+
+class _Interner:
+    """ Assigns consecutive indexes to distinct keys, in order of first appearance. """
+    __slots__ = ('_index', 'items')
+
+    def __init__(self):
+        self._index = {}
+        self.items = []
+
+    def __call__(self, key, item=None):
+        i = self._index.get(key)
+        if i is None:
+            i = len(self.items)
+            self._index[key] = i
+            self.items.append(key if item is None else item)
+        return i
+
+def _or_none(value):
+    return _NONE if value is None else value
+
+def _var_record(var, strings):
+    """ Encode a variable as a VARS record, interning the text of a memory location's address
+    expression with `strings`. """
+    size = int(var.size)
+    if type(var) is Register:
+        return (_VAR_REGISTER, size, var.offset, 0)
+    elif type(var) is StackVar:
+        return (_VAR_STACK, size, var.fn_addr, var.offset)
+    elif var is MEMORY_SUMMARY:
+        return (_VAR_MEMORY, size, _NONE, 0)
+    elif type(var) is MemoryLocation:
+        return (_VAR_MEMORY, size, strings(str(var.addr)), 0)
+    else:
+        raise TypeError('Cannot serialize variable %r' % (var,))
+
+def _decode_var(rec, string):
+    """ Decode a VARS record, looking up the address text of a memory location by index with
+    `string`. """
+    (kind, size) = (int(rec['kind']), int(rec['size']))
+    if kind == _VAR_REGISTER:
+        return Register(int(rec['a']), size)
+    elif kind == _VAR_STACK:
+        return StackVar(int(rec['a']), int(rec['b']), size)
+    elif int(rec['a']) == _NONE:
+        return MEMORY_SUMMARY
+    else:
+        return MemoryLocation(string(int(rec['a'])), size)
+
+def write_results(path, node_states):
+    """ Write per-node analysis results to a file.
+
+    Variables, code locations, variable uses, call strings and live sets are each interned into a
+    table, and each node refers to its live sets by index. Dummy nodes carry no results of their
+    own and are skipped.
+
+    Memory locations are stored with the text of their address expressions, and call strings with
+    the call site addresses of their records, so the results can be loaded without the binary.
+
+    :param str path:
+    :param dict node_states: Mapping from CFGNodes to their `LiveVars`.
+    """
+    nodes = sorted(((n, s) for (n, s) in node_states.items() if hasattr(n, 'addr')),
+            key=lambda ns: (ns[0].function_address, ns[0].addr))
+
+    strings = _Interner()
+    vars = _Interner()
+    codelocs = _Interner()
+    uses = _Interner()
+    callstrings = _Interner()
+    livesets = _Interner()
+
+    def use_index(use):
+        v = vars(_var_record(use.var, strings))
+        c = codelocs((use.codeloc.block_addr, _or_none(use.codeloc.stmt_idx),
+            _or_none(use.codeloc.ins_addr)))
+        return uses((v, c))
+
+    # Interning uses node by node, in (function, address) order, keeps the uses of each function
+    # close together and so the bitset windows of its live sets small.
+    node_records = []
+    node_livesets = []
+    for (n, state) in nodes:
+        start = len(node_livesets)
+        for ls in state.livesets:
+            cs = callstrings(tuple(r.call_addr for r in ls.ctx.stack))
+            bits = frozenset(use_index(u) for u in ls.uses)
+            node_livesets.append(livesets((cs, bits)))
+
+        node_records.append((n.function_address, n.addr, state.sp, _or_none(state.bp),
+            int(state.bp is not None), start, len(node_livesets) - start))
+
+    sections = {}
+
+    encoded = [s.encode('utf-8') for s in strings.items]
+    offsets = np.zeros(len(encoded) + 1, dtype=_dtypes[b'STRO'])
+    offsets[1:] = np.cumsum([len(s) for s in encoded], dtype=np.uint64)
+    sections[b'STRO'] = offsets
+    sections[b'STRD'] = np.frombuffer(b''.join(encoded), dtype=_dtypes[b'STRD'])
+
+    sections[b'VARS'] = np.array(vars.items, dtype=_dtypes[b'VARS'])
+    sections[b'LOCS'] = np.array(codelocs.items, dtype=_dtypes[b'LOCS'])
+    sections[b'USES'] = np.array(uses.items, dtype=_dtypes[b'USES'])
+
+    calls = [a for cs in callstrings.items for a in cs]
+    starts = np.cumsum([0] + [len(cs) for cs in callstrings.items[:-1]], dtype=np.uint64)
+    sections[b'CSTR'] = np.array(list(zip(starts.tolist(), (len(cs) for cs in callstrings.items))),
+            dtype=_dtypes[b'CSTR'])
+    sections[b'CALL'] = np.array(calls, dtype=_dtypes[b'CALL'])
+
+    lset_records = []
+    words = []
+    for (cs, bits) in livesets.items:
+        if len(bits) == 0:
+            lset_records.append((cs, 0, 0, len(words)))
+            continue
+
+        indexes = np.fromiter(bits, dtype=np.uint64, count=len(bits))
+        first = int(indexes.min()) // 64
+        count = int(indexes.max()) // 64 - first + 1
+        window = np.zeros(count, dtype=np.uint64)
+        np.bitwise_or.at(window, (indexes // 64 - first).astype(np.intp),
+                np.left_shift(np.uint64(1), indexes % 64))
+
+        lset_records.append((cs, first, count, len(words)))
+        words.extend(window.tolist())
+
+    sections[b'LSET'] = np.array(lset_records, dtype=_dtypes[b'LSET'])
+    sections[b'BITS'] = np.array(words, dtype=_dtypes[b'BITS'])
+    sections[b'NODE'] = np.array(node_records, dtype=_dtypes[b'NODE'])
+    sections[b'NLST'] = np.array(node_livesets, dtype=_dtypes[b'NLST'])
+
+    offset = _HEADER.size + _SECTION.size * len(_section_order)
+    table = []
+    for tag in _section_order:
+        offset += -offset % 8
+        table.append((tag, offset, len(sections[tag])))
+        offset += sections[tag].nbytes
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, len(table)))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        for (tag, offset, _) in table:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(sections[tag].tobytes())
+
+class NodeResults:
+    """ The results loaded for a single node.
+
+    :ivar int addr: The address of the node.
+    :ivar int function_addr: The address of its function.
+    :ivar int sp: The frame-space offset of the stack pointer.
+    :ivar bp: The frame-space offset of the base pointer, or None.
+    :ivar list livesets: List of (call string, frozenset of `VarUse`) pairs, where each call
+        string is a tuple of call site addresses, most recent call last.
+    """
+    __slots__ = ('addr', 'function_addr', 'sp', 'bp', 'livesets')
+
+    def __init__(self, addr, function_addr, sp, bp, livesets):
+        self.addr = addr
+        self.function_addr = function_addr
+        self.sp = sp
+        self.bp = bp
+        self.livesets = livesets
+
+    def uses(self):
+        """ All variable uses live at this node, in any context.
+
+        :rtype: set of `VarUse`
+        """
+        return set(u for (_, uses) in self.livesets for u in uses)
+
+    def __repr__(self):
+        return '<NodeResults 0x%x in 0x%x: %d live sets>' % \
+                (self.addr, self.function_addr, len(self.livesets))
+
+class ResultsFile:
+    """ Random-access reader of a results file written by `write_results()`.
+
+    The file is memory-mapped, and its tables are viewed in place; only the records reached by a
+    query are decoded, so the results of one function can be read from a large file without
+    loading the rest of it.
+
+    :param str path:
+    :raises ValueError: If the file is not a results file of a supported version.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (magic, version, _, count) = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError('%s is not a results file' % path)
+            if version != VERSION:
+                raise ValueError('Unsupported results file version %d' % version)
+
+            self._sections = {}
+            for i in range(count):
+                (tag, offset, length) = _SECTION.unpack_from(self._map,
+                        _HEADER.size + i * _SECTION.size)
+                dtype = _dtypes.get(tag)
+                if dtype is None:
+                    l.warning('Skipping unknown section %s', tag)
+                    continue
+                self._sections[tag] = np.frombuffer(self._map, dtype=dtype, count=length,
+                        offset=offset)
+        except BaseException:
+            self._map.close()
+            raise
+
+        self._vars = {}
+        self._uses = {}
+
+    def close(self):
+        self._sections = None
+        self._vars.clear()
+        self._uses.clear()
+        try:
+            self._map.close()
+        except BufferError:
+            # Arrays taken from the tables are still alive; the mapping goes with them
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        """ The number of nodes with results. """
+        return len(self._sections[b'NODE'])
+
+    def functions(self):
+        """ The addresses of all functions with results, in ascending order.
+
+        :rtype: list of int
+        """
+        return [int(a) for a in np.unique(self._sections[b'NODE']['fn_addr'])]
+
+    def results_for_function(self, fn_addr):
+        """ Load the results of every node of a function.
+
+        :param int fn_addr:
+        :rtype: list of NodeResults, ordered by node address
+        """
+        nodes = self._sections[b'NODE']
+        fns = nodes['fn_addr']
+        lo = np.searchsorted(fns, np.uint64(fn_addr), side='left')
+        hi = np.searchsorted(fns, np.uint64(fn_addr), side='right')
+        return [self._node(i) for i in range(lo, hi)]
+
+    def results_for_node(self, fn_addr, addr):
+        """ Load the results of a single node.
+
+        :rtype: NodeResults or None
+        """
+        nodes = self._sections[b'NODE']
+        lo = np.searchsorted(nodes['fn_addr'], np.uint64(fn_addr), side='left')
+        hi = np.searchsorted(nodes['fn_addr'], np.uint64(fn_addr), side='right')
+        i = lo + np.searchsorted(nodes['addr'][lo:hi], np.uint64(addr))
+        if i < hi and nodes['addr'][i] == addr:
+            return self._node(i)
+        return None
+
+    def _node(self, i):
+        rec = self._sections[b'NODE'][i]
+        nlst = self._sections[b'NLST']
+        start = int(rec['livesets'])
+        livesets = [self._liveset(int(j)) for j in nlst[start:start + int(rec['count'])]]
+        return NodeResults(int(rec['addr']), int(rec['fn_addr']), int(rec['sp']),
+                int(rec['bp']) if rec['has_bp'] else None, livesets)
+
+    def _liveset(self, i):
+        rec = self._sections[b'LSET'][i]
+        cs = self._sections[b'CSTR'][rec['callstring']]
+        start = int(cs['start'])
+        callstring = tuple(int(a) for a in self._sections[b'CALL'][start:start + int(cs['count'])])
+
+        words = self._sections[b'BITS'][int(rec['bits']):int(rec['bits']) + int(rec['words'])]
+        bits = np.unpackbits(words.view(np.uint8), bitorder='little')
+        base = int(rec['first_word']) * 64
+        uses = frozenset(self._use(base + int(j)) for j in np.flatnonzero(bits))
+        return (callstring, uses)
+
+    def _use(self, i):
+        use = self._uses.get(i)
+        if use is None:
+            rec = self._sections[b'USES'][i]
+            use = VarUse(self._var(int(rec['var'])), self._codeloc(int(rec['codeloc'])))
+            self._uses[i] = use
+        return use
+
+    def _codeloc(self, i):
+        rec = self._sections[b'LOCS'][i]
+        as_opt = lambda v: None if v == _NONE else int(v)
+        return CodeLocation(int(rec['block_addr']), as_opt(rec['stmt_idx']),
+                ins_addr=as_opt(rec['ins_addr']))
+
+    def _var(self, i):
+        var = self._vars.get(i)
+        if var is not None:
+            return var
+
+        var = _decode_var(self._sections[b'VARS'][i], self._string)
+        self._vars[i] = var
+        return var
+
+    def _string(self, i):
+        offsets = self._sections[b'STRO']
+        return self._sections[b'STRD'][int(offsets[i]):int(offsets[i + 1])].tobytes() \
+                .decode('utf-8')
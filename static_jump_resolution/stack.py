@@ -0,0 +1,126 @@
+from .context import ExecutionCtx
+from .supergraph import DummyNode
+from .vars import frame_offset
+
+from pyvex import IRStmt
+import logging
+
+l = logging.getLogger(__name__)
+
+# Not yet reached by the pre-pass
+_UNSET = object()
+
+def _join(values):
+    first = values[0]
+    return first if all(v == first for v in values) else None
+
+def block_exit_offsets(block, sp, bp, engine, arch):
+    """ Track the stack and base pointers through a block.
+
+    :param angr.block.Block block:
+    :param int sp: The frame-space offset of the stack pointer at block entry, or None.
+    :param int bp: The frame-space offset of the base pointer at block entry, or None.
+    :param SimEngineSJRVEX engine: The engine whose substituted statements to read.
+    :param Arch arch:
+    :return: The pair (sp, bp) at block exit.
+    """
+    (exit_sp, exit_bp) = (sp, bp)
+    for (_, stmt) in engine.substituted_stmts(block)[0]:
+        if type(stmt) is not IRStmt.Put:
+            continue
+        if stmt.offset == arch.sp_offset:
+            exit_sp = frame_offset(stmt.data, sp, bp, arch)
+        elif stmt.offset == arch.bp_offset:
+            exit_bp = frame_offset(stmt.data, sp, bp, arch)
+    return (exit_sp, exit_bp)
+
+class StackDeltas:
+    """ The frame-space offsets (see `StackVar`) of the stack and base pointers at the entry of
+    each block of a function, computed once by `compute()`.
+
+    In the substituted statements of the engine, both registers are only read as of block entry
+    (see `SimEngineSJRVEX.substituted_stmts()`), so the offsets at block entry give the stack
+    variable of every stack access in the block. The table holds the execution context of each
+    block, for `vars_used()` and `vars_modified()` to look up in constant time rather than
+    re-evaluating stack pointer arithmetic on every visit.
+
+    :param int fn_addr:
+    :param dict offsets: Mapping from block addresses to (sp, bp) pairs. Either may be None if it
+        is unknown, e.g. because it differs between paths.
+    """
+
+    __slots__ = ('fn_addr', '_ctxs', '_entry_ctx')
+
+    def __init__(self, fn_addr, offsets):
+        self.fn_addr = fn_addr
+        self._ctxs = dict((addr, ExecutionCtx(fn_addr, sp, bp)) \
+                for (addr, (sp, bp)) in offsets.items())
+        self._entry_ctx = ExecutionCtx(fn_addr, 0, None)
+
+    @classmethod
+    def compute(cls, fn_addr, nodes, predecessors, engine, arch):
+        """ Track the stack and base pointers through the blocks of a function.
+
+        The stack pointer is 0 and the base pointer unknown at function entry. Calls are assumed to
+        preserve both, once the callee has popped the return address the call pushed, if any.
+
+        :param int fn_addr:
+        :param nodes: The nodes of the function.
+        :param predecessors: A function giving the predecessors of a node in the supergraph, e.g.
+            `graph.predecessors`.
+        :param SimEngineSJRVEX engine:
+        :param Arch arch:
+        :rtype: StackDeltas
+        """
+        nodes = sorted(nodes, key=lambda n: n.addr)
+        ret_adjust = arch.bytes if arch.call_pushes_ret else 0
+
+        entries = {}
+        exits = {}
+        changed = True
+        while changed:
+            changed = False
+            for n in nodes:
+                ins = [(0, None)] if n.addr == fn_addr else []
+                for p in predecessors(n):
+                    if type(p) is DummyNode:
+                        if p.dummy_type != 'Dummy_Ret' or p.parent_node not in exits:
+                            continue
+                        (sp, bp) = exits[p.parent_node]
+                        ins.append((None if sp is None else sp + ret_adjust, bp))
+                    elif p in exits:
+                        ins.append(exits[p])
+                if len(ins) == 0:
+                    continue
+
+                entry = (_join([sp for (sp, _) in ins]), _join([bp for (_, bp) in ins]))
+                if entries.get(n, _UNSET) == entry:
+                    continue
+
+                entries[n] = entry
+                if n.is_simprocedure:
+                    exits[n] = entry
+                else:
+                    exits[n] = block_exit_offsets(n.block, entry[0], entry[1], engine, arch)
+                changed = True
+
+        return cls(fn_addr, dict((n.addr, entry) for (n, entry) in entries.items()))
+
+    def offsets(self, addr):
+        """ The pair (sp, bp) at the entry of the block at an address. """
+        ctx = self.ctx(addr)
+        return (ctx.sp, ctx.bp)
+
+    def ctx(self, addr):
+        """ The execution context of the block at an address. Blocks not reached from the function
+        entry are given the context of the entry.
+
+        :rtype: ExecutionCtx
+        """
+        return self._ctxs.get(addr, self._entry_ctx)
+
+    def __len__(self):
+        return len(self._ctxs)
+
+    def __repr__(self):
+        return '<StackDeltas 0x%x (%d blocks)>' % (self.fn_addr, len(self._ctxs))
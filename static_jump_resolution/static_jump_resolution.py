@@ -1,44 +1,75 @@
 from angr.analyses.analysis import Analysis
 from angr.analyses.forward_analysis import ForwardAnalysis
 
-from .engine import SimEngineSJRVEX
+from .def_use import DefUseIndex
+from .engine import SimEngineSJRVEX, is_indirect_jump
+from .jump_table import JumpTableResolver
 from .live_vars import LiveVars
+from .memory import memory_report
+from .query import BlockResults, ResultIndex
+from .resolve import TargetResolver
+from .results import write_results
+from .stack import StackDeltas
 from .supergraph import SupergraphVisitor, DummyNode
 
 import logging
 import operator
 import functools
+import time
 
 l = logging.getLogger(name=__name__)
 l.setLevel(logging.DEBUG)
 
-class BlockResults:
-    def __init__(self, fn, node, state):
-        self.fn = fn
-        self.node = node
-        self.state = state
-
-    @property
-    def addr(self):
-        return self.node.addr
-
-    @property
-    def function_addr(self):
-        return self.fn.addr
+class StaticJumpResolutionAnalysis(ForwardAnalysis, Analysis):
+    """ Interprocedural, context-sensitive slicing of indirect jump targets.
 
-    @property
-    def block(self):
-        return self.node.block
+    :param cfg: A CFG analysis object for the current binary.
+    :param status_callback: (Optional) Passed through to `ForwardAnalysis`.
+    :param SupergraphVisitor graph_visitor: (Optional) The visitor to use. If not given, one is
+        constructed from `cfg`.
+    :param bool sparse: If True, use per-function def/use indexes to evaluate only the gen/kill
+        points of the slices being computed. Nodes that neither define a live variable nor contain
+        an indirect jump pass their input state through unchanged, without being copied or
+        processed, and are not visited at all if they have a single predecessor; see
+        `_propagate()`.
+    :param SimEngineSJRVEX engine: (Optional) The engine to use, e.g. one whose block caches have
+        already been filled. If not given, a new one is constructed.
+    :param int snapshot_interval: (Optional) Take a snapshot of the fixpoint computation every
+        this many node visits, and pass it to `snapshot_callback`.
+    :param snapshot_callback: (Optional) Called with each snapshot. See `fixpoint_snapshot()`.
+    :param dict resume_from: (Optional) A snapshot to continue the fixpoint computation from,
+        instead of starting over. The snapshot must have been taken over the same graph.
+    :param bool resolve: If False, stop after the fixpoint without resolving jump targets;
+        `resolve_jumps()` may be called later.
+    :param bool analyze: If False, do not run the analysis on construction. The fixpoint is then
+        driven by calling `step()` until it returns True or `budget_exceeded` is set, followed
+        by `finish()`.
+    :param int max_visits: (Optional) Stop the fixpoint after this many node visits.
+    :param int max_merges: (Optional) Widen the input state of a node once it has been joined this
+        many times, collapsing all of its calling contexts into one and all of its memory locations
+        into `MEMORY_SUMMARY` (see `LiveVars.collapsed()`). A widened node stays widened, which
+        bounds the number of times it can change.
+    :param float time_budget: (Optional) Stop the fixpoint after this many seconds.
+    :param int profile_interval: (Optional) Take a `memory_report()` every this many node visits,
+        and pass it to `profile_callback`.
+    :param profile_callback: (Optional) Called with each `MemoryReport`. If not given, reports are
+        logged.
+    :param bool delta: If True, propagate changes semi-naively. Each node applies its transfer
+        function only to the uses that reached it since its last visit, and passes on only the
+        uses its output gained; see `_run_on_delta()`. The results are the same as without.
 
-    def __str__(self):
-        s  = "== Results for block at 0x%x in %s:" % (self.addr, self.fn.__repr__())
-        for defn in self.state:
-            s += "\n    %s" % defn
+    When the fixpoint is stopped by `max_visits` or `time_budget`, `budget_exceeded` names the
+    budget, and only the jumps at the nodes visited so far are resolved. Widened nodes are recorded
+    in `widened_nodes`.
+    """
 
-        return s
+    # The attributes in which `ForwardAnalysis` keeps its per-node states
+    _fixpoint_attrs = ('_state_map', '_input_states', '_output_state')
 
-class StaticJumpResolutionAnalysis(ForwardAnalysis, Analysis):
-    def __init__(self, cfg, status_callback=None, graph_visitor=None):
+    def __init__(self, cfg, status_callback=None, graph_visitor=None, sparse=False, engine=None,
+            snapshot_interval=None, snapshot_callback=None, resume_from=None, resolve=True, analyze=True,
+            max_visits=None, max_merges=None, time_budget=None, profile_interval=None,
+            profile_callback=None, delta=False):
         if graph_visitor is None:
             graph_visitor = SupergraphVisitor(cfg)
         elif type(graph_visitor) is not SupergraphVisitor:
@@ -46,45 +77,486 @@ class StaticJumpResolutionAnalysis(ForwardAnalysis, Analysis):
 
         ForwardAnalysis.__init__(self, status_callback=status_callback, graph_visitor=graph_visitor)
 
-        self._engine = SimEngineSJRVEX()
+        self._engine = engine if engine is not None else SimEngineSJRVEX()
+        self._sparse = sparse
+        self._delta = delta
+        self._last_inputs = {}
+        self._output_deltas = {}
+        self._def_use_indexes = {}
+        self._stack_deltas = {}
+        self._result_index = None
+        self.jump_resolutions = {}
+
+        self._snapshot_interval = snapshot_interval
+        self._snapshot_callback = snapshot_callback
+        self._resume_from = resume_from
+        self._resolve = resolve
+        self.iterations = 0
+
+        self._started = False
+        self._slice_remaining = None
+
+        self._max_visits = max_visits
+        self._max_merges = max_merges
+        self._time_budget = time_budget
+        self._deadline = None
+        self._merge_counts = {}
+        self.widened_nodes = {}
+        self.budget_exceeded = None
+
+        self._profile_interval = profile_interval
+        self._profile_callback = profile_callback
 
         l.info('Finished initialization.\nGraph nodes: {}\nGraph edges: {}'.format(
             len(graph_visitor.graph), graph_visitor.graph.size()))
 
-        self._analyze()
+        if analyze:
+            self._analyze()
+
+    @property
+    def node_states(self):
+        """ The per-node states of the analysis, as a dict mapping nodes to `LiveVars`. """
+        if hasattr(self, '_state_map'):
+            return self._state_map
+        return self._output_state
+
+    def result_index(self):
+        """ Get the index over the per-node results, building it if necessary. The index is
+        rebuilt after jumps are resolved.
+
+        :rtype: ResultIndex
+        """
+        if self._result_index is None:
+            self._result_index = ResultIndex(self.node_states, self.jump_resolutions,
+                    self._graph_visitor.graph, self.kb)
+        return self._result_index
 
     def results_for_function(self, fn_addr):
-        states = [BlockResults(self.kb.functions[fn_addr], n, s) for (n, s) in self._state_map.items() if n.function_address == fn_addr]
-        return states
+        """ Get the results of the nodes of a function.
+
+        :rtype: ResultsView
+        """
+        return self.result_index().for_function(fn_addr)
+
+    def memory_report(self):
+        """ Estimate the memory held by the per-node states, the engine's block caches and the
+        supergraph.
+
+        :rtype: MemoryReport
+        """
+        return memory_report(self.node_states, self._engine, self._graph_visitor.graph)
+
+    def _profile(self):
+        report = self.memory_report()
+        if self._profile_callback is not None:
+            self._profile_callback(report)
+        else:
+            l.info('Memory after %d iterations: %s', self.iterations, report.summary())
+
+    def save_results(self, path):
+        """ Write the per-node results to a file in the compact binary format of `write_results()`,
+        to be read back with `ResultsFile`.
+
+        :param str path:
+        """
+        write_results(path, self.node_states)
 
     def _pre_analysis(self):
-        pass
+        if self._resume_from is not None:
+            self.restore_fixpoint_snapshot(self._resume_from)
+            self._resume_from = None
+
+            # A fixpoint stopped by its budget stays stopped
+            if self.budget_exceeded is not None:
+                self.abort()
+
+        if self._time_budget is not None:
+            self._deadline = time.monotonic() + self._time_budget
+
+    def _analysis_core_graph(self):
+        ForwardAnalysis._analysis_core_graph(self)
+
+        # Only out of visits if the fixpoint was not reached on the last visit allowed
+        if self.budget_exceeded is None and self._max_visits is not None \
+                and self.iterations >= self._max_visits and self._graph_visitor.has_next():
+            self._exceed_budget('visits')
 
     def _intra_analysis(self):
-        pass
+        # As with slices, the visit following an abort still runs, so stop ahead of the last one
+        if self._max_visits is not None and self.iterations + 1 >= self._max_visits:
+            self.abort()
+        elif self._deadline is not None and time.monotonic() >= self._deadline \
+                and self._graph_visitor.has_next():
+            self._exceed_budget('time')
+
+        if self._slice_remaining is not None:
+            # Let the current visit be the last of the slice
+            self._slice_remaining -= 1
+            if self._slice_remaining <= 0:
+                self.abort()
+
+        if self._snapshot_interval is not None and self._snapshot_callback is not None \
+                and self.iterations > 0 and self.iterations % self._snapshot_interval == 0:
+            self._snapshot_callback(self.fixpoint_snapshot())
+        if self._profile_interval is not None \
+                and self.iterations > 0 and self.iterations % self._profile_interval == 0:
+            self._profile()
 
     def _post_analysis(self):
-        pass
+        if len(self.widened_nodes) > 0:
+            l.warning('Widened the states of %d nodes', len(self.widened_nodes))
+
+        if not self._resolve:
+            return
+        if self.budget_exceeded is None:
+            self.resolve_jumps()
+        else:
+            self.resolve_jumps(self.visited_nodes)
+
+    def _exceed_budget(self, budget):
+        l.warning('Stopping the fixpoint after %d iterations: %s budget exceeded',
+                self.iterations, budget)
+        self.budget_exceeded = budget
+        self.abort()
+
+    def step(self, max_visits=None):
+        """ Advance the fixpoint computation by at most `max_visits` node visits.
+
+        For analyses constructed with `analyze=False`. The traversal picks up where the previous
+        step left off, so the fixpoint may be computed in bounded slices, interleaved with other
+        work.
+
+        :param int max_visits: (Optional) The size of the slice. If None, run to the fixpoint.
+        :return: True if the fixpoint has been reached. False if not, including when the fixpoint
+            was stopped by a budget; `budget_exceeded` is then set, and further steps do nothing.
+        """
+        if not self._started:
+            self._started = True
+            self._pre_analysis()
+        if self.budget_exceeded is not None:
+            return False
+
+        self._should_abort = False
+        self._slice_remaining = max_visits
+        try:
+            self._analysis_core_graph()
+        finally:
+            self._slice_remaining = None
+
+        return self.budget_exceeded is None and not self._graph_visitor.has_next()
+
+    def finish(self):
+        """ Complete an analysis driven by `step()`, resolving jump targets unless constructed
+        with `resolve=False`.
+        """
+        self._post_analysis()
+
+    @property
+    def visited_nodes(self):
+        """ The nodes the fixpoint computation has visited so far. """
+        return list(self.node_states)
+
+    def fixpoint_snapshot(self):
+        """ Capture the progress of the fixpoint computation: the per-node states, the traversal
+        worklist, and which budget stopped it, if any.
+
+        The snapshot shares state objects with the running analysis, so it must be serialized (or
+        copied) before the analysis continues.
+
+        :return: A dict, to be passed as `resume_from` to a new analysis over the same graph.
+        """
+        return {
+            'iterations': self.iterations,
+            'merge_counts': dict(self._merge_counts),
+            'widened': dict(self.widened_nodes),
+            'budget_exceeded': self.budget_exceeded,
+            'states': dict((attr, dict(getattr(self, attr))) \
+                    for attr in self._fixpoint_attrs if hasattr(self, attr)),
+            'traversal': self._graph_visitor.traversal_state(),
+        }
+
+    def restore_fixpoint_snapshot(self, snapshot):
+        """ Continue the fixpoint computation from a snapshot taken by `fixpoint_snapshot()`.
+
+        :param dict snapshot:
+        """
+        self.iterations = snapshot['iterations']
+        self._merge_counts.update(snapshot.get('merge_counts', {}))
+        self.widened_nodes.update(snapshot.get('widened', {}))
+        self.budget_exceeded = snapshot.get('budget_exceeded')
+        for (attr, states) in snapshot['states'].items():
+            if hasattr(self, attr):
+                getattr(self, attr).update(states)
+        self._graph_visitor.restore_traversal_state(snapshot['traversal'])
+
+    def resolve_jumps(self, nodes=None):
+        """ Statically resolve the targets of every indirect jump in the supergraph.
+
+        The results are stored in `self.jump_resolutions`, keyed by the address of each jump
+        instruction. The walk out of each jump's block is seeded from the jump's slice in its
+        fixpoint state, if it has one. See `TargetResolver` for details.
+
+        :param nodes: (Optional) Iterable of nodes. If given, only the jumps at these nodes are
+            resolved, e.g. the `visited_nodes` of an unfinished fixpoint.
+        :return: dict mapping jump addresses to `JumpResolution`.
+        """
+        graph = self._graph_visitor.graph
+        jump_tables = JumpTableResolver(self.project, self._engine, graph)
+        resolver = TargetResolver(self.project, self._engine, graph, jump_tables=jump_tables,
+                contexts=self.block_ctx)
+
+        # Resolution may expand a lazily constructed supergraph
+        for n in list(graph.nodes) if nodes is None else list(nodes):
+            if type(n) is DummyNode or n.is_simprocedure:
+                continue
+            if is_indirect_jump(n.block) is None:
+                continue
+
+            resolution = resolver.resolve(n, self.node_states.get(n))
+            self.jump_resolutions[resolution.addr] = resolution
+
+        self._result_index = None
+
+        jump_tables.memory.close()
+
+        l.info('Resolved %d of %d indirect jumps', \
+                sum(1 for r in self.jump_resolutions.values() if r.resolved),
+                len(self.jump_resolutions))
+
+        return self.jump_resolutions
+
+    def jump_targets(self, jump_addr):
+        """ Get the resolved targets of the indirect jump at the given address.
+
+        :param int jump_addr: The address of the jump instruction.
+        :return: A frozenset of int, or None if the jump is unknown or unresolved.
+        """
+        resolution = self.jump_resolutions.get(jump_addr)
+        if resolution is None:
+            return None
+        return resolution.targets
+
+    def def_use_index(self, fn_addr):
+        """ Get the def/use index for the given function, building it if necessary.
+
+        :param int fn_addr:
+        :rtype: DefUseIndex
+        """
+        index = self._def_use_indexes.get(fn_addr)
+        if index is not None:
+            return index
+
+        deltas = self.stack_deltas(fn_addr)
+        summaries = {}
+        for n in self._graph_visitor.function_nodes(fn_addr):
+            if n.is_simprocedure:
+                continue
+            summaries[n] = self._engine.summarize(n.block, deltas.ctx(n.addr), self.project.arch)
+
+        index = DefUseIndex(fn_addr, summaries)
+        self._def_use_indexes[fn_addr] = index
+        return index
+
+    def stack_deltas(self, fn_addr):
+        """ Get the stack and base pointer offsets of the blocks of a function, computing them if
+        necessary.
+
+        :param int fn_addr:
+        :rtype: StackDeltas
+        """
+        deltas = self._stack_deltas.get(fn_addr)
+        if deltas is None:
+            deltas = StackDeltas.compute(fn_addr, self._graph_visitor.function_nodes(fn_addr),
+                    self._graph_visitor.graph.predecessors, self._engine, self.project.arch)
+            self._stack_deltas[fn_addr] = deltas
+        return deltas
+
+    def block_ctx(self, node):
+        """ The execution context of a block node, with the stack and base pointer offsets at
+        its entry.
+
+        :rtype: ExecutionCtx
+        """
+        return self.stack_deltas(node.function_address).ctx(node.addr)
+
+    def add_boundary_state(self, node, state):
+        """ Add to the input of a node a state from outside the traversal, e.g. the output of a
+        predecessor in another shard of a distributed fixpoint, and schedule the node to be visited.
+        The state is joined with the node's other inputs.
+
+        :param node: A node of the traversal.
+        :param LiveVars state:
+        """
+        self._input_states[node].append(state)
+        self._graph_visitor.revisit_node(node)
 
     def _initial_abstract_state(self, node):
-        return LiveVars(self.project.arch)
+        return LiveVars(self.project.arch, node.function_address)
 
     def _run_on_node(self, node, state):
-        state = state.copy()
+        # Counted here, as `_intra_analysis()` also runs once more when the worklist is exhausted
+        self.iterations += 1
+        if self._delta:
+            (changed, output) = self._run_on_delta(node, state)
+        else:
+            # Deciding the change here keeps `_merge_states()` to the joins of input states
+            output = self._transfer(node, state)
+            changed = output != self._output_state.get(node)
+            if changed:
+                # Not stored by `ForwardAnalysis` when the change is decided by the node visit
+                self._output_state[node] = output
+
+        if changed and self._sparse:
+            # Passed on here instead of by `ForwardAnalysis`
+            self._propagate(node, output)
+            return False, output
+        return changed, output
+
+    def _propagate(self, node, output):
+        """ Pass the changed output of a node on to its successors, in sparse mode.
+
+        Successors that pass the state through unchanged (dummy nodes, simprocedures, and blocks
+        the def/use index finds no gen or kill point in) and have no other predecessor are not
+        visited. Their input and output are set here, and the state is passed on to their own
+        successors in turn. Only the successors reached this way that do need a visit are
+        scheduled.
+        """
+        delta = self._output_deltas.pop(node, output) if self._delta else output
+        live = None
+        relevant = {}
+
+        pending = [node]
+        passed = {node}
+        while len(pending) > 0:
+            pred = pending.pop()
+            for succ in self._graph_visitor.successors(pred):
+                single = sum(1 for _ in self._graph_visitor.predecessors(succ)) == 1
+
+                if single and succ not in passed:
+                    if type(succ) is DummyNode or succ.is_simprocedure:
+                        through = True
+                    else:
+                        fn_relevant = relevant.get(succ.function_address)
+                        if fn_relevant is None:
+                            if live is None:
+                                live = output.live_vars()
+                            fn_relevant = self.def_use_index(succ.function_address) \
+                                    .relevant_nodes(live)
+                            relevant[succ.function_address] = fn_relevant
+                        through = succ not in fn_relevant and \
+                                self.def_use_index(succ.function_address).summary(succ) is not None
+
+                    if through:
+                        passed.add(succ)
+                        self._input_states[succ] = [output]
+                        if self._delta:
+                            self._last_inputs[succ] = output
+                        if self._output_state.get(succ) != output:
+                            self._output_state[succ] = output
+                            pending.append(succ)
+                        continue
+
+                if single:
+                    self._input_states[succ] = [output]
+                else:
+                    # What a passed node's output gained may differ from what `node`'s did
+                    self._input_states[succ].append(delta if pred is node else output)
+                self._graph_visitor.revisit_node(succ)
+
+    def _transfer(self, node, state):
+        """ Apply the transfer function of a node to a state. The state is not modified, but may be
+        returned as is.
+
+        Blocks are transferred with the tables of their `BlockTransfer`, which have the effect of
+        processing the block with the engine, without walking its statements on every visit.
+        """
+        if type(node) is DummyNode or node.is_simprocedure:
+            if self._sparse:
+                return state
+            return state.copy()
+
+        if self._sparse:
+            summary = self.def_use_index(node.function_address).summary(node)
+            if summary is None or not summary.is_relevant(state.live_vars()):
+                return state
 
-        if type(node) is not DummyNode and not node.is_simprocedure:
-            state = self._engine.process(state, block=node.block)
+        transfer = self._engine.transfer(node.block, self.block_ctx(node), self.project.arch)
+        return transfer.apply(state)
 
-        return None, state
+    def _run_on_delta(self, node, state):
+        """ Visit a node in delta mode.
+
+        The transfer functions distribute over the union of live sets in the same context: each
+        statement kills a fixed set of variables, and generates uses either unconditionally or if
+        one of the variables it modifies is live. So as long as the input of a node only grows, its
+        output is its last output joined with the transfer of what the input gained. When the input
+        has lost uses, e.g. after widening, the node is processed in full.
+
+        The change is decided here rather than by merging the old and new outputs, and the uses the
+        output gained are kept for `_add_input_state()` to pass on.
+        """
+        last_input = self._last_inputs.get(node)
+        last_output = self._output_state.get(node)
+        self._last_inputs[node] = state
+
+        if last_input is None or last_output is None \
+                or len(last_input.difference(state).livesets) > 0:
+            output = self._transfer(node, state)
+            changed = last_output is None or output != last_output
+            self._output_deltas[node] = output
+        else:
+            delta = state.difference(last_input)
+            if len(delta.livesets) == 0:
+                return False, last_output
+
+            added = self._transfer(node, delta).difference(last_output)
+            if len(added.livesets) == 0:
+                return False, last_output
+
+            output = last_output | added
+            changed = True
+            self._output_deltas[node] = added
+
+        if changed:
+            # Not stored by `ForwardAnalysis` when the change is decided by the node visit
+            self._output_state[node] = output
+        return changed, output
+
+    def _add_input_state(self, node, input_state):
+        """ In delta mode, nodes with several predecessors are given only the uses the output of
+        `node` gained, to be merged into their previous input. Their previous input already holds
+        the rest of the output, so the merged input is the same.
+        """
+        if not self._delta:
+            return ForwardAnalysis._add_input_state(self, node, input_state)
+
+        delta = self._output_deltas.pop(node, input_state)
+        successors = set(self._graph_visitor.successors(node))
+        for succ in successors:
+            if sum(1 for _ in self._graph_visitor.predecessors(succ)) == 1:
+                self._input_states[succ] = [input_state]
+            else:
+                self._input_states[succ].append(delta)
+        return successors
 
     def _merge_states(self, node, *states):
         l.info('Called _merge_states(%s, %s)' % \
                 (node, '[' + ', '.join(str(s) for s in states) + ']'))
 
-        state0 = self._state_map.get(node, LiveVars(self.project.arch))
+        state0 = self.node_states.get(node, LiveVars(self.project.arch, node.function_address))
         merged = functools.reduce(operator.or_,
                 (s for s in states if s is not None),
-                LiveVars(self.project.arch))
+                LiveVars(self.project.arch, node.function_address))
+
+        # Only called to join the input states of a node, each call one join
+        if self._max_merges is not None:
+            count = self._merge_counts.get(node, 0) + 1
+            self._merge_counts[node] = count
+            if count > self._max_merges and node not in self.widened_nodes:
+                l.info('Widening %s after %d merges', node, count)
+                self.widened_nodes[node] = count
+            if node in self.widened_nodes:
+                merged = merged.collapsed()
 
         if merged == state0:
             # Reached fixpoint
@@ -3,8 +3,13 @@ from angr.analyses.forward_analysis.visitors.call_graph import CallGraphVisitor
 from angr.knowledge_plugins.functions import Function
 from angr.analyses.cfg.cfg_utils import CFGUtils
 
-from .supergraph import supergraph_from_cfg, DummyNode
+from .supergraph import supergraph_from_cfg, return_index, entry_index, LazySupergraph, \
+        ReturnIndex, EntryIndex, DummyNode
+from .traversal import CSRGraph
 
+import numpy as np
+
+import copy
 import pyvex
 
 def node_is_entry(node):
@@ -12,14 +17,17 @@ def node_is_entry(node):
 
     :param (CFGNode or DummyNode) node:
     """
-    return type(node) is CFGNode and node.function_address == node.addr
+    return type(node) is not DummyNode and node.function_address == node.addr
 
 def node_is_exit(node):
-    """ Is a node an exit node of its function?
+    """ Is a node an exit node of its function? Both returning nodes and the dummy exit node of a
+    function are exit nodes.
 
     :param (CFGNode or DummyNode) node:
     """
-    return type(node) is CFGNode and node.has_return
+    if type(node) is DummyNode:
+        return node.dummy_type == 'Dummy_Exit'
+    return node.has_return
 
 def node_is_call(node):
     """ Is a node a dummy call node?
@@ -73,48 +81,47 @@ class Worklist:
         self._call_list = []
         self._ret_list = []
 
+    def priority(self, node):
+        """ The rank of the list to which a node is added. Nodes are taken from a list only when all
+        lists of lesser rank are empty.
+
+        :param (CFGNode or DummyNode) node:
+        :rtype: int
+        """
+        forward = self._direction == 'forward'
+        if node_is_call(node):
+            return 2 if forward else 3
+        elif node_is_ret(node):
+            return 3 if forward else 2
+        elif node_is_entry(node):
+            return 0 if forward else 1
+        elif node_is_exit(node):
+            return 1 if forward else 0
+        else:
+            return 0
+
+    def _lists(self):
+        """ The lists, in order of rank. """
+        if self._direction == 'forward':
+            return (self._intra_list, self._fn_boundary_list, self._call_list, self._ret_list)
+        else:
+            return (self._intra_list, self._fn_boundary_list, self._ret_list, self._call_list)
+
     def add(self, node):
         """ Add a node to the worklist.
 
         :param (CFGNode or DummyNode) node:
         """
-        if node_is_entry(n):
-            if self._direction == 'forward':
-                self._intra_list.append(n)
-            else:
-                self._fn_boundary_list.append(n)
-        elif node_is_exit(n):
-            if self._direction == 'forward':
-                self._fn_boundary_list.append(n)
-            else:
-                self._intra_list.append(n)
-        elif node_is_call(n):
-            self._call_list.append(n)
-        elif node_is_ret(n):
-            self._ret_list.append(n)
-        else:
-            self._intra_list.append(n)
+        self._lists()[self.priority(node)].append(node)
 
     def next_node(self):
         """ Remove and return the next node in the worklist.
 
         Returns `None` if the worklist is empty.
         """
-        if len(self._intra_list) > 0:
-            return self._intra_list.pop()
-        elif len(self._fn_boundary_list) > 0:
-            return self._fn_boundary_list.pop()
-
-        if self._direction == 'forward':
-            if len(self._call_list) > 0:
-                return self._call_list.pop()
-            elif len(self._ret_list) > 0:
-                return self._ret_list.pop()
-        else:
-            if len(self._ret_list) > 0:
-                return self._ret_list.pop()
-            elif len(self._call_list) > 0:
-                return self._call_list.pop()
+        for nodes in self._lists():
+            if len(nodes) > 0:
+                return nodes.pop()
 
         return None
 
@@ -150,13 +157,13 @@ class Worklist:
 
         :param networkx.DiGraph supergraph: A graph of (CFGNode or DummyNode)
         """
-        visited = set()
+        visited = set(self)
         while self.has_next():
-            n = self.next()
+            n = self.next_node()
             if self._direction == "forward":
-                succs = supergraph.get_successors(n)
+                succs = supergraph.successors(n)
             else:
-                succs = supergraph.get_predecessors(n)
+                succs = supergraph.predecessors(n)
 
             for s in succs:
                 if s not in visited:
@@ -174,7 +181,22 @@ class Worklist:
     def __iter__(self):
         wl = self.copy()
         while len(wl) > 0:
-            yield wl.next()
+            yield wl.next_node()
+
+def _copy_traversal_value(value):
+    """ Copy one attribute of a traversal state, so that neither copy sees later updates to the other.
+
+    :param value: A `Worklist`, a set of nodes, or a dict from nodes to sets of nodes
+    """
+    if isinstance(value, Worklist):
+        return value.copy()
+    elif isinstance(value, dict):
+        newvalue = copy.copy(value)
+        for (k, v) in value.items():
+            newvalue[k] = copy.copy(v)
+        return newvalue
+    else:
+        return copy.copy(value)
 
 class SupergraphVisitor(GraphVisitor):
     """ A GraphVisitor for whole-program, interprocedural analysis.
@@ -204,12 +226,26 @@ class SupergraphVisitor(GraphVisitor):
     return nodes take precedence over call nodes, and function exits take
     precedence over function entries.
 
+    If `lazy` is True, the supergraph is instead a `LazySupergraph`, which
+    constructs each function's part of the supergraph the first time the
+    traversal reaches it, so that functions never reached are never normalized
+    or lifted.
+
     :param cfg: A CFG analysis object for the current binary.
     :param str direction: The direction of traversal, either 'forward'
         (default) or 'backward'.
+    :param bool lazy: Whether to construct the supergraph on demand.
+    :param iterable start_points: (Optional) The nodes to start traversal from, instead of
+        discovering them. Each may be a node, a function or node address, or a function or symbol
+        name, e.g. the exported symbols or interrupt vectors of firmware without a `main`. See
+        `EntryIndex.resolve()`.
+    :param iterable functions: (Optional) The addresses of the functions to restrict the traversal
+        to, e.g. those of one shard of a distributed fixpoint. The nodes of other functions are left
+        out of the start points and traversal successors, but not out of the traversal
+        predecessors of a node, whose inputs are then taken from elsewhere.
     """
 
-    def __init__(self, cfg, direction='forward'):
+    def __init__(self, cfg, direction='forward', lazy=False, start_points=None, functions=None):
         if type(direction) is not str:
             raise TypeError()
         if direction not in ('forward', 'backward'):
@@ -217,52 +253,153 @@ class SupergraphVisitor(GraphVisitor):
 
         self._cfg = cfg
         self._direction = direction
-        self._supergraph = supergraph_from_cfg(cfg)
+        self._supergraph = LazySupergraph(cfg) if lazy else supergraph_from_cfg(cfg)
         self._worklist = Worklist(self._direction)
+        self._csr = None
+        self._functions = None if functions is None else frozenset(functions)
+
+        self._entry_index = entry_index(cfg)
+        if start_points is None:
+            self._start_points = self._find_startpoints()
+        else:
+            self._start_points = self.resolve_start_points(start_points)
 
         self.reset()
 
+    def resolve_start_points(self, points):
+        """ Find the nodes designated by user-supplied start points.
+
+        :param iterable points: See the `start_points` parameter.
+        :return: list of nodes.
+        :raises ValueError: If a start point cannot be found.
+        """
+        nodes = []
+        for p in points:
+            n = self._entry_index.resolve(p)
+            if n is None:
+                raise ValueError('Unknown start point %r' % (p,))
+            nodes.append(n)
+        return nodes
+
+    @property
+    def entry_index(self):
+        """ The entry/exit point index of the CFG.
+
+        :rtype: EntryIndex
+        """
+        return self._entry_index
+
+    def function_nodes(self, fn_addr):
+        """ The CFG nodes of a function, whether or not a lazy supergraph has expanded it yet.
+
+        :param int fn_addr:
+        :rtype: list of CFGNode
+        """
+        return return_index(self._cfg).function_nodes(fn_addr)
+
+    def traverses(self, node):
+        """ Is a node part of the traversal, i.e. not left out by the restriction to `functions`?
+
+        :param (CFGNode or DummyNode) node:
+        """
+        return self._functions is None or node.function_address in self._functions
+
     def _find_startpoints(self):
         """ Find the start points in the supergraph. """
         if self._direction == "forward":
-            self._find_entry_points()
+            return self._find_entry_points()
         else:
-            self._find_exit_points()
+            return self._find_exit_points()
 
     def _find_entry_points(self):
+        index = self._entry_index
+
         # Try to find a main function and return its entry node
-        for fn in self._cfg.functions.values():
-            if fn.name == 'main':
-                return [self._cfg.model.get_node(fn.addr)]
+        main = index.function_named('main')
+        if main is not None:
+            return [index.entry_node(main)]
 
         # Fallback: all entry blocks of all functions that have no incoming call edges
-        fn_entries = [self._cfg.model.get_node(fn.addr) for fn in self._cfg.functions.values()]
-        entries = [n for n in fn_starts if len(self._cfg.model.get_predecessors(n, jumpkind='Ijk_Call')) == 0]
-
+        entries = index.uncalled_entries()
         if len(entries) > 0:
             return entries
         else:
             #Fallback fallback: all function start nodes
-            return fn_entries
+            return index.entries()
 
     def _find_exit_points(self):
-        # Try to find a main function and return its exit node(s)
-        for fn in self._cfg.functions.values():
-            if fn.name == 'main':
-                return [n for n in self._cfg.model.nodes() if n.function_address == fn.addr and n.has_return]
+        index = self._entry_index
+
+        # Try to find a main function and return its exit node
+        main = index.function_named('main')
+        if main is not None:
+            exit = return_index(self._cfg).exit_node(main)
+            return [exit] if exit is not None else []
 
         # Fallback: all nodes with no successors
-        exits = [n for n in self._cfg.model.nodes() if len(n.successors) == 0]
+        exits = index.sinks()
         if len(exits) > 0:
             return exits
         else:
             # Fallback fallback: all nodes with a return
-            return [n for n in self._cfg.model.nodes() if n.has_return]
+            return index.returning_nodes()
+
+    # Attributes holding the progress of a traversal, as opposed to the graph being traversed
+    _traversal_attrs = ('_worklist', '_nodes_set', '_reached_fixedpoint', '_pending_nodes')
+
+    def traversal_state(self):
+        """ Get a copy of the progress of the current traversal.
+
+        The result can be passed to `restore_traversal_state()` on this visitor, or on an unpickled
+        copy of it, to continue the traversal where it left off.
+
+        :rtype: dict
+        """
+        return dict((attr, _copy_traversal_value(getattr(self, attr))) \
+                for attr in self._traversal_attrs if hasattr(self, attr))
+
+    def restore_traversal_state(self, state):
+        """ Continue a traversal from a state previously returned by `traversal_state()`.
+
+        :param dict state:
+        """
+        for (attr, value) in state.items():
+            setattr(self, attr, _copy_traversal_value(value))
 
     def reset(self):
         self._worklist.clear()
+        self._nodes_set = set()
+        self._reached_fixedpoint = set()
         for n in self.startpoints():
-            self._worklist.add(n)
+            self._add(n)
+
+    def _add(self, node):
+        if node not in self._nodes_set:
+            self._worklist.add(node)
+            self._nodes_set.add(node)
+
+    def next_node(self):
+        """ Remove and return the next node to visit, or None if there are none left. """
+        node = self._worklist.next_node()
+        if node is not None:
+            self._nodes_set.discard(node)
+        return node
+
+    def has_next(self):
+        """ Are there nodes left to visit? """
+        return self._worklist.has_next()
+
+    def revisit_successors(self, node, include_self=True):
+        """ Schedule the traversal successors of a node, and optionally the node itself, to be
+        visited again. """
+        if include_self:
+            self._add(node)
+        for s in self.successors(node):
+            self._add(s)
+
+    def revisit_node(self, node):
+        """ Schedule a node to be visited again. """
+        self._add(node)
 
     def startpoints(self):
         """ A list of all start points in the program.
@@ -273,7 +410,7 @@ class SupergraphVisitor(GraphVisitor):
 
         :return: A list of CFGNode or DummyNode.
         """
-        return [n for n in self._start_points]
+        return [n for n in self._start_points if self.traverses(n)]
 
     def successors(self, node):
         """ A list of the traversal successors of the given node.
@@ -285,9 +422,10 @@ class SupergraphVisitor(GraphVisitor):
         :return: An iterator over (CFGNode or DummyNode)
         """
         if self._direction == "forward":
-            return [n for n in self._supergraph.successors(node)]
+            succs = self._supergraph.successors(node)
         else:
-            return [n for n in self._supergraph.predecessors(node)]
+            succs = self._supergraph.predecessors(node)
+        return [n for n in succs if self.traverses(n)]
 
     def predecessors(self, node):
         """ A list of the traversal predecessors of the given node.
@@ -299,9 +437,9 @@ class SupergraphVisitor(GraphVisitor):
         :return: An iterator over CFGNode or DummyNode
         """
         if self._direction == "forward":
-            return [n for n in self._supergraph.get_predecessors(node)]
+            return [n for n in self._supergraph.predecessors(node)]
         else:
-            return [n for n in self._supergraph.get_successors(node)]
+            return [n for n in self._supergraph.successors(node)]
 
     def sort_nodes(self, nodes=None):
         """ A sorted list of the nodes of the supergraph.
@@ -318,18 +456,53 @@ class SupergraphVisitor(GraphVisitor):
         :return: A list of (CFGNode or DummyNode)
         :rtype: list
         """
-        wl = Worklist(self.startpoints())
+        # The prioritized order is inherently one node at a time, which the worklist walks faster
+        # than a per-node loop over the CSR arrays. On a lazy graph, it also constructs the graph
+        # as it goes.
+        order = Worklist(self._direction, self.startpoints()).exhaust(self._supergraph)
+
         if nodes is None:
-            return [n for n in wl.exhaust(self._supergraph)]
+            return [n for n in order]
         else:
             nodes = set(nodes)
-            return [n for n in wl.exhaust(self._supergraph) if n in nodes]
+            return [n for n in order if n in nodes]
+
+    def csr(self):
+        """ Get the integer-indexed (CSR) adjacency of the supergraph used for bulk traversals,
+        building it if necessary.
+
+        A lazily constructed supergraph is fully expanded first.
+
+        :rtype: CSRGraph
+        """
+        if self._csr is None:
+            graph = self._supergraph
+            if type(graph) is LazySupergraph:
+                graph.expand_all()
+                graph = graph.materialized
+            self._csr = CSRGraph(graph)
+        return self._csr
+
+    def reachable(self, nodes=None, reverse=False):
+        """ The set of nodes reachable in traversal order from the given nodes.
+
+        :param iterable nodes: (Optional) The nodes to start from. Defaults to the start points.
+        :param bool reverse: If True, find the nodes from which any of the given nodes is reachable
+            in traversal order instead.
+        :rtype: set
+        """
+        if nodes is None:
+            nodes = self.startpoints()
+
+        csr = self.csr()
+        backward = (self._direction == 'backward') != reverse
+        return set(csr.nodes_of(np.flatnonzero(csr.reachable(nodes, reverse=backward))))
 
     @property
     def graph(self):
         """ Get the supergraph in use by this SupergraphVisitor.
 
         :return: The underlying supergraph.
-        :rtype:  networkx.DiGraph
+        :rtype:  networkx.DiGraph or LazySupergraph
         """
         return self._supergraph
@@ -1,24 +1,44 @@
+from ..interning import Interned
+
 import networkx as nx
 
 from enum import Enum, auto
+import weakref
+
+class DummyNode(Interned):
+    """ A dummy node in a supergraph, representing a call to or return from a procedure, or the
+    exit of a procedure. Interned (see `Interned`) by the identity of the parent node: `CFGNode`s
+    compare equal by address and size, so equal nodes of different functions or CFGs would
+    otherwise share their dummy nodes.
 
-class DummyNode:
-    """ A dummy node in a supergraph, representing a call to or return from a procedure.
+    For 'Dummy_Call' and 'Dummy_Ret' nodes, the parent node is the calling node. For 'Dummy_Exit'
+    nodes, which join all the returning nodes of a procedure, it is the entry node of the procedure.
 
-    :param CFGNode parent_node: The parent (calling) node.
-    :param str dummy_type:   The type (either 'Dummy_Call' or 'Dummy_Ret') of this dummy node.
+    :param CFGNode parent_node: The parent node.
+    :param str dummy_type:   The type ('Dummy_Call', 'Dummy_Ret' or 'Dummy_Exit') of this dummy node.
     """
 
     __slots__ = ['_parent_node', '_dummy_type']
 
-    def __init__(self, parent_node, dummy_type):
+    def _init(self, parent_node, dummy_type):
         self._parent_node = parent_node
 
-        if dummy_type not in ('Dummy_Call', 'Dummy_Ret'):
-            raise ValueError("Expected 'Dummy_Call' or 'Dummy_Ret'")
+        if dummy_type not in ('Dummy_Call', 'Dummy_Ret', 'Dummy_Exit'):
+            raise ValueError("Expected 'Dummy_Call', 'Dummy_Ret' or 'Dummy_Exit'")
 
         self._dummy_type = dummy_type
 
+    def _args(self):
+        return (self._parent_node, self._dummy_type)
+
+    @classmethod
+    def _key(cls, parent_node, dummy_type):
+        return (id(parent_node), dummy_type)
+
+    def _is_value(self, parent_node, dummy_type):
+        # A node holds its parent, so no other node's id should match while it is in the table
+        return self._parent_node is parent_node
+
     @property
     def parent_node(self):
         return self._parent_node
@@ -39,17 +59,235 @@ class DummyNode:
         """
         return self._parent_node.function_address
 
-    def __eq__(self, other):
-        return type(other) is DummyNode and \
-                self.parent_node == other.parent_node and \
-                self.dummy_type == other.dummy_type
-
-    def __hash__(self):
-        return hash(('DummyNode', self.parent_node, self.dummy_type))
+    @property
+    def function_address(self):
+        """ Alias of `fn_addr`, for uniformity with `CFGNode`. """
+        return self.fn_addr
 
     def __repr__(self):
+        if self._dummy_type == 'Dummy_Exit':
+            return "<%s (0x%x)>" % (self._dummy_type, self.fn_addr)
         return "<%s (0x%x)>" % (self._dummy_type, self.call_addr)
 
+class ReturnIndex:
+    """ An index of the nodes of each function in a CFG, of its returning nodes, and of its exit
+    node.
+
+    Each function with at least one returning node (a node that has a return, or a simprocedure)
+    is given a single dummy exit node. The supergraph routes each return through it, so that a
+    function with `r` returning nodes called from `c` call sites contributes `r + c` return edges
+    rather than `r * c`.
+
+    Use `return_index()` to get the index of a CFG, shared by all supergraphs built from it.
+
+    :param cfg: The input CFG analysis.
+    """
+
+    def __init__(self, cfg):
+        self._nodes = {}
+        self._rets = {}
+        self._entries = {}
+
+        for n in cfg.graph.nodes:
+            addr = n.function_address
+            self._nodes.setdefault(addr, []).append(n)
+            rets = self._rets.setdefault(addr, [])
+            if n.has_return or n.is_simprocedure:
+                rets.append(n)
+            if n.addr == addr:
+                self._entries[addr] = n
+
+        self._exits = {}
+        for (addr, rets) in self._rets.items():
+            if len(rets) > 0:
+                self._exits[addr] = DummyNode(self._entries.get(addr, rets[0]), 'Dummy_Exit')
+
+        self._size = len(cfg.graph)
+
+    def function_nodes(self, fn_addr):
+        """ The nodes of a function.
+
+        :param int fn_addr:
+        :rtype: list of CFGNode
+        """
+        return self._nodes.get(fn_addr, [])
+
+    def returns(self, fn_addr):
+        """ The returning nodes of a function.
+
+        :param int fn_addr:
+        :rtype: list of CFGNode
+        """
+        return self._rets.get(fn_addr, [])
+
+    def exit_node(self, fn_addr):
+        """ The dummy exit node of a function, or None if it has no returning nodes.
+
+        :param int fn_addr:
+        :rtype: DummyNode or None
+        """
+        return self._exits.get(fn_addr)
+
+    def exit_edges(self, fn_addr):
+        """ The edges from each returning node of a function to its exit node.
+
+        :param int fn_addr:
+        :return: list of (source, dest, data) edges.
+        """
+        exit = self._exits.get(fn_addr)
+        if exit is None:
+            return []
+        return [(r, exit, {'jumpkind': 'Ijk_Ret'}) for r in self._rets[fn_addr]]
+
+    def functions(self):
+        """ The addresses of all functions with at least one node. """
+        return self._rets.keys()
+
+# CFG analysis -> ReturnIndex
+_return_indexes = weakref.WeakKeyDictionary()
+
+def return_index(cfg):
+    """ Get the `ReturnIndex` of a (normalized) CFG, building it if necessary.
+
+    The index is cached for as long as the CFG analysis is alive, and rebuilt if nodes have been
+    added to or removed from its graph since.
+
+    :param cfg: The input CFG analysis.
+    :rtype: ReturnIndex
+    """
+    index = _return_indexes.get(cfg)
+    if index is None or index._size != len(cfg.graph):
+        index = ReturnIndex(cfg)
+        _return_indexes[cfg] = index
+    return index
+
+class EntryIndex:
+    """ An index of the entry and exit points of the functions in a CFG.
+
+    Built in one pass over the CFG's nodes and edges. It records each function's entry node and
+    name, the number of direct call edges into each function, and the nodes without successors,
+    so that start points can be looked up without rescanning the CFG.
+
+    Use `entry_index()` to get the index of a CFG, shared by all supergraphs built from it.
+
+    :param cfg: The input CFG analysis.
+    """
+
+    def __init__(self, cfg):
+        self._cfg = cfg
+        self._rets = return_index(cfg)
+
+        self._entries = {}
+        self._sinks = []
+        for n in cfg.graph.nodes:
+            if n.addr == n.function_address:
+                self._entries[n.addr] = n
+            if cfg.graph.out_degree(n) == 0:
+                self._sinks.append(n)
+
+        self._call_degree = dict((addr, 0) for addr in self._entries)
+        self._callers = {}
+        for (src, dst, jumpkind) in cfg.graph.edges(data='jumpkind'):
+            if jumpkind == 'Ijk_Call':
+                self._call_degree[dst.function_address] = \
+                        self._call_degree.get(dst.function_address, 0) + 1
+                self._callers.setdefault(dst.function_address, set()).add(src.function_address)
+
+        self._names = {}
+        for fn in cfg.kb.functions.values():
+            if fn.addr in self._entries:
+                self._names.setdefault(fn.name, fn.addr)
+
+        self._size = len(cfg.graph)
+
+    def entry_node(self, fn_addr):
+        """ The entry node of a function, or None.
+
+        :param int fn_addr:
+        """
+        return self._entries.get(fn_addr)
+
+    def entries(self):
+        """ The entry nodes of all functions. """
+        return list(self._entries.values())
+
+    def function_named(self, name):
+        """ The address of the function with the given name, or None. """
+        return self._names.get(name)
+
+    def call_degree(self, fn_addr):
+        """ The number of direct call edges into a function. """
+        return self._call_degree.get(fn_addr, 0)
+
+    def callers(self, fn_addr):
+        """ The addresses of the functions with a direct call edge into a function. """
+        return self._callers.get(fn_addr, frozenset())
+
+    def uncalled_entries(self):
+        """ The entry nodes of all functions that are never called directly. """
+        return [n for (addr, n) in self._entries.items() if self._call_degree[addr] == 0]
+
+    def exit_nodes(self, fn_addr):
+        """ The returning nodes of a function. """
+        return self._rets.returns(fn_addr)
+
+    def returning_nodes(self):
+        """ The returning nodes of all functions. """
+        return [n for addr in self._rets.functions() for n in self._rets.returns(addr)]
+
+    def sinks(self):
+        """ All nodes without successors in the CFG. """
+        return list(self._sinks)
+
+    def exported_entries(self):
+        """ The entry nodes of all functions exported by the loaded objects. """
+        entries = []
+        for obj in self._cfg.project.loader.all_objects:
+            for sym in obj.symbols:
+                if sym.is_export and sym.is_function:
+                    n = self._entries.get(sym.rebased_addr)
+                    if n is not None:
+                        entries.append(n)
+        return entries
+
+    def resolve(self, point):
+        """ Find the node designated by a user-supplied start point.
+
+        :param point: A CFG node, a function or node address, or a function or symbol name.
+        :return: The node, or None if it cannot be found.
+        """
+        if type(point) is str:
+            addr = self._names.get(point)
+            if addr is None:
+                sym = self._cfg.project.loader.find_symbol(point)
+                if sym is None:
+                    return None
+                addr = sym.rebased_addr
+            point = addr
+
+        if type(point) is int:
+            n = self._entries.get(point)
+            return n if n is not None else self._cfg.model.get_any_node(point)
+
+        return point if point in self._cfg.graph else None
+
+# CFG analysis -> EntryIndex
+_entry_indexes = weakref.WeakKeyDictionary()
+
+def entry_index(cfg):
+    """ Get the `EntryIndex` of a (normalized) CFG, building it if necessary.
+
+    Cached in the same way as `return_index()`.
+
+    :param cfg: The input CFG analysis.
+    :rtype: EntryIndex
+    """
+    index = _entry_indexes.get(cfg)
+    if index is None or index._size != len(cfg.graph):
+        index = EntryIndex(cfg)
+        _entry_indexes[cfg] = index
+    return index
+
 def supergraph_from_cfg(cfg):
     """ Construct a supergraph from a CFG analysis.
 
@@ -65,12 +303,15 @@ def supergraph_from_cfg(cfg):
     * Empty Call and Return nodes are added, of type `DummyNode`.
     * An edge is added from the original calling node to the dummy Call node.
     * An edge is added from the Call node to the entry node of all known target procedures.
-    * Edges are added from each returning node of the called procedure to the Return node.
+    * An edge is added from the Exit node of each called procedure to the Return node.
     * Edges are added from the Return node to each original successor of the original calling node.
 
+    Each procedure with at least one returning node has a single Exit node, also of type
+    `DummyNode`, with an edge from each of its returning nodes (see `ReturnIndex`).
+
     The `jumpkind` attributes on the edges to Call nodes and from Ret nodes are set to
-    `'Ijk_Boring'`. The edges from Call nodes have jumpkind `'Ijk_Call'`, and the edges to Ret nodes
-    have jumpkind `'Ijk_Ret'`.
+    `'Ijk_Boring'`. The edges from Call nodes have jumpkind `'Ijk_Call'`, and the edges into and out
+    of Exit nodes have jumpkind `'Ijk_Ret'`.
 
     Note that the above rules imply that, if the input CFG has not attempted to resolve indirect
     jumps, then all indirect jumps encountered will result in a gap in the supergraph; no edges will
@@ -83,9 +324,7 @@ def supergraph_from_cfg(cfg):
     :rtype:     networkx.DiGraph
     """
 
-    # normalize input graphs
-    if not cfg.normalized:
-        cfg.normalize()
+    _normalize(cfg)
 
     functions = cfg.kb.functions
     for fn in functions.values():
@@ -96,57 +335,182 @@ def supergraph_from_cfg(cfg):
     supergraph = nx.DiGraph()
     supergraph.add_nodes_from(cfg.graph)
 
-    # collect function return nodes for reference
-    fn_rets = {}
-    for n in supergraph.nodes:
-        addr = n.function_address
-        if addr not in fn_rets:
-            fn_rets[addr] = []
-
-        if n.has_return or n.is_simprocedure:
-            fn_rets[addr].append(n)
+    # function return nodes and exit nodes
+    rets = return_index(cfg)
+    for addr in rets.functions():
+        supergraph.add_edges_from(rets.exit_edges(addr))
 
     # add edges and create dummy nodes
+    for n in list(cfg.graph.nodes):
+        (dummy_nodes, edges) = node_edges(cfg, n, rets)
+        supergraph.add_nodes_from(dummy_nodes)
+        supergraph.add_edges_from(edges)
+
+    return supergraph
+
+def _normalize(cfg):
+    if not cfg.normalized:
+        cfg.normalize()
+
+def node_edges(cfg, n, rets):
+    """ The dummy nodes and supergraph edges originating from, or on behalf of, a single CFG node.
+
+    See `supergraph_from_cfg()` for the construction. For a node ending in a call, these are its
+    dummy call and return nodes and the edges into and out of them, including the return edges from
+    the exit node of each callee.
+
+    :param cfg: The input CFG analysis.
+    :param CFGNode n:
+    :param ReturnIndex rets: The return index of the CFG.
+    :return: A tuple of (list of DummyNode, list of (source, dest, data) edges).
+    """
+    # simprocedures are handled implicitly during call/return edge creation
+    if n.is_simprocedure:
+        return [], []
+
     dummy_nodes = []
-    dummy_edges = []
-    for n in supergraph.nodes:
-        # simprocedures are handled implicitly during call/return edge creation
-        if n.is_simprocedure:
-            continue
+    edges = []
+    vex = n.block.vex
+
+    if vex.jumpkind == 'Ijk_Call':
+        # create dummy nodes
+        callnode = DummyNode(n, 'Dummy_Call')
+        retnode = DummyNode(n, 'Dummy_Ret')
+        dummy_nodes.append(callnode)
+        dummy_nodes.append(retnode)
+
+        # get call and return targets
+        call_targets = cfg.model.get_successors(n, jumpkind='Ijk_Call')
+        ret_targets = cfg.model.get_successors(n, excluding_fakeret=False, jumpkind='Ijk_FakeRet')
+
+        # add edges
+        edges.append((n, callnode, {'jumpkind': 'Ijk_Boring'}))
+
+        for t in ret_targets:
+            edges.append((retnode, t, {'jumpkind': 'Ijk_Boring'}))
+
+        for t in call_targets:
+            edges.append((callnode, t, {'jumpkind': 'Ijk_Call'}))
+
+            exit = rets.exit_node(t.function_address)
+            if exit is not None:
+                edges.append((exit, retnode, {'jumpkind': 'Ijk_Ret'}))
+
+    # for non-call, non-ret edges, simply copy over the old jumpkind
+    else:
+        successors = cfg.model.get_successors_and_jumpkind(n)
+        for s, jk in successors:
+            if jk != "Ijk_Ret":
+                edges.append((n, s, {'jumpkind': jk}))
+
+    return dummy_nodes, edges
+
+class LazySupergraph:
+    """ A supergraph that is constructed one function at a time, as it is traversed.
+
+    The nodes of a function, the dummy call and return nodes of its call sites, and the call and
+    return edges linking those to its callees are added to the graph the first time any node of the
+    function is queried for its successors or predecessors. Function normalization and block
+    lifting are likewise deferred until then. The resulting graph is the same as that of
+    `supergraph_from_cfg()`, restricted to the functions expanded so far, so that the cost of
+    construction scales with the code actually reached.
+
+    The return edges out of a function's exit node, and the call edges into its entry node, are
+    added along with the call sites. So the direct callers of a function are expanded as well when
+    its exit node is queried for its successors, or its entry node for its predecessors, and a
+    traversal reaches the same nodes as over the full supergraph. Use `expand_all()` to construct
+    the full supergraph.
+
+    Only the parts of the `networkx.DiGraph` interface used by the analysis are provided;
+    `materialized` gives the graph constructed so far.
+
+    :param cfg: The input CFG analysis. It is normalized if it is not already.
+    """
+
+    def __init__(self, cfg):
+        _normalize(cfg)
+
+        self._cfg = cfg
+        self._graph = nx.DiGraph()
+        self._expanded = set()
+
+        self._rets = return_index(cfg)
+        self._entries = entry_index(cfg)
+
+    @property
+    def materialized(self):
+        """ The part of the supergraph constructed so far.
+
+        :rtype: networkx.DiGraph
+        """
+        return self._graph
+
+    @property
+    def expanded_functions(self):
+        """ The addresses of the functions expanded so far. """
+        return frozenset(self._expanded)
 
-        vex = n.block.vex
+    def expand(self, fn_addr):
+        """ Add a function's nodes and edges to the graph, if not already done.
 
-        if vex.jumpkind == 'Ijk_Call':
-            # create dummy nodes
-            callnode = DummyNode(n, 'Dummy_Call')
-            retnode = DummyNode(n, 'Dummy_Ret')
-            dummy_nodes.append(callnode)
-            dummy_nodes.append(retnode)
+        :param int fn_addr:
+        """
+        if fn_addr in self._expanded:
+            return
+        self._expanded.add(fn_addr)
 
-            # get call and return targets
-            call_targets = cfg.model.get_successors(n, jumpkind='Ijk_Call')
-            ret_targets = cfg.model.get_successors(n, excluding_fakeret=False, jumpkind='Ijk_FakeRet')
+        fn = self._cfg.kb.functions.function(addr=fn_addr)
+        if fn is not None and not fn.normalized:
+            fn.normalize()
 
-            # add edges
-            dummy_edges.append((n, callnode, {'jumpkind': 'Ijk_Boring'}))
+        nodes = self._rets.function_nodes(fn_addr)
+        self._graph.add_nodes_from(nodes)
+        self._graph.add_edges_from(self._rets.exit_edges(fn_addr))
+        for n in nodes:
+            (dummy_nodes, edges) = node_edges(self._cfg, n, self._rets)
+            self._graph.add_nodes_from(dummy_nodes)
+            self._graph.add_edges_from(edges)
+
+    def expand_all(self):
+        """ Expand every function of the CFG. """
+        for fn_addr in list(self._rets.functions()):
+            self.expand(fn_addr)
+
+    def successors(self, node):
+        self.expand(node.function_address)
+        if type(node) is DummyNode and node.dummy_type == 'Dummy_Exit':
+            self._expand_callers(node.function_address)
+        return self._graph.successors(node)
+
+    def predecessors(self, node):
+        self.expand(node.function_address)
+        if type(node) is not DummyNode and node.addr == node.function_address:
+            self._expand_callers(node.function_address)
+        return self._graph.predecessors(node)
+
+    def _expand_callers(self, fn_addr):
+        for caller in self._entries.callers(fn_addr):
+            self.expand(caller)
+
+    def has_node(self, node):
+        return node in self
 
-            for t in ret_targets:
-                dummy_edges.append((retnode, t, {'jumpkind': 'Ijk_Boring'}))
+    @property
+    def nodes(self):
+        return self._graph.nodes
 
-            for t in call_targets:
-                dummy_edges.append((callnode, t, {'jumpkind': 'Ijk_Call'}))
+    @property
+    def edges(self):
+        return self._graph.edges
 
-                for r in fn_rets[t.function_address]:
-                    dummy_edges.append((r, retnode, {'jumpkind': 'Ijk_Ret'}))
+    def size(self):
+        return self._graph.size()
 
-        # for non-call, non-ret edges, simply copy over the old jumpkind
-        else:
-            successors = cfg.model.get_successors_and_jumpkind(n)
-            for s, jk in successors:
-                if jk != "Ijk_Ret":
-                    supergraph.add_edge(n, s, jumpkind=jk)
+    def __contains__(self, node):
+        return node in self._graph
 
-    supergraph.add_nodes_from(dummy_nodes)
-    supergraph.add_edges_from(dummy_edges)
+    def __iter__(self):
+        return iter(self._graph)
 
-    return supergraph
+    def __len__(self):
+        return len(self._graph)
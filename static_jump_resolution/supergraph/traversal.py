@@ -0,0 +1,84 @@
+import numpy as np
+
+class CSRGraph:
+    """ An integer-indexed, compressed sparse row copy of the adjacency of a graph, for bulk
+    traversals.
+
+    Nodes are numbered in the iteration order of the graph, and the neighbours of each node are
+    kept in the order the graph yields them, so traversals visit nodes in the same order as the
+    equivalent traversal of the graph itself. The reverse adjacency is built on first use.
+
+    :param networkx.DiGraph graph:
+    """
+
+    def __init__(self, graph):
+        self.nodes = list(graph.nodes)
+        self.index = dict((n, i) for (i, n) in enumerate(self.nodes))
+
+        self._adj = self._build(graph.successors)
+        self._radj = None
+        self._pred_fn = graph.predecessors
+
+    def _build(self, neighbours):
+        index = self.index
+        rows = [[index[m] for m in neighbours(n)] for n in self.nodes]
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in rows], out=indptr[1:])
+        indices = np.fromiter((i for r in rows for i in r), dtype=np.int64, count=int(indptr[-1]))
+        return (indptr, indices)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def adjacency(self, reverse=False):
+        """ Get the (indptr, indices) arrays of the adjacency, or of the reverse adjacency.
+
+        The neighbours of node `i` are `indices[indptr[i]:indptr[i + 1]]`.
+        """
+        if not reverse:
+            return self._adj
+        if self._radj is None:
+            self._radj = self._build(self._pred_fn)
+        return self._radj
+
+    def indexes_of(self, nodes):
+        """ The indexes of the given nodes, as an array. Nodes not in the graph are ignored. """
+        index = self.index
+        return np.fromiter((index[n] for n in nodes if n in index), dtype=np.int64)
+
+    def nodes_of(self, indexes):
+        """ The nodes with the given indexes, as a list. """
+        return [self.nodes[i] for i in indexes.tolist()]
+
+    def reachable(self, sources, reverse=False):
+        """ Find all nodes reachable from any of the given nodes, including the nodes themselves.
+
+        Each sweep expands the whole frontier at once.
+
+        :param sources: Iterable of nodes.
+        :param bool reverse: If True, follow edges backwards, finding the nodes from which any of the
+            given nodes is reachable.
+        :return: A boolean array indexed by node index.
+        """
+        (indptr, indices) = self.adjacency(reverse)
+        visited = np.zeros(len(self.nodes), dtype=bool)
+
+        frontier = np.unique(self.indexes_of(sources))
+        visited[frontier] = True
+
+        while len(frontier) > 0:
+            starts = indptr[frontier]
+            counts = indptr[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+
+            # Gather the neighbour ranges of every frontier node into one array
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            neighbours = indices[offsets + np.arange(total)]
+
+            frontier = np.unique(neighbours[~visited[neighbours]])
+            visited[frontier] = True
+
+        return visited
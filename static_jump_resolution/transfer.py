@@ -0,0 +1,109 @@
+from angr.analyses.code_location import CodeLocation
+
+from .live_vars import LiveVars, QualifiedLiveSet, VarUse
+from .vars import MemoryLocation, MEMORY_SUMMARY
+
+import logging
+
+l = logging.getLogger(__name__)
+
+def _triggers(stmt):
+    """ The variables whose live uses make a statement part of the slice: those it defines, and
+    `MEMORY_SUMMARY` if it stores to memory (see `LiveVars.gen_uses_if_killed()`). """
+    if any(type(v) is MemoryLocation for v in stmt.defs):
+        return stmt.defs | {MEMORY_SUMMARY}
+    return stmt.defs
+
+class BlockTransfer:
+    """ The transfer function of a block over the live sets of `LiveVars`, compiled from the
+    block's def/use summary.
+
+    `SimEngineSJRVEX.process()` walks the statements of a block backward, killing the variables a
+    statement defines and generating its uses whenever one of them is live. Its effect on a live set
+    distributes over the uses in the set, and only depends on their variables, so it is given by
+    three tables:
+
+    * `gen`, the uses live at block entry whatever is live at its exit: those of an indirect jump
+      target, and of the statements they depend on,
+    * `kill`, the variables whose uses do not pass through the block, and
+    * `deps`, a mapping from each variable to the uses that a live use of it adds at block entry,
+      beyond `gen`. Variables the block does not depend on are left out.
+
+    The output of a live set is then `gen`, its uses of variables not in `kill`, and the `deps` of
+    the variables of all of its uses, exactly as the engine computes it.
+
+    :param BlockSummary summary: The summary of the block, in the context the block is processed in.
+    :param int jump_ins_addr: (Optional) The address of the block's last instruction, to which the
+        uses of an indirect jump target are attributed. Only needed if the block has one.
+    """
+
+    __slots__ = ('addr', 'gen', 'kill', 'deps')
+
+    def __init__(self, summary, jump_ins_addr=None):
+        self.addr = summary.addr
+        self.kill = summary.defs
+
+        jump_loc = None
+        if len(summary.jump_uses) > 0:
+            jump_loc = CodeLocation(summary.addr, None, ins_addr=jump_ins_addr)
+        self.gen = frozenset(self._walk(summary, jump_loc))
+
+        triggers = set()
+        for stmt in summary.stmts:
+            if not stmt.is_jump:
+                triggers |= _triggers(stmt)
+
+        self.deps = {}
+        for var in triggers:
+            uses = self._walk(summary, jump_loc, var) - self.gen
+            if len(uses) > 0:
+                self.deps[var] = frozenset(uses)
+
+    @staticmethod
+    def _walk(summary, jump_loc, var=None):
+        """ Walk the statements of a block backward as the engine does, from a live set holding a
+        single use of `var` (or nothing), and collect the uses the block generates.
+        """
+        uses = set(VarUse(v, jump_loc) for v in summary.jump_uses)
+
+        for stmt in reversed(summary.stmts):
+            if stmt.is_jump:
+                if var in stmt.defs:
+                    var = None
+                uses = set(u for u in uses if u.var not in stmt.defs)
+            else:
+                triggers = _triggers(stmt)
+                if var not in triggers and not any(u.var in triggers for u in uses):
+                    continue
+                if var in stmt.defs:
+                    var = None
+                uses = set(u for u in uses if u.var not in stmt.defs)
+
+            codeloc = CodeLocation(summary.addr, stmt.idx)
+            uses |= set(VarUse(v, codeloc) for v in stmt.uses)
+
+        return uses
+
+    def apply(self, state):
+        """ Apply the transfer function to a state. The state is not modified.
+
+        :param LiveVars state: The state at block exit.
+        :return: The state at block entry.
+        :rtype: LiveVars
+        """
+        livesets = []
+        for liveset in state.livesets:
+            uses = set(self.gen)
+            for u in liveset.uses:
+                if u.var not in self.kill:
+                    uses.add(u)
+                deps = self.deps.get(u.var)
+                if deps is not None:
+                    uses |= deps
+            livesets.append(QualifiedLiveSet(liveset.ctx.copy(), uses))
+
+        return LiveVars(state.arch, state.fn_addr, livesets, state.sp, state.bp)
+
+    def __repr__(self):
+        return '<BlockTransfer 0x%x (%d gen, %d kill, %d deps)>' % \
+                (self.addr, len(self.gen), len(self.kill), len(self.deps))
@@ -1,12 +1,15 @@
 from .context import ExecutionCtx
+from .interning import Interned
 
 import pyvex
-import operator
 
 def get_type_size_bytes(ty):
     return pyvex.const.get_type_size(ty) / 8
 
-class Var:
+class Var(Interned):
+    """ Base class of variables. Variables are interned (see `Interned`), so equal variables are
+    identical.
+    """
     __slots__ = tuple()
 
     def __repr__(self):
@@ -25,17 +28,12 @@ class Register(Var):
     """
     __slots__ = ('offset', 'size')
 
-    def __init__(self, offset, size):
+    def _init(self, offset, size):
         self.offset = offset
         self.size = size
 
-    def __eq__(self, other):
-        return type(other) is Register and \
-                self.offset == other.offset and \
-                self.size == other.size
-
-    def __hash__(self):
-        return hash(('Register', self.offset, self.size))
+    def _args(self):
+        return (self.offset, self.size)
 
     def __repr__(self, arch=None):
         if arch is None:
@@ -60,19 +58,13 @@ class StackVar(Var):
     """
     __slots__ = ('fn_addr', 'offset', 'size')
 
-    def __init__(self, fn_addr, offset, size):
+    def _init(self, fn_addr, offset, size):
         self.fn_addr = fn_addr
         self.offset = offset
         self.size = size
 
-    def __eq__(self, other):
-        return type(other) is StackVar and \
-                self.fn_addr == other.fn_addr and \
-                self.offset == other.offset and \
-                self.size == other.size
-
-    def __hash__(self):
-        return hash(('StackVar', self.fn_addr, self.offset, self.size))
+    def _args(self):
+        return (self.fn_addr, self.offset, self.size)
 
     def __repr__(self):
         return "<StackVar [0x%x] %d (%d bytes)>" % (self.fn_addr, self.offset, self.size)
@@ -97,21 +89,69 @@ class MemoryLocation(Var):
     """
     __slots__ = ('addr', 'size')
 
-    def __init__(self, addr, size):
+    def _init(self, addr, size):
         self.addr = addr
         self.size = size
 
-    def __eq__(self, other):
-        return type(other) is MemoryLocation and \
-                self.addr == other.addr and \
-                self.size == other.size
-
-    def __hash__(self):
-        return hash(('MemoryLocation', self.addr, self.size))
+    def _args(self):
+        return (self.addr, self.size)
 
     def __repr__(self):
+        if self is MEMORY_SUMMARY:
+            return '<MemoryLocation *>'
         return '<MemoryLocation %s(%s)>' % (self.addr, self.size)
 
+# A single location standing for all of non-local memory, into which widening collapses
+# `MemoryLocation`s; see `LiveVars.collapsed()`. It is defined by every store and never killed.
+MEMORY_SUMMARY = MemoryLocation(None, 0)
+
+_add_ops = ('Iop_Add8', 'Iop_Add16', 'Iop_Add32', 'Iop_Add64')
+_sub_ops = ('Iop_Sub8', 'Iop_Sub16', 'Iop_Sub32', 'Iop_Sub64')
+
+def _signed(con):
+    value = con.value
+    bits = con.size
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+def frame_offset(expr, sp, bp, arch):
+    """ Evaluate an expression of the stack or base pointer plus or minus constants, e.g.
+    `Add64(Sub64(GET(rsp), 8), 0xfffffffffffffff8)`, as an offset in frame space (see `StackVar`).
+
+    :param IRExpr expr:
+    :param int sp: The frame-space offset of the stack pointer, or None if unknown.
+    :param int bp: The frame-space offset of the base pointer, or None if unknown.
+    :param Arch arch:
+    :return: An int, or None if the expression is not of that form or its register is unknown.
+    """
+    delta = 0
+    while True:
+        if type(expr) is pyvex.IRExpr.Get:
+            if expr.offset == arch.sp_offset:
+                base = sp
+            elif expr.offset == arch.bp_offset:
+                base = bp
+            else:
+                return None
+            return None if base is None else base + delta
+
+        if type(expr) is not pyvex.IRExpr.Binop:
+            return None
+
+        (a, b) = expr.args
+        if expr.op in _add_ops:
+            if type(b) is pyvex.IRExpr.Const:
+                (expr, con) = (a, b.con)
+            elif type(a) is pyvex.IRExpr.Const:
+                (expr, con) = (b, a.con)
+            else:
+                return None
+            delta += _signed(con)
+        elif expr.op in _sub_ops and type(b) is pyvex.IRExpr.Const:
+            expr = a
+            delta -= _signed(b.con)
+        else:
+            return None
+
 def stack_var(addr, ctx, arch, ty):
     """ If the expression is an offset from the stack or base pointer, return the corresponding
     StackVar. Otherwise, return None.
@@ -125,46 +165,10 @@ def stack_var(addr, ctx, arch, ty):
     if arch is None:
         return None
 
-    size = get_type_size_bytes(ty)
-
-    # Either a direct dereference of the SP/BP...
-    if type(addr) is pyvex.IRExpr.Get:
-        if addr.offset == arch.sp_offset:
-            return StackVar(ctx.fn_addr, ctx.sp, size)
-        elif addr.offset == arch.bp_offset:
-            return StackVar(ctx.fn_addr, ctx.bp, size)
-        else:
-            return None
-
-    # Or the SP/BP register plus/minus a constant
-    elif type(addr) is pyvex.IRExpr.Binop:
-        if not any(type(e) is pyvex.IRExpr.Get for e in addr.args):
-            return None
-        if not any(type(e) is pyvex.IRExpr.Const for e in addr.args):
-            return None
-
-        # Get the operator (add/sub)
-        if addr.op in ('Iop_Add8', 'Iop_Add16', 'Iop_Add32', 'Iop_Add64'):
-            op = operator.add
-        elif addr.op in ('Iop_Sub8', 'Iop_Sub16', 'Iop_Sub32', 'Iop_Sub64'):
-            op = operator.sub
-        else:
-            return None
-
-        # Figure out which argument is the register and which is the offset
-        (reg, offset) = (addr.args[0], addr.args[1]) \
-                if type(addr.args[0]) is pyvex.IRExpr.Get \
-                else (addr.args[1], addr.args[0])
-
-        if reg.offset == arch.sp_offset:
-            return StackVar(ctx.fn_addr, op(ctx.sp, offset.con.value), size)
-        elif reg.offset == arch.bp_offset:
-            return StackVar(ctx.fn_addr, op(ctx.bp, offset.con.value), size)
-        else:
-            return None
-
-    else:
+    offset = frame_offset(addr, ctx.sp, ctx.bp, arch)
+    if offset is None:
         return None
+    return StackVar(ctx.fn_addr, offset, get_type_size_bytes(ty))
 
 def memory_location(addr, ctx, arch, ty):
     """ Return the MemoryLocation or StackVar corresponding to the given expression interpretted as
@@ -0,0 +1,379 @@
+""" Generate synthetic x86-64 ELF executables for benchmarks and stress tests.
+
+Programs are emitted as assembly, assembled with keystone, and written out as a minimal static ELF
+executable with a symbol for each function, so that they load in angr like any other binary. The
+shape of the call graph, recursion, jump tables, calls through function pointers and stack slot
+traffic are all controlled by parameters, and generation is deterministic given a seed.
+
+Alongside each binary, a JSON manifest records the parameters and the ground truth: the address of
+every function, and the targets of every jump table and indirect call.
+
+Usage: python fixture_gen.py OUTPUT [--functions N] [--shape random] ...
+"""
+
+import keystone
+from keystone import KS_ARCH_X86, KS_MODE_64
+
+import argparse
+import json
+import random
+import struct
+import sys
+
+BASE_ADDR = 0x400000
+TEXT_OFFSET = 0x1000
+TEXT_ADDR = BASE_ADDR + TEXT_OFFSET
+
+SHAPES = ('random', 'tree', 'chain')
+TABLE_STYLES = ('absolute', 'relative')
+
+# Functions are assembled in chunks of this many at a time
+_CHUNK = 256
+_ALIGN = 16
+
+_ks = keystone.Ks(KS_ARCH_X86, KS_MODE_64)
+
+# Sizes of assembly pieces, by text. Pieces referring to other functions are sized with a
+# placeholder target, since their encodings do not depend on it.
+_piece_sizes = {}
+
+def _asm(text, addr):
+    (encoding, _) = _ks.asm(text, addr)
+    return bytes(encoding or b'')
+
+def _piece_size(text):
+    size = _piece_sizes.get(text)
+    if size is None:
+        size = len(_asm(text, 0))
+        _piece_sizes[text] = size
+    return size
+
+class Fixture:
+    """ A generated binary and its ground truth.
+
+    :ivar str path: The path to the binary.
+    :ivar dict functions: Mapping from function names to (address, size) pairs.
+    :ivar dict calls: Mapping from function names to the names of the functions they call.
+    :ivar dict jump_tables: Mapping from the address of each jump table dispatch instruction to
+        the sorted list of its targets.
+    :ivar dict indirect_calls: Mapping from the address of each call through a function pointer to
+        its target.
+    :ivar dict params: The generation parameters.
+    """
+
+    def __init__(self, path, functions, calls, jump_tables, indirect_calls, params):
+        self.path = path
+        self.functions = functions
+        self.calls = calls
+        self.jump_tables = jump_tables
+        self.indirect_calls = indirect_calls
+        self.params = params
+
+    @property
+    def manifest_path(self):
+        return self.path + '.json'
+
+    @property
+    def entry(self):
+        return self.functions['main'][0]
+
+    def to_json(self):
+        return {
+            'params': self.params,
+            'functions': dict((n, ['0x%x' % a, s]) for (n, (a, s)) in self.functions.items()),
+            'calls': self.calls,
+            'jump_tables': dict(('0x%x' % a, ['0x%x' % t for t in ts]) \
+                    for (a, ts) in sorted(self.jump_tables.items())),
+            'indirect_calls': dict(('0x%x' % a, '0x%x' % t) \
+                    for (a, t) in sorted(self.indirect_calls.items())),
+        }
+
+def _name(i):
+    return 'main' if i == 0 else 'f%d' % i
+
+def _callees(n, shape, calls, recursion, rng):
+    """ The indexes of the functions called by each function. Apart from recursive calls, each
+    function only calls functions with greater indexes, so that every function is reachable from
+    function 0.
+    """
+    callees = [[] for _ in range(n)]
+    called = set()
+    for i in range(n):
+        if shape == 'chain':
+            targets = [i + 1] if i + 1 < n else []
+        elif shape == 'tree':
+            targets = [j for j in range(calls * i + 1, calls * i + calls + 1) if j < n]
+        else:
+            targets = [rng.randrange(i + 1, n) for _ in range(calls)] if i + 1 < n else []
+            # Keep every function reachable
+            if i > 0 and i not in called:
+                callees[rng.randrange(0, i)].append(i)
+
+        callees[i].extend(targets)
+        called.update(targets)
+        if rng.random() < recursion:
+            callees[i].append(rng.randrange(0, i + 1))
+
+    return callees
+
+class _Function:
+    """ The assembly of one function, as a sequence of pieces. """
+
+    def __init__(self, index):
+        self.index = index
+        # Pairs of (sizing template, text)
+        self.pieces = []
+        self.indirect_calls = []
+        self.table = None
+
+    def add(self, text, template=None):
+        self.pieces.append((text if template is None else template, text))
+
+    def size(self):
+        return sum(_piece_size(template) for (template, _) in self.pieces)
+
+    def text(self, labels):
+        return '\n'.join(text for (_, text) in self.pieces).replace('jt_', labels)
+
+def _jump_table(style, cases):
+    # As emitted by GCC at -O2
+    lines = ['cmp edi, %d' % (cases - 1), 'ja jt_default', 'mov edi, edi']
+    if style == 'absolute':
+        lines.append('jmp qword ptr [rdi*8 + jt_table]')
+    else:
+        lines += ['lea rdx, [rip + jt_table]', 'movsxd rax, dword ptr [rdx + rdi*4]',
+                'add rax, rdx', 'jmp rax']
+
+    for k in range(cases):
+        lines.append('jt_case%d: mov eax, %d' % (k, k))
+        if k < cases - 1:
+            lines.append('jmp jt_default')
+
+    lines.append('jt_default: leave')
+    lines.append('ret')
+    if style == 'absolute':
+        lines.append('jt_table: .quad ' + ', '.join('jt_case%d' % k for k in range(cases)))
+    else:
+        lines.append('jt_table: .long ' + \
+                ', '.join('jt_case%d - jt_table' % k for k in range(cases)))
+
+    return '\n'.join(lines)
+
+def _build_function(i, callees, addrs, rng, params):
+    fn = _Function(i)
+    slots = params['stack_slots']
+    frame = (8 * slots + 15) // 16 * 16
+
+    fn.add('push rbp; mov rbp, rsp' + ('; sub rsp, %d' % frame if frame > 0 else ''))
+    for k in range(slots):
+        fn.add('mov qword ptr [rbp - %d], %s' % (8 * (k + 1), ('rdi', 'rsi')[k % 2]))
+
+    for (c, j) in enumerate(callees):
+        if slots > 0:
+            fn.add('mov rdi, qword ptr [rbp - %d]' % (8 * (c % slots + 1)))
+        target = addrs[j] if addrs is not None else 0
+        if rng.random() < params['indirect_calls']:
+            fn.indirect_calls.append((len(fn.pieces), j))
+            fn.add('movabs rax, %d; call rax' % target, 'movabs rax, 0; call rax')
+        else:
+            fn.add('call %d' % target, 'call 0')
+
+    if rng.random() < params['jump_tables']:
+        fn.table = rng.randint(2, params['cases'])
+        fn.add(_jump_table(params['table_style'], fn.table))
+    else:
+        fn.add('leave; ret')
+
+    return fn
+
+def _locate_table(code, addr, style, cases):
+    """ Find the dispatch instruction of the jump table at the end of a function's code, and read
+    the table's targets.
+    """
+    entry_size = 8 if style == 'absolute' else 4
+    table_addr = addr + len(code) - cases * entry_size
+    entries = code[len(code) - cases * entry_size:]
+
+    if style == 'absolute':
+        targets = struct.unpack('<%dQ' % cases, entries)
+        dispatch = b'\xff\x24\xfd' + struct.pack('<i', table_addr)
+    else:
+        targets = [table_addr + o for o in struct.unpack('<%di' % cases, entries)]
+        # add rax, rdx; jmp rax
+        dispatch = b'\x48\x01\xd0\xff\xe0'
+
+    offset = code.rfind(dispatch)
+    if offset < 0:
+        raise RuntimeError('Jump table dispatch not found at 0x%x' % addr)
+    if style == 'relative':
+        offset += 3
+    return (addr + offset, sorted(set(targets)))
+
+def generate(path, functions=100, shape='random', calls=2, recursion=0.0, jump_tables=0.1,
+        cases=8, table_style='absolute', indirect_calls=0.1, stack_slots=2, seed=0):
+    """ Generate a binary, and write it and its manifest.
+
+    :param str path: The output path. The manifest is written to `path + '.json'`.
+    :param int functions: The number of functions, including main.
+    :param str shape: The shape of the call graph: 'random' (each function calls `calls` random
+        functions after it), 'tree' (a tree of fan-out `calls`) or 'chain'.
+    :param int calls: The number of calls per function.
+    :param float recursion: The probability that a function makes an additional, recursive call to
+        itself or a function before it.
+    :param float jump_tables: The probability that a function ends in a jump table dispatch on its
+        first argument.
+    :param int cases: The maximum number of cases of a jump table.
+    :param str table_style: 'absolute' for tables of addresses, or 'relative' for tables of 32-bit
+        offsets from the table, as in position-independent code.
+    :param float indirect_calls: The probability that a call is made through a function pointer.
+    :param int stack_slots: The number of stack slots each function spills its arguments to and
+        reloads them from.
+    :param int seed: The random seed.
+    :rtype: Fixture
+    """
+    if shape not in SHAPES:
+        raise ValueError('Unknown shape %r' % shape)
+    if table_style not in TABLE_STYLES:
+        raise ValueError('Unknown table style %r' % table_style)
+
+    params = {
+        'functions': functions, 'shape': shape, 'calls': calls, 'recursion': recursion,
+        'jump_tables': jump_tables, 'cases': cases, 'table_style': table_style,
+        'indirect_calls': indirect_calls, 'stack_slots': stack_slots, 'seed': seed,
+    }
+
+    rng = random.Random(seed)
+    callees = _callees(functions, shape, calls, recursion, rng)
+
+    # Lay the functions out with placeholder targets, then build them again with the real ones.
+    # The same random choices are made both times.
+    state = rng.getstate()
+    addrs = []
+    addr = TEXT_ADDR
+    for i in range(functions):
+        addrs.append(addr)
+        size = _build_function(i, callees[i], None, rng, params).size()
+        addr += size + (-size) % _ALIGN
+
+    rng.setstate(state)
+    text = bytearray()
+    sizes = []
+    jumps = {}
+    indirect = {}
+    for start in range(0, functions, _CHUNK):
+        chunk = [_build_function(i, callees[i], addrs, rng, params) \
+                for i in range(start, min(start + _CHUNK, functions))]
+
+        source = []
+        for fn in chunk:
+            size = fn.size()
+            source.append(fn.text('f%d_' % fn.index))
+            source.append('int3; ' * ((-size) % _ALIGN))
+            sizes.append(size)
+
+        code = _asm('\n'.join(source), addrs[start])
+        expected = addrs[chunk[-1].index] + sizes[-1] - addrs[start]
+        if len(code) < expected:
+            raise RuntimeError('Assembled %d bytes for functions %d-%d, expected %d' % \
+                    (len(code), start, chunk[-1].index, expected))
+        text += code
+
+        for fn in chunk:
+            (fn_addr, size) = (addrs[fn.index], sizes[fn.index])
+            for (piece, j) in fn.indirect_calls:
+                # The call follows a 10-byte movabs
+                offset = sum(_piece_size(t) for (t, _) in fn.pieces[:piece]) + 10
+                indirect[fn_addr + offset] = addrs[j]
+            if fn.table is not None:
+                fn_code = bytes(text[fn_addr - TEXT_ADDR:fn_addr - TEXT_ADDR + size])
+                (jump, targets) = _locate_table(fn_code, fn_addr, table_style, fn.table)
+                jumps[jump] = targets
+
+    fixture = Fixture(path,
+            dict((_name(i), (addrs[i], sizes[i])) for i in range(functions)),
+            dict((_name(i), [_name(j) for j in cs]) for (i, cs) in enumerate(callees)),
+            jumps, indirect, params)
+
+    _write_elf(path, bytes(text), fixture)
+    with open(fixture.manifest_path, 'w') as f:
+        json.dump(fixture.to_json(), f)
+
+    return fixture
+
+def _write_elf(path, text, fixture):
+    """ Write a static ELF64 executable with a single loadable segment and a symbol table. """
+    names = sorted(fixture.functions, key=lambda n: fixture.functions[n][0])
+
+    strtab = bytearray(b'\0')
+    symtab = bytearray(struct.pack('<IBBHQQ', 0, 0, 0, 0, 0, 0))
+    for name in names:
+        (addr, size) = fixture.functions[name]
+        # STB_GLOBAL, STT_FUNC, in section 1 (.text)
+        symtab += struct.pack('<IBBHQQ', len(strtab), 0x12, 0, 1, addr, size)
+        strtab += name.encode() + b'\0'
+
+    shstrtab = b'\0.text\0.symtab\0.strtab\0.shstrtab\0'
+
+    symtab_offset = TEXT_OFFSET + len(text)
+    symtab_offset += (-symtab_offset) % 8
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    shoff = shstrtab_offset + len(shstrtab)
+    shoff += (-shoff) % 8
+
+    ident = b'\x7fELF' + bytes([2, 1, 1, 0]) + b'\0' * 8
+    header = struct.pack('<16sHHIQQQIHHHHHH', ident, 2, 62, 1, fixture.entry, 64, shoff, 0, 64,
+            56, 1, 64, 5, 4)
+    # PT_LOAD, R+X, covering the headers and the code
+    phdr = struct.pack('<IIQQQQQQ', 1, 5, 0, BASE_ADDR, BASE_ADDR, TEXT_OFFSET + len(text),
+            TEXT_OFFSET + len(text), 0x1000)
+
+    sections = [
+        struct.pack('<IIQQQQIIQQ', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        # .text: PROGBITS, ALLOC+EXECINSTR
+        struct.pack('<IIQQQQIIQQ', 1, 1, 6, TEXT_ADDR, TEXT_OFFSET, len(text), 0, 0, 16, 0),
+        # .symtab, linked to .strtab, with all symbols global
+        struct.pack('<IIQQQQIIQQ', 7, 2, 0, 0, symtab_offset, len(symtab), 3, 1, 8, 24),
+        struct.pack('<IIQQQQIIQQ', 15, 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+        struct.pack('<IIQQQQIIQQ', 23, 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0),
+    ]
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(phdr)
+        f.write(b'\0' * (TEXT_OFFSET - f.tell()))
+        f.write(text)
+        f.write(b'\0' * (symtab_offset - f.tell()))
+        f.write(symtab)
+        f.write(strtab)
+        f.write(shstrtab)
+        f.write(b'\0' * (shoff - f.tell()))
+        for s in sections:
+            f.write(s)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic x86-64 ELF fixture.')
+    parser.add_argument('output')
+    parser.add_argument('--functions', type=int, default=100)
+    parser.add_argument('--shape', choices=SHAPES, default='random')
+    parser.add_argument('--calls', type=int, default=2)
+    parser.add_argument('--recursion', type=float, default=0.0)
+    parser.add_argument('--jump-tables', type=float, default=0.1)
+    parser.add_argument('--cases', type=int, default=8)
+    parser.add_argument('--table-style', choices=TABLE_STYLES, default='absolute')
+    parser.add_argument('--indirect-calls', type=float, default=0.1)
+    parser.add_argument('--stack-slots', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fixture = generate(args.output, functions=args.functions, shape=args.shape, calls=args.calls,
+            recursion=args.recursion, jump_tables=args.jump_tables, cases=args.cases,
+            table_style=args.table_style, indirect_calls=args.indirect_calls,
+            stack_slots=args.stack_slots, seed=args.seed)
+
+    print('%s: %d functions, %d jump tables, %d indirect calls' % (fixture.path,
+        len(fixture.functions), len(fixture.jump_tables), len(fixture.indirect_calls)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
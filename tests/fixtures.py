@@ -0,0 +1,74 @@
+""" Binaries shared by the tests, and the projects and CFGs to analyze them with.
+
+Binaries generated with `fixture_gen` are cached by their parameters for the whole test run, so
+that tests asking for the same binary share it. They are written to a temporary directory, which
+is removed when the run exits.
+"""
+
+import angr
+
+import fixture_gen
+
+import atexit
+import os.path
+import shutil
+import tempfile
+
+BIN_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bin')
+
+_tmpdir = None
+
+# Sorted tuple of parameters -> Fixture
+_generated = {}
+
+def tmpdir():
+    """ The temporary directory of the test run, created on first use. """
+    global _tmpdir
+    if _tmpdir is None:
+        _tmpdir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, _tmpdir, True)
+    return _tmpdir
+
+def scratch_dir(name):
+    """ Create a new, empty directory for a test to write to.
+
+    :param str name: A prefix for the name of the directory.
+    :rtype: str
+    """
+    return tempfile.mkdtemp(prefix=name + '-', dir=tmpdir())
+
+def generate(**params):
+    """ Generate a binary with `fixture_gen.generate()`, or get the one already generated with the
+    same parameters.
+
+    :param params: Passed to `fixture_gen.generate()`.
+    :rtype: fixture_gen.Fixture
+    """
+    key = tuple(sorted(params.items()))
+    fixture = _generated.get(key)
+    if fixture is None:
+        path = os.path.join(tmpdir(), 'fixture%d' % len(_generated))
+        fixture = fixture_gen.generate(path, **params)
+        _generated[key] = fixture
+    return fixture
+
+def project(binary):
+    """ Load a binary.
+
+    :param binary: A `fixture_gen.Fixture`, or the name of a binary in tests/bin.
+    :rtype: angr.Project
+    """
+    path = binary.path if type(binary) is fixture_gen.Fixture else os.path.join(BIN_PATH, binary)
+    return angr.Project(path, auto_load_libs=False)
+
+def load(binary, normalize=True, **cfg_options):
+    """ Load a binary, and recover its CFG. Each call builds a new project and CFG, as the tests
+    normalize, expand and resolve jumps in them.
+
+    :param binary: A `fixture_gen.Fixture`, or the name of a binary in tests/bin.
+    :param bool normalize: Whether to normalize the CFG.
+    :param cfg_options: Passed to `CFGFast`.
+    :return: A tuple of (project, cfg).
+    """
+    proj = project(binary)
+    return (proj, proj.analyses.CFGFast(normalize=normalize, **cfg_options))
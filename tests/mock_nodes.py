@@ -12,9 +12,10 @@ class CFGNode:
     """ A fake CFGNode class that contains only the information needed directly by the test suite.
     """
 
-    def __init__(self, addr, fn_addr):
+    def __init__(self, addr, fn_addr, has_return=False):
         self.addr = addr
         self.function_address = fn_addr
+        self.has_return = has_return
 
     @property
     def instruction_addrs(self):
@@ -23,12 +24,25 @@ class CFGNode:
     def __eq__(self, other):
         return self.addr == other.addr
 
-    def __hash__(self, other):
+    def __hash__(self):
         return hash(('CFGNode', self.addr))
 
     def __repr__(self):
         return '<CFGNode 0x%x>' % self.addr
 
+class BlockNode(CFGNode):
+    """ A fake CFGNode wrapping an actual (lifted) block.
+    """
+
+    def __init__(self, block, fn_addr):
+        super(BlockNode, self).__init__(block.addr, fn_addr)
+        self.block = block
+        self.is_simprocedure = False
+
+    @property
+    def instruction_addrs(self):
+        return list(self.block.instruction_addrs)
+
 def arbitrary_call_nodes(num=1):
     """ Get a list of fake call nodes with arbitrary, unique addresses.
 
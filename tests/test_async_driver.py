@@ -0,0 +1,131 @@
+import nose
+import nose.tools as nt
+
+import angr
+import asyncio
+import concurrent.futures
+import os
+import types
+
+import static_jump_resolution
+from static_jump_resolution.async_driver import AsyncAnalysisDriver, analyze_async
+
+class SteppedAnalysis:
+    """ Stands in for a `StaticJumpResolutionAnalysis` constructed with `analyze=False`, whose
+    fixpoint takes a fixed number of node visits.
+    """
+
+    def __init__(self, cfg, total, **options):
+        self.options = options
+        self.total = total
+        self.iterations = 0
+        self.budget_exceeded = None
+        self.finished = False
+        self.resolved_at = None
+
+    @property
+    def visited_nodes(self):
+        return list(range(self.iterations))
+
+    def step(self, max_visits):
+        self.iterations = min(self.total, self.iterations + max_visits)
+        return self.iterations == self.total
+
+    def finish(self):
+        self.finished = True
+
+    def resolve_jumps(self, nodes):
+        self.resolved_at = nodes
+
+def stepped_project(total):
+    make = lambda cfg, **options: SteppedAnalysis(cfg, total, **options)
+    return types.SimpleNamespace(analyses=types.SimpleNamespace(StaticJumpResolutionAnalysis=make))
+
+def test_runs_in_slices():
+    progress = []
+    driver = AsyncAnalysisDriver(stepped_project(25), None, slice_visits=10,
+            progress_callback=progress.append, sparse=True)
+    analysis = asyncio.run(driver.run())
+
+    nt.eq_(driver.status, 'finished')
+    nt.eq_(analysis.options, {'sparse': True, 'resolve': True, 'analyze': False})
+    nt.ok_(analysis.finished)
+    nt.eq_([(p.slices, p.visits, p.finished) for p in progress],
+            [(1, 10, False), (2, 20, False), (3, 25, True)])
+
+def test_offloaded_slices():
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        analysis = asyncio.run(analyze_async(stepped_project(25), None, slice_visits=10,
+            offload=True, executor=executor))
+    nt.ok_(analysis.finished)
+
+def test_cancel_returns_partial_results():
+    driver = AsyncAnalysisDriver(stepped_project(100), None, slice_visits=10)
+
+    def progress(p):
+        if p.slices == 2:
+            driver.cancel()
+    driver.progress_callback = progress
+
+    analysis = asyncio.run(driver.run())
+    nt.eq_(driver.status, 'cancelled')
+    nt.ok_(not analysis.finished)
+    nt.eq_(analysis.resolved_at, list(range(20)))
+
+def test_time_budget():
+    driver = AsyncAnalysisDriver(stepped_project(100), None, slice_visits=10, time_budget=0)
+    analysis = asyncio.run(driver.run())
+
+    nt.eq_(driver.status, 'timeout')
+    nt.eq_(analysis.iterations, 0)
+    nt.eq_(analysis.resolved_at, [])
+
+def test_analysis_budget():
+    proj = angr.Project(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bin',
+        'simple_jump.o'), auto_load_libs=False)
+    cfg = proj.analyses.CFGFast(normalize=True)
+
+    driver = AsyncAnalysisDriver(proj, cfg, slice_visits=5, max_visits=7)
+    analysis = asyncio.run(driver.run())
+
+    # Stopped by the analysis' own budget, after the second slice
+    nt.eq_(driver.status, 'budget')
+    nt.eq_(analysis.budget_exceeded, 'visits')
+    nt.eq_(analysis.iterations, 7)
+    nt.eq_(driver.progress.slices, 2)
+    nt.ok_(not driver.progress.finished)
+
+def test_task_cancellation():
+    async def run_and_cancel():
+        driver = AsyncAnalysisDriver(stepped_project(10 ** 6), None, slice_visits=1)
+        task = asyncio.ensure_future(driver.run())
+        while driver.progress is None:
+            await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return driver
+
+    driver = asyncio.run(run_and_cancel())
+    nt.eq_(driver.status, 'cancelled')
+    nt.eq_(driver.analysis.resolved_at, None)
+
+def test_real_analysis():
+    proj = angr.Project(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bin',
+        'simple_jump.o'), auto_load_libs=False)
+    cfg = proj.analyses.CFGFast(normalize=True)
+
+    progress = []
+    driver = AsyncAnalysisDriver(proj, cfg, slice_visits=5, progress_callback=progress.append)
+    analysis = asyncio.run(driver.run())
+
+    # Slicing the fixpoint does not change where it ends up
+    nt.eq_(driver.status, 'finished')
+    nt.ok_(len(progress) > 1)
+    nt.ok_(progress[-1].finished)
+    nt.eq_(analysis.node_states, proj.analyses.StaticJumpResolutionAnalysis(cfg).node_states)
+    nt.ok_(len(analysis.jump_resolutions) > 0)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,77 @@
+import nose
+import nose.tools as nt
+
+import io
+import json
+import os
+import time
+
+from static_jump_resolution.batch import BatchDriver, read_manifest
+
+def echo_job(binary, **options):
+    return { 'binary': binary, 'pid': os.getpid(), 'options': options }
+
+def flaky_job(binary):
+    if binary == 'slow':
+        time.sleep(30)
+    elif binary == 'crash':
+        os._exit(3)
+    elif binary == 'error':
+        raise ValueError('bad binary')
+    return {}
+
+def alloc_job(binary):
+    # Touch every page, so that it counts towards the resident set
+    block = bytearray(int(binary) * 1024 * 1024)
+    for i in range(0, len(block), 4096):
+        block[i] = 1
+    return {}
+
+def driver(**kwargs):
+    return BatchDriver(start_method='fork', prewarm=False, **kwargs)
+
+def test_read_manifest():
+    lines = [ '# comment', '', '/bin/true', '{"binary": "/bin/false", "options": {"sparse": true}}' ]
+    nt.eq_(read_manifest(lines), [ ('/bin/true', {}), ('/bin/false', {'sparse': True}) ])
+
+def test_batch_streams_results():
+    out = io.StringIO()
+    tasks = [ ('a', {}), ('b', {'x': 1}), ('c', {}) ]
+    records = list(driver(workers=2, job=echo_job).run(tasks, out))
+
+    nt.eq_(sorted(r['binary'] for r in records), ['a', 'b', 'c'])
+    nt.ok_(all(r['status'] == 'ok' for r in records))
+
+    lines = [ json.loads(line) for line in out.getvalue().splitlines() ]
+    nt.eq_(lines, records)
+
+    [b] = [ r for r in records if r['binary'] == 'b' ]
+    nt.eq_(b['result']['options'], {'x': 1})
+
+def test_batch_isolates_failures():
+    tasks = [ (b, {}) for b in ('slow', 'crash', 'error', 'ok') ]
+    records = list(driver(workers=2, timeout=2, job=flaky_job).run(tasks))
+    statuses = { r['binary']: r['status'] for r in records }
+
+    nt.eq_(statuses, { 'slow': 'timeout', 'crash': 'crashed', 'error': 'error', 'ok': 'ok' })
+
+def test_batch_recycles_workers():
+    tasks = [ (str(i), {}) for i in range(4) ]
+    records = list(driver(workers=1, max_tasks_per_worker=1, job=echo_job).run(tasks))
+    pids = set(r['result']['pid'] for r in records)
+
+    nt.eq_(len(pids), 4)
+
+def test_batch_peak_rss_per_binary():
+    if not os.path.exists('/proc/self/clear_refs'):
+        raise nose.SkipTest('per-task peak memory needs Linux')
+
+    # The small binary runs after the large one in the same worker
+    tasks = [ ('200', {}), ('1', {}) ]
+    [large, small] = list(driver(workers=1, job=alloc_job).run(tasks))
+
+    nt.ok_(large['peak_rss'] > 200 * 1024 * 1024)
+    nt.ok_(small['peak_rss'] < large['peak_rss'] - 150 * 1024 * 1024)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,77 @@
+import nose
+import nose.tools as nt
+from static_jump_resolution.cfg_resolver import StaticJumpResolver, ResolverCache, FunctionView
+from static_jump_resolution.supergraph import DummyNode
+
+import fixtures
+
+def check_single_pass(table_style):
+    fixture = fixtures.generate(functions=30, jump_tables=0.5, table_style=table_style, seed=4)
+    proj = fixtures.project(fixture)
+
+    resolver = StaticJumpResolver(proj)
+    cfg = proj.analyses.CFGFast(indirect_jump_resolvers=[resolver])
+
+    jumps = dict((j.ins_addr, j) for j in cfg.indirect_jumps.values())
+    for (addr, targets) in fixture.jump_tables.items():
+        nt.eq_(sorted(set(jumps[addr].resolved_targets)), targets)
+
+        # The targets are part of the recovered CFG
+        node = cfg.model.get_any_node(addr, anyaddr=True)
+        nt.ok_(set(targets) <= set(s.addr for s in node.successors))
+
+def test_single_pass_absolute():
+    check_single_pass('absolute')
+
+def test_single_pass_relative():
+    check_single_pass('relative')
+
+def test_cache():
+    fixture = fixtures.generate(functions=10, jump_tables=1.0, seed=5)
+    (proj, cfg) = fixtures.load(fixture, normalize=False, resolve_indirect_jumps=False)
+
+    cache = ResolverCache(proj)
+    (a, b) = (StaticJumpResolver(proj, cache), StaticJumpResolver(proj, cache))
+
+    jump = sorted(fixture.jump_tables)[0]
+    node = cfg.model.get_any_node(jump, anyaddr=True)
+    block = proj.factory.block(node.addr, node.size)
+    nt.ok_(a.filter(cfg, node.addr, node.function_address, block, 'Ijk_Boring'))
+
+    (resolved, targets) = a.resolve(cfg, node.addr, node.function_address, block, 'Ijk_Boring')
+    nt.ok_(resolved)
+    nt.eq_(targets, fixture.jump_tables[jump])
+    nt.eq_((cache.hits, cache.misses), (0, 1))
+
+    # Answered by the other resolver from the shared cache
+    nt.eq_(b.resolve(cfg, node.addr, node.function_address, block, 'Ijk_Boring'),
+            (True, targets))
+    nt.eq_((cache.hits, cache.misses), (1, 1))
+
+    # A new CFG has its own results
+    other = proj.analyses.CFGFast(resolve_indirect_jumps=False)
+    node = other.model.get_any_node(jump, anyaddr=True)
+    nt.eq_(b.resolve(other, node.addr, node.function_address, block, 'Ijk_Boring'),
+            (True, targets))
+    nt.eq_((cache.hits, cache.misses), (1, 2))
+
+def test_function_view():
+    fixture = fixtures.generate(functions=3, shape='chain', jump_tables=0.0, seed=0)
+    (proj, cfg) = fixtures.load(fixture, normalize=False)
+
+    (f1, _) = fixture.functions['f1']
+    view = FunctionView(cfg, f1)
+    call = view.node_at(f1)
+    nt.ok_(call is not None)
+
+    # Callers are dummy call nodes
+    preds = view.predecessors(call)
+    nt.eq_([(type(p), p.dummy_type) for p in preds], [(DummyNode, 'Dummy_Call')])
+    nt.eq_(preds[0].parent_node.function_address, fixture.functions['main'][0])
+
+    # The return site of the call to f2 follows its dummy return node only
+    ret_site = [n for n in view.nodes if n.addr != f1][0]
+    nt.eq_(view.predecessors(ret_site), [DummyNode(call, 'Dummy_Ret')])
+
+if __name__ == '__main__':
+    nose.main()
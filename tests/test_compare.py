@@ -0,0 +1,60 @@
+import nose
+import nose.tools as nt
+from static_jump_resolution.compare import compare, compare_jumps, read_ground_truth, run_tool
+
+import fixtures
+
+import os.path
+
+def test_compare_jumps():
+    angr_jumps = {'0x10': ['0x20', '0x30'], '0x40': None}
+    sjr_jumps = {'0x10': ['0x20', '0x30'], '0x40': ['0x50', '0x60'], '0x70': ['0x80']}
+    truth = {'0x40': ['0x50'], '0x70': ['0x80']}
+
+    (sites, summary) = compare_jumps(angr_jumps, sjr_jumps, truth)
+    nt.eq_(sites['0x40'], {'angr': None, 'sjr': ['0x50', '0x60'], 'truth': ['0x50']})
+    nt.eq_(sites['0x70']['angr'], None)
+
+    nt.eq_(summary['sites'], 3)
+    nt.eq_(summary['angr_resolved'], 1)
+    nt.eq_(summary['sjr_resolved'], 3)
+    nt.eq_(summary['sjr_targets'], 5)
+    nt.eq_(summary['agree'], 1)
+    nt.eq_(summary['sjr_only'], 2)
+    nt.eq_(summary['angr_only'], 0)
+
+    # Only sites with a ground truth are scored
+    nt.eq_(summary['sjr_exact'], 1)
+    nt.eq_(summary['sjr_spurious'], 1)
+    nt.eq_(summary['angr_exact'], 0)
+    nt.eq_(summary['angr_missed'], 2)
+
+    # A failed tool is left out
+    (sites, summary) = compare_jumps(angr_jumps, None)
+    nt.eq_(sites['0x10'], {'angr': ['0x20', '0x30']})
+    nt.ok_('agree' not in summary)
+
+def test_angr_ground_truth():
+    fixture = fixtures.generate(functions=10, jump_tables=0.5, seed=2)
+    truth = read_ground_truth(fixture.manifest_path)
+    nt.ok_(len(truth) > 0)
+
+    result = run_tool(fixture.path, 'angr')
+    (_, summary) = compare_jumps(result['jumps'], None, truth)
+    nt.eq_(summary['angr_exact'], len(truth))
+
+def test_compare():
+    binary = os.path.join(fixtures.BIN_PATH, 'simple_supergraph.o')
+    (report,) = list(compare([binary], sparse=True))
+
+    nt.eq_(report['binary'], binary)
+    for tool in ('angr', 'sjr'):
+        nt.eq_(report[tool]['status'], 'ok')
+        nt.ok_(report[tool]['time'] > 0)
+        nt.ok_(report[tool]['peak_rss'] > 0)
+        nt.eq_(report[tool]['functions'], 2)
+    nt.ok_('analysis_time' in report['sjr'])
+    nt.eq_(report['summary']['sites'], 0)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,88 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+from static_jump_resolution.def_use import may_alias, StmtSummary, BlockSummary, DefUseIndex
+from static_jump_resolution.vars import Register, StackVar, MemoryLocation
+
+def test_may_alias():
+    nt.ok_(may_alias(Register(16, 8), Register(16, 4)))
+    nt.ok_(may_alias(Register(16, 8), Register(20, 4)))
+    nt.ok_(not may_alias(Register(16, 4), Register(20, 4)))
+
+    nt.ok_(may_alias(StackVar(0, -8, 8), StackVar(0, -4, 4)))
+    nt.ok_(not may_alias(StackVar(0, -8, 4), StackVar(0, -4, 4)))
+    nt.ok_(not may_alias(StackVar(0, -8, 8), StackVar(1, -8, 8)))
+
+    nt.ok_(may_alias(MemoryLocation(None, 8), MemoryLocation(None, 4)))
+    nt.ok_(not may_alias(Register(0, 8), StackVar(0, 0, 8)))
+
+def test_block_summary_relevant_stmts():
+    [a, b, c, d] = arbitrary_vars(4)
+
+    # 0: b = c; 1: d = d; 2: a = b
+    summary = BlockSummary(0, [
+        StmtSummary(0, [b], [c]),
+        StmtSummary(1, [d], [d]),
+        StmtSummary(2, [a], [b]) ])
+
+    nt.ok_(summary.is_relevant({a}))
+    nt.ok_(not summary.is_relevant({c}))
+
+    whitelist, live_in = summary.relevant_stmts({a})
+    nt.eq_(whitelist, {0, 2})
+    nt.eq_(live_in, {c})
+
+    whitelist, live_in = summary.relevant_stmts({c})
+    nt.eq_(whitelist, set())
+    nt.eq_(live_in, {c})
+
+def test_block_summary_jumps_always_relevant():
+    [a, b] = arbitrary_vars(2)
+
+    summary = BlockSummary(0, [ StmtSummary(0, [a], [b]) ], jump_uses=[a])
+    nt.ok_(summary.has_jump)
+    nt.ok_(summary.is_relevant(set()))
+
+    whitelist, live_in = summary.relevant_stmts(set())
+    nt.eq_(whitelist, {0})
+    nt.eq_(live_in, {b})
+
+def test_def_use_index():
+    [a, b] = arbitrary_vars(2)
+    [n1, n2] = [CFGNode(addr, 0) for addr in (0, 1)]
+
+    index = DefUseIndex(0, {
+        n1: BlockSummary(0, [ StmtSummary(0, [a], [b]) ]),
+        n2: BlockSummary(1, [ StmtSummary(0, [b], []) ], jump_uses=[a]) })
+
+    nt.eq_(index.defs_of(a), {n1})
+    nt.eq_(index.defs_of(b), {n2})
+    nt.eq_(index.uses_of(a), {n2})
+    nt.eq_(index.uses_of(b), {n1})
+    nt.eq_(index.jump_nodes(), {n2})
+
+    nt.ok_(index.is_relevant(n1, {a}))
+    nt.ok_(not index.is_relevant(n1, {b}))
+    nt.eq_(index.relevant_nodes({a}), {n1, n2})
+    nt.eq_(index.relevant_nodes(set()), {n2})
+
+def test_def_use_index_registers():
+    (rax, eax, ah, rbx) = (Register(16, 8), Register(16, 4), Register(17, 1), Register(40, 8))
+    [n1, n2, n3] = [CFGNode(addr, 0) for addr in (0, 1, 2)]
+
+    index = DefUseIndex(0, {
+        n1: BlockSummary(0, [ StmtSummary(0, [eax], []) ]),
+        n2: BlockSummary(1, [ StmtSummary(0, [ah], []) ]),
+        n3: BlockSummary(2, [ StmtSummary(0, [rbx], [rax]) ]) })
+
+    # Registers are told apart, but overlapping ones are still found
+    nt.eq_(index.defs_of(rax), {n1, n2})
+    nt.eq_(index.defs_of(Register(16, 1)), {n1})
+    nt.eq_(index.defs_of(rbx), {n3})
+    nt.eq_(index.uses_of(ah), {n3})
+    nt.eq_(index.relevant_nodes({Register(20, 4)}), set())
+
+if __name__ == '__main__':
+    nose.main()
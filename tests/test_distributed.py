@@ -0,0 +1,96 @@
+import nose
+import nose.tools as nt
+
+import archinfo
+
+from static_jump_resolution.distributed import Broker, BrokerTransport, solve_distributed
+from static_jump_resolution.resolve import format_jumps
+from static_jump_resolution.results import ResultsFile
+from static_jump_resolution.vars import Register
+
+import fixtures
+
+import os.path
+
+def test_broker():
+    broker = Broker()
+    try:
+        a = BrokerTransport(broker.address, 1, broker.authkey)
+        a.send(2, ('early', 1))
+
+        # Held until the endpoint connects
+        b = BrokerTransport(broker.address, 2, broker.authkey)
+        nt.eq_(b.receive(5), ('early', 1))
+        b.send(1, ('reply',))
+        nt.eq_(a.receive(5), ('reply',))
+        nt.eq_(a.receive(0.01), None)
+
+        a.close()
+        b.close()
+    finally:
+        broker.close()
+
+def test_broker_tcp():
+    broker = Broker(('127.0.0.1', 0))
+    try:
+        a = BrokerTransport(broker.address, 0, broker.authkey)
+        a.send(0, ('self',))
+        nt.eq_(a.receive(5), ('self',))
+        a.close()
+    finally:
+        broker.close()
+
+def results_by_node(paths):
+    results = {}
+    for path in paths:
+        with ResultsFile(path) as f:
+            for fn in f.functions():
+                for n in f.results_for_function(fn):
+                    nt.ok_((fn, n.addr) not in results)
+                    results[(fn, n.addr)] = sorted(n.livesets)
+    return results
+
+def check_distributed(sparse, **params):
+    fixture = fixtures.generate(**params)
+    (proj, cfg) = fixtures.load(fixture)
+    tmpdir = fixtures.scratch_dir('distributed')
+
+    analysis = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=sparse)
+    path = os.path.join(tmpdir, 'single.sjr')
+    analysis.save_results(path)
+    expected = results_by_node([path])
+
+    for workers in (2, 3):
+        workdir = os.path.join(tmpdir, 'workers-%d' % workers)
+        solved = solve_distributed(proj, cfg, workdir, workers=workers, timeout=120,
+                slice_visits=50, analysis_options={'sparse': sparse})
+
+        nt.eq_(len(solved['shards']), workers)
+        nt.eq_(solved['jumps'], format_jumps(analysis.jump_resolutions))
+        nt.eq_(results_by_node(r['results'] for r in solved['shards']), expected)
+
+    return (fixture, expected)
+
+def test_solve_distributed():
+    # A chain main -> f1 -> f2, in which only f2 has a jump table, indexed by its argument
+    (fixture, results) = check_distributed(True, functions=3, shape='chain',
+            jump_tables=0.5, seed=10)
+    (f2, size) = fixture.functions['f2']
+    nt.ok_(all(f2 <= j < f2 + size for j in fixture.jump_tables))
+
+    # The slice of the jump, on its argument, flows out of f2 back through the callers, which are
+    # in other shards
+    rdi = Register(archinfo.ArchAMD64().get_register_by_name('rdi').vex_offset, 8)
+    for name in ('main', 'f1', 'f2'):
+        (addr, _) = fixture.functions[name]
+        uses = set(u for ((fn, _), lss) in results.items() if fn == addr \
+                for (_, us) in lss for u in us)
+        nt.ok_(any(u.var == rdi for u in uses))
+
+def test_solve_distributed_recursive():
+    # Calls back into other shards, and jump tables in several of them
+    check_distributed(False, functions=8, calls=2, recursion=0.3, jump_tables=0.4,
+            indirect_calls=0.0, seed=6)
+
+if __name__ == '__main__':
+    nose.main()
@@ -47,6 +47,23 @@ def test_replace_tmps():
         pyvex.IRExpr.Get(rbx, 'Ity_I64') ])
     assert_vex_eq(replace_tmps(expr, tmps), expected)
 
+def test_replace_tmps_deep():
+    # Deeper than the recursion limit
+    tmps = { 0: pyvex.IRExpr.Get(rax, 'Ity_I64') }
+    for i in range(1, 5000):
+        tmps[i] = pyvex.IRExpr.Binop('Iop_Add64', [
+            pyvex.IRExpr.RdTmp(i - 1),
+            pyvex.IRExpr.Const(pyvex.IRConst.U64(1)) ])
+
+    expr = replace_tmps(pyvex.IRExpr.RdTmp(4999), tmps)
+    for _ in range(4999):
+        nt.eq_(expr.op, 'Iop_Add64')
+        expr = expr.args[0]
+    assert_vex_eq(expr, tmps[0])
+
+    # Expressions without temporaries are not copied
+    nt.ok_(replace_tmps(tmps[1].args[1], tmps) is tmps[1].args[1])
+
 def test_engine_process_no_indirect_jumps():
     # If there are no indirect jumps we expect the engine to ignore everything
     bytestr = bytes(ks.asm("xor eax,eax; pop rbp; ret")[0])
@@ -59,5 +76,19 @@ def test_engine_process_no_indirect_jumps():
     engine.process(init_state, block=block)
     nt.eq_(engine.state, expected_final)
 
+def test_forget_blocks():
+    engine = SimEngineSJRVEX()
+    short = Block(0, arch=amd64, byte_string=bytes(ks.asm("mov rax, rbx; ret")[0]))
+    engine.summarize(short, LiveVars(amd64, 0).execution_ctx)
+    stmts = engine.substituted_stmts(short)
+
+    # The block at the same address after it is extended
+    longer = Block(0, arch=amd64, byte_string=bytes(ks.asm("mov rax, rbx; mov rcx, rax; ret")[0]))
+    nt.ok_(engine.substituted_stmts(longer) is stmts)
+
+    engine.forget_blocks([0])
+    nt.eq_(len(engine._block_summaries), 0)
+    nt.ok_(len(engine.substituted_stmts(longer)[0]) > len(stmts[0]))
+
 if __name__ == "__main__":
     nose.main()
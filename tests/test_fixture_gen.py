@@ -0,0 +1,77 @@
+import nose
+import nose.tools as nt
+
+import fixture_gen
+import fixtures
+
+import json
+import os.path
+
+def test_load():
+    fixture = fixtures.generate(functions=20, seed=1)
+    proj = fixtures.project(fixture)
+
+    nt.eq_(proj.entry, fixture.entry)
+    for (name, (addr, size)) in fixture.functions.items():
+        sym = proj.loader.find_symbol(name)
+        nt.eq_(sym.rebased_addr, addr)
+        nt.eq_(sym.size, size)
+
+    with open(fixture.manifest_path) as f:
+        manifest = json.load(f)
+    nt.eq_(manifest['params']['functions'], 20)
+    nt.eq_(len(manifest['functions']), 20)
+
+def test_deterministic():
+    # Generated anew, bypassing the cache
+    tmpdir = fixtures.scratch_dir('deterministic')
+    params = {'functions': 50, 'jump_tables': 0.5, 'indirect_calls': 0.5, 'recursion': 0.5}
+    a = fixture_gen.generate(os.path.join(tmpdir, 'a'), seed=7, **params)
+    b = fixture_gen.generate(os.path.join(tmpdir, 'b'), seed=7, **params)
+    c = fixture_gen.generate(os.path.join(tmpdir, 'c'), seed=8, **params)
+
+    with open(a.path, 'rb') as f:
+        code_a = f.read()
+    with open(b.path, 'rb') as f:
+        code_b = f.read()
+    with open(c.path, 'rb') as f:
+        code_c = f.read()
+
+    nt.eq_(code_a, code_b)
+    nt.ok_(code_a != code_c)
+
+def test_shapes():
+    chain = fixtures.generate(functions=5, shape='chain')
+    nt.eq_(chain.calls, {'main': ['f1'], 'f1': ['f2'], 'f2': ['f3'], 'f3': ['f4'], 'f4': []})
+
+    tree = fixtures.generate(functions=7, shape='tree', calls=2)
+    nt.eq_(tree.calls['main'], ['f1', 'f2'])
+    nt.eq_(tree.calls['f2'], ['f5', 'f6'])
+
+    nt.assert_raises(ValueError, fixtures.generate, shape='mesh')
+
+def check_ground_truth(table_style):
+    fixture = fixtures.generate(functions=40, jump_tables=0.5, indirect_calls=0.3,
+            table_style=table_style, seed=2)
+    nt.ok_(len(fixture.jump_tables) > 0)
+    nt.ok_(len(fixture.indirect_calls) > 0)
+
+    (proj, cfg) = fixtures.load(fixture)
+    nt.eq_(set(cfg.kb.functions), set(a for (a, _) in fixture.functions.values()))
+
+    jumps = dict((j.ins_addr, j) for j in cfg.indirect_jumps.values())
+    for (addr, targets) in fixture.jump_tables.items():
+        nt.eq_(sorted(set(jumps[addr].resolved_targets)), targets)
+
+    for (addr, target) in fixture.indirect_calls.items():
+        node = cfg.model.get_any_node(addr, anyaddr=True)
+        nt.ok_(target in [s.addr for s in node.successors])
+
+def test_ground_truth_absolute():
+    check_ground_truth('absolute')
+
+def test_ground_truth_relative():
+    check_ground_truth('relative')
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,128 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+import keystone
+import networkx as nx
+import numpy as np
+import tempfile
+from keystone import KS_ARCH_X86, KS_MODE_64
+from types import SimpleNamespace
+
+from static_jump_resolution.engine import SimEngineSJRVEX
+from static_jump_resolution.jump_table import match_jump_table, index_bound, ReadOnlyMemory, \
+        JumpTableResolver
+
+from angr import Block
+
+amd64 = archinfo.ArchAMD64()
+ks = keystone.Ks(KS_ARCH_X86, KS_MODE_64)
+
+def block_node(addr, asm, fn_addr=0):
+    bytestr = bytes(ks.asm(asm, addr)[0])
+    return BlockNode(Block(addr, arch=amd64, byte_string=bytestr), fn_addr)
+
+def test_match_absolute_table():
+    engine = SimEngineSJRVEX()
+    n = block_node(0x10, "mov eax, eax; jmp qword ptr [rax*8 + 0x4000]")
+    (_, next_expr) = engine.substituted_stmts(n.block)
+
+    table = match_jump_table(next_expr)
+    nt.ok_(table is not None)
+    nt.eq_(table.base, 0x4000)
+    nt.eq_(table.scale, 8)
+    nt.eq_(table.entry_size, 8)
+    nt.assert_is_none(table.rel_base)
+
+def test_match_relative_table():
+    engine = SimEngineSJRVEX()
+    n = block_node(0x10, "mov eax, eax; lea rdx, [rip + 0x1000]; " \
+            "movsxd rax, dword ptr [rdx + rax*4]; add rax, rdx; jmp rax")
+    (_, next_expr) = engine.substituted_stmts(n.block)
+
+    table = match_jump_table(next_expr)
+    nt.ok_(table is not None)
+    nt.eq_(table.scale, 4)
+    nt.eq_(table.entry_size, 4)
+    nt.ok_(table.signed)
+    nt.eq_(table.rel_base, table.base)
+
+def test_match_not_a_table():
+    engine = SimEngineSJRVEX()
+    n = block_node(0x10, "jmp rax")
+    (_, next_expr) = engine.substituted_stmts(n.block)
+
+    nt.assert_is_none(match_jump_table(next_expr))
+
+def test_index_bound_from_guard():
+    engine = SimEngineSJRVEX()
+    guard = block_node(0x0, "cmp eax, 5; ja 0x100")
+    jump = block_node(guard.block.addr + guard.block.size,
+            "mov eax, eax; jmp qword ptr [rax*8 + 0x4000]")
+    graph = nx.DiGraph([(guard, jump)])
+
+    (_, next_expr) = engine.substituted_stmts(jump.block)
+    table = match_jump_table(next_expr)
+    nt.eq_(index_bound(engine, graph, jump, table.index), 5)
+
+    unguarded = block_node(0x200, "mov ebx, 3")
+    graph.add_edge(unguarded, jump)
+    nt.assert_is_none(index_bound(engine, graph, jump, table.index))
+
+def test_resolve_scale():
+    class FakeMemory:
+        def __init__(self):
+            self.reads = []
+        def read_array(self, addr, entry_size, count, signed=False, end='Iend_LE'):
+            self.reads.append((addr, entry_size, count))
+            return np.arange(0x100, 0x100 + count * entry_size, entry_size, dtype=np.uint64)
+
+    engine = SimEngineSJRVEX()
+    project = SimpleNamespace(arch=amd64)
+    guard = block_node(0x0, "cmp rax, 31; ja 0x100")
+    addr = guard.block.addr + guard.block.size
+
+    jump = block_node(addr, "jmp qword ptr [rax*8 + 0x1000]")
+    resolver = JumpTableResolver(project, engine, nx.DiGraph([(guard, jump)]), memory=FakeMemory())
+    (_, next_expr) = engine.substituted_stmts(jump.block)
+    nt.eq_(resolver.resolve(jump, next_expr), set(range(0x100, 0x200, 8)))
+    nt.eq_(resolver.memory.reads, [(0x1000, 8, 32)])
+
+    # Byte-scaled 8-byte entries overlap each other
+    jump = block_node(addr + 0x1000, "jmp qword ptr [rax + 0x1000]")
+    resolver = JumpTableResolver(project, engine, nx.DiGraph([(guard, jump)]), memory=FakeMemory())
+    (_, next_expr) = engine.substituted_stmts(jump.block)
+    nt.assert_is_none(resolver.resolve(jump, next_expr))
+    nt.eq_(resolver.memory.reads, [])
+
+def test_read_only_memory():
+    data = b'\x00' * 16 + bytes(range(16))
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(data)
+        f.flush()
+
+        region = SimpleNamespace(is_writable=False,
+                contains_addr=lambda a: 0x1000 <= a < 0x1000 + len(data))
+        class FakeObject:
+            binary = f.name
+            relocs = []
+            find_section_containing = staticmethod(lambda a: region)
+            find_segment_containing = staticmethod(lambda a: None)
+            addr_to_offset = staticmethod(lambda a: a - 0x1000)
+
+        obj = FakeObject()
+        loader = SimpleNamespace(find_object_containing=lambda a: obj)
+
+        memory = ReadOnlyMemory(loader)
+        nt.eq_(list(memory.read_array(0x1010, 4, 2)), [0x03020100, 0x07060504])
+        nt.eq_(list(memory.read_array(0x1010, 2, 1, end='Iend_BE')), [0x0001])
+        nt.assert_is_none(memory.read_array(0x1010, 8, 3))
+
+        region.is_writable = True
+        nt.assert_is_none(memory.read_array(0x1010, 4, 2))
+        memory.close()
+
+if __name__ == '__main__':
+    nose.main()
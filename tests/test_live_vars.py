@@ -9,9 +9,10 @@ from angr.analyses.code_location import CodeLocation
 import pyvex
 import archinfo
 
-from static_jump_resolution.context import CallString
-from static_jump_resolution.live_vars import QualifiedLiveSet, vars_modified, vars_used
-from static_jump_resolution.vars import Register, StackVar, MemoryLocation
+from static_jump_resolution.context import CallString, ExecutionCtx
+from static_jump_resolution.live_vars import LiveVars, QualifiedLiveSet, vars_modified, vars_used, \
+        vars_used_expr
+from static_jump_resolution.vars import Register, StackVar, MemoryLocation, MEMORY_SUMMARY
 
 amd64 = archinfo.ArchAMD64()
 sp = amd64.sp_offset
@@ -60,6 +61,67 @@ def test_qualified_live_set_kill_vars():
     liveset.kill_vars([kill])
     nt.eq_(liveset, expected)
 
+def test_live_vars_collapsed():
+    vars = arbitrary_vars(2)
+    uses = arbitrary_var_uses(vars, 1)
+
+    state = LiveVars(amd64, 0, [
+        QualifiedLiveSet(arbitrary_call_string(1), uses[vars[0]]),
+        QualifiedLiveSet(arbitrary_call_string(2), uses[vars[1]]),
+    ], sp=-8)
+
+    collapsed = state.collapsed()
+    nt.eq_(collapsed.livesets, { QualifiedLiveSet(CallString(), uses[vars[0]] + uses[vars[1]]) })
+    nt.eq_(collapsed.sp, -8)
+    nt.eq_(len(state.livesets), 2)
+
+    # Memory locations collapse into the summary location, keeping their code locations
+    loc = CodeLocation(0x10, 1)
+    mem = [ VarUse(MemoryLocation('0x4000', 8), loc), VarUse(MemoryLocation('0x4008', 8), loc) ]
+    state = LiveVars(amd64, 0, [ QualifiedLiveSet(CallString(), mem) ])
+    nt.eq_(state.collapsed().unqualified_uses(), { VarUse(MEMORY_SUMMARY, loc) })
+
+def test_live_vars_difference():
+    vars = arbitrary_vars(3)
+    uses = arbitrary_var_uses(vars, 1)
+    (cs1, cs2) = (arbitrary_call_string(1), arbitrary_call_string(2))
+
+    old = LiveVars(amd64, 0, [QualifiedLiveSet(cs1, uses[vars[0]])])
+    new = LiveVars(amd64, 0, [
+        QualifiedLiveSet(cs1, uses[vars[0]] + uses[vars[1]]),
+        QualifiedLiveSet(cs2, uses[vars[2]]),
+    ])
+
+    nt.eq_(new.difference(old).livesets, {
+        QualifiedLiveSet(cs1, uses[vars[1]]),
+        QualifiedLiveSet(cs2, uses[vars[2]]),
+    })
+    nt.eq_(old.difference(new).livesets, set())
+
+    # New contexts are kept even if empty
+    nt.eq_(LiveVars(amd64, 0).difference(old).livesets, { QualifiedLiveSet(CallString()) })
+
+def test_live_vars_gen_uses_if_killed():
+    vars = arbitrary_vars(3)
+    uses = arbitrary_var_uses(vars, 1)
+    (cs1, cs2) = (arbitrary_call_string(1), arbitrary_call_string(2))
+
+    state = LiveVars(amd64, 0, [
+        QualifiedLiveSet(cs1, uses[vars[0]] + uses[vars[1]]),
+        QualifiedLiveSet(cs2, uses[vars[1]]),
+    ])
+    state.gen_uses_if_killed(uses[vars[2]], {vars[0]})
+    nt.eq_(state.livesets, {
+        QualifiedLiveSet(cs1, uses[vars[1]] + uses[vars[2]]),
+        QualifiedLiveSet(cs2, uses[vars[1]]),
+    })
+
+    # Any store may define the summary location, which stays live
+    summary = VarUse(MEMORY_SUMMARY, CodeLocation(0x10, 1))
+    state = LiveVars(amd64, 0, [ QualifiedLiveSet(cs1, [summary]) ])
+    state.gen_uses_if_killed(uses[vars[2]], {MemoryLocation('0x4000', 8)})
+    nt.eq_(state.unqualified_uses(), set([summary] + uses[vars[2]]))
+
 def test_vars_modified_store():
     ctx = arbitrary_context()
     rax = amd64.get_register_by_name("rax").vex_offset
@@ -131,6 +193,22 @@ def test_vars_used_put():
     expected = { MemoryLocation(addr, 8), Register(rax, 8) }
     nt.eq_(expected, vars_used(stmt, ctx, amd64))
 
+def test_vars_used_memoized():
+    ctx = arbitrary_context()
+    rax = amd64.get_register_by_name("rax").vex_offset
+
+    expr = pyvex.IRExpr.Binop('Iop_Add64', [
+        pyvex.IRExpr.Get(rax, 'Ity_I64'),
+        pyvex.IRExpr.Get(sp, 'Ity_I64') ])
+    used = vars_used_expr(expr, ctx, amd64)
+    nt.eq_(used, { Register(rax, 8) })
+    nt.ok_(vars_used_expr(expr, ctx, amd64) is used)
+
+    # The result depends on the execution context
+    other = ExecutionCtx(ctx.fn_addr, ctx.sp - 8, ctx.bp)
+    load = pyvex.IRExpr.Load('Iend_LE', 'Ity_I64', pyvex.IRExpr.Get(sp, 'Ity_I64'))
+    nt.ok_(vars_used_expr(load, ctx, amd64) != vars_used_expr(load, other, amd64))
+
 def test_vars_used_store():
     ctx = arbitrary_context()
     rax = amd64.get_register_by_name("rax").vex_offset
@@ -0,0 +1,45 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+import networkx as nx
+
+from static_jump_resolution.live_vars import LiveVars, QualifiedLiveSet, VarUse
+from static_jump_resolution.memory import memory_report
+from static_jump_resolution.vars import Register
+
+amd64 = archinfo.ArchAMD64()
+
+def test_distinct_and_total_instances():
+    [n0, n1, n2] = [CFGNode(addr, addr // 2) for addr in range(3)]
+    graph = nx.DiGraph([(n0, n1), (n1, n2)])
+
+    # Two equal but distinct call strings, one shared between two states. Uses are interned, so
+    # equal uses are the same object.
+    use = VarUse(Register(16, 8.0), CodeLocation(0, 0))
+    cs = arbitrary_call_string(1)
+    states = {
+        n0: LiveVars(amd64, 0, [QualifiedLiveSet(cs, [use])]),
+        n1: LiveVars(amd64, 0, [QualifiedLiveSet(cs, [use])]),
+        n2: LiveVars(amd64, 1, [QualifiedLiveSet(cs.copy(), [VarUse(Register(16, 8.0),
+            CodeLocation(0, 0))])]),
+    }
+
+    report = memory_report(states, graph=graph)
+
+    callstrings = report.classes['CallString']
+    nt.eq_((callstrings.refs, callstrings.objects, callstrings.values), (3, 2, 1))
+    uses = report.classes['VarUse']
+    nt.eq_((uses.refs, uses.objects, uses.values), (3, 1, 1))
+    nt.eq_(report.classes['LiveVars'].values, None)
+
+    nt.eq_(set(report.categories), {'states', 'graph'})
+    nt.eq_(set(report.functions), {0, 1})
+    nt.ok_(report.functions[0] > report.functions[1])
+    nt.eq_(report.total, sum(report.categories.values()))
+    nt.ok_('VarUse' in report.summary(top=len(report.classes)))
+
+if __name__ == '__main__':
+    nose.main()
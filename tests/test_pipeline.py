@@ -0,0 +1,70 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+import networkx as nx
+import os
+import tempfile
+
+from static_jump_resolution.pipeline import Pipeline, Checkpoints, _GraphPickler, _GraphUnpickler
+
+bin_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bin')
+
+def test_checkpoints_share_graph_nodes():
+    amd64 = archinfo.ArchAMD64()
+    [n0, n1, n2] = [CFGNode(addr, 0) for addr in range(3)]
+    graph = nx.DiGraph([(n0, n1), (n1, n2)])
+
+    with tempfile.TemporaryDirectory() as d:
+        checkpoints = Checkpoints(d)
+        checkpoints.save('snapshot', {'states': {n1: [amd64]}, 'worklist': [n2, n0]},
+                lambda f: _GraphPickler(f, graph, amd64))
+
+        snapshot = checkpoints.load('snapshot', lambda f: _GraphUnpickler(f, graph, amd64))
+        nt.eq_(snapshot['worklist'], [n2, n0])
+        nt.ok_(snapshot['worklist'][0] is n2)
+        nt.ok_(snapshot['states'][n1][0] is amd64)
+
+        checkpoints.clear()
+        nt.ok_(not checkpoints.exists('snapshot'))
+
+def test_pipeline_resumes():
+    binary = os.path.join(bin_path, 'simple_supergraph.o')
+
+    with tempfile.TemporaryDirectory() as d:
+        first = Pipeline(binary, d)
+        first.run(until='load')
+        nt.eq_(first.stages_run, ['load'])
+
+        second = Pipeline(binary, d)
+        second.run(until='cfg')
+        nt.eq_(second.stages_run, ['cfg'])
+        nt.ok_(second.cfg.functions is not None)
+        nt.ok_(not second.checkpoints.exists('load'))
+
+        third = Pipeline(binary, d)
+        third.run(resume=False, until='load')
+        nt.eq_(third.stages_run, ['load'])
+        nt.ok_(not third.checkpoints.exists('cfg'))
+
+def test_pipeline_resumes_over_budget():
+    binary = os.path.join(bin_path, 'simple_jump.o')
+
+    with tempfile.TemporaryDirectory() as d:
+        first = Pipeline(binary, d, analysis_options={'max_visits': 3})
+        first.run(until='fixpoint')
+        nt.eq_(first.analysis.budget_exceeded, 'visits')
+        visited = set(first.analysis.visited_nodes)
+
+        # The resumed fixpoint stays stopped, and only the jumps it reached are resolved
+        second = Pipeline(binary, d, analysis_options={'max_visits': 3})
+        report = second.run()
+        nt.eq_(second.stages_run, ['fixpoint', 'resolve', 'report'])
+        nt.eq_(report['budget_exceeded'], 'visits')
+        nt.eq_(set(second.analysis.visited_nodes), visited)
+        nt.eq_(second.analysis.iterations, first.analysis.iterations)
+
+if __name__ == '__main__':
+    nose.main()
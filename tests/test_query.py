@@ -0,0 +1,75 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+import networkx as nx
+
+from static_jump_resolution.live_vars import LiveVars, QualifiedLiveSet, VarUse
+from static_jump_resolution.query import ResultIndex
+from static_jump_resolution.resolve import JumpResolution
+from static_jump_resolution.vars import Register
+
+amd64 = archinfo.ArchAMD64()
+
+def live_at(fn_addr, *uses):
+    return LiveVars(amd64, fn_addr, [QualifiedLiveSet(CallString(), uses)])
+
+def example():
+    """ Two functions: 0x10 -> 0x11 -> 0x12 (jump), with 0x20 -> 0x21 (jump) reachable from 0x11
+    only through a call.
+    """
+    [n10, n11, n12] = [CFGNode(a, 0x10) for a in (0x10, 0x11, 0x12)]
+    [n20, n21] = [CFGNode(a, 0x20) for a in (0x20, 0x21)]
+    graph = nx.DiGraph([(n10, n11), (n11, n12), (n11, n20), (n20, n21)])
+
+    rax = Register(16, 8.0)
+    rbx = Register(24, 8.0)
+    rax_use = VarUse(rax, CodeLocation(0x10, 1))
+    rbx_use = VarUse(rbx, CodeLocation(0x20, 3))
+
+    states = {
+        n10: live_at(0x10),
+        n11: live_at(0x10, rax_use),
+        n12: live_at(0x10),
+        n20: live_at(0x20, rbx_use),
+        n21: live_at(0x20),
+    }
+    jumps = dict((n.addr, JumpResolution(n, frozenset([0x30]))) for n in (n12, n21))
+    return (ResultIndex(states, jumps, graph), states, rax, rbx)
+
+def test_by_function_and_block():
+    (index, states, _, _) = example()
+
+    nt.eq_(index.functions(), [0x10, 0x20])
+    results = index.for_function(0x10)
+    nt.eq_(len(results), 3)
+    nt.eq_([r.addr for r in results], [0x10, 0x11, 0x12])
+    nt.eq_(results[1].state, states[CFGNode(0x11, 0x10)])
+    nt.eq_(results[1].function_addr, 0x10)
+    nt.eq_(len(index.for_function(0x99)), 0)
+
+    nt.eq_([r.addr for r in index.for_block(0x20)], [0x20])
+
+def test_by_jump():
+    (index, _, _, _) = example()
+
+    nt.eq_(index.jump_sites(), [0x12, 0x21])
+    nt.eq_(index.jump_sites(0x20), [0x21])
+    nt.eq_(index.for_jump(0x12).addr, 0x12)
+    nt.eq_(index.jump_resolution(0x21).targets, frozenset([0x30]))
+    nt.eq_(index.for_jump(0x99), None)
+
+def test_by_var():
+    (index, _, rax, rbx) = example()
+
+    nt.eq_([r.addr for r in index.for_var(rax)], [0x11])
+    nt.eq_(index.uses_of(rbx), { VarUse(rbx, CodeLocation(0x20, 3)) })
+
+    nt.eq_(index.jump_sites_fed_by(rax), [0x12, 0x21])
+    nt.eq_(index.jump_sites_fed_by(rbx), [0x21])
+    nt.eq_(index.jump_sites_fed_by(Register(32, 8.0)), [])
+
+if __name__ == '__main__':
+    nose.main()
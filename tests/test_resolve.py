@@ -0,0 +1,99 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+import keystone
+import networkx as nx
+from keystone import KS_ARCH_X86, KS_MODE_64
+from types import SimpleNamespace
+
+from static_jump_resolution.context import CallString
+from static_jump_resolution.engine import SimEngineSJRVEX
+from static_jump_resolution.live_vars import LiveVars, QualifiedLiveSet, VarUse
+from static_jump_resolution.resolve import TargetResolver, apply_op
+from static_jump_resolution.vars import Register
+
+from angr.analyses.code_location import CodeLocation
+
+from angr import Block
+
+amd64 = archinfo.ArchAMD64()
+ks = keystone.Ks(KS_ARCH_X86, KS_MODE_64)
+
+def block_node(addr, asm, fn_addr=0):
+    bytestr = bytes(ks.asm(asm, addr)[0])
+    return BlockNode(Block(addr, arch=amd64, byte_string=bytestr), fn_addr)
+
+def resolver_for(graph):
+    return TargetResolver(SimpleNamespace(arch=amd64), SimEngineSJRVEX(), graph)
+
+def test_apply_op():
+    nt.eq_(apply_op('Iop_Add64', (0x1000, 0x10)), 0x1010)
+    nt.eq_(apply_op('Iop_Sub32', (0, 1)), 0xffffffff)
+    nt.eq_(apply_op('Iop_Shl64', (3, 3)), 24)
+    nt.eq_(apply_op('Iop_Sar32', (0x80000000, 4)), 0xf8000000)
+    nt.eq_(apply_op('Iop_32Uto64', (0xffffffff,)), 0xffffffff)
+    nt.eq_(apply_op('Iop_32Sto64', (0xffffffff,)), 0xffffffffffffffff)
+    nt.eq_(apply_op('Iop_64to32', (0x123456789,)), 0x23456789)
+    nt.assert_is_none(apply_op('Iop_DivU64', (4, 2)))
+
+def test_resolve_stack_slot():
+    n = block_node(0, "mov qword ptr [rsp+8], 0x1000; mov rax, [rsp+8]; add rax, 0x10; jmp rax")
+    graph = nx.DiGraph()
+    graph.add_node(n)
+
+    resolution = resolver_for(graph).resolve(n)
+    nt.ok_(resolution.resolved)
+    nt.eq_(resolution.targets, {0x1010})
+
+def test_resolve_through_predecessors():
+    n0 = block_node(0, "mov rbx, 0x2000; test rcx, rcx; je 0x20")
+    n1 = block_node(0x10, "mov rbx, 0x3000")
+    n2 = block_node(0x20, "jmp rbx")
+    graph = nx.DiGraph([(n0, n1), (n0, n2), (n1, n2)])
+
+    resolution = resolver_for(graph).resolve(n2)
+    nt.eq_(resolution.targets, {0x2000, 0x3000})
+
+def test_resolve_through_loop():
+    n0 = block_node(0, "mov rbx, 0x1000")
+    n1 = block_node(0x10, "dec rcx; jne 0x10")
+    n2 = block_node(0x20, "jmp rbx")
+    graph = nx.DiGraph([(n0, n1), (n1, n1), (n1, n2)])
+
+    # Loop-invariant definitions reach the jump around the loop
+    nt.eq_(resolver_for(graph).resolve(n2).targets, {0x1000})
+
+    # Loop-carried ones do not stabilize
+    n1 = block_node(0x10, "add rbx, 8; dec rcx; jne 0x10")
+    graph = nx.DiGraph([(n0, n1), (n1, n1), (n1, n2)])
+    nt.assert_is_none(resolver_for(graph).resolve(n2).targets)
+
+def test_resolve_from_slice():
+    n0 = block_node(0, "mov rbx, 0x2000")
+    n1 = block_node(0x10, "mov rax, rbx; jmp rax")
+    graph = nx.DiGraph([(n0, n1)])
+
+    rbx = Register(amd64.get_register_by_name('rbx').vex_offset, 8)
+    use = VarUse(rbx, CodeLocation(n1.addr, 2))
+    state = LiveVars(amd64, 0, [QualifiedLiveSet(CallString(), [use])])
+    nt.eq_(resolver_for(graph).resolve(n1, state).targets, {0x2000})
+
+    # Variables outside the slice are not traced
+    nt.assert_is_none(resolver_for(graph).resolve(n1, LiveVars(amd64, 0)).targets)
+
+def test_resolve_unknown():
+    n = block_node(0, "jmp rdi")
+    graph = nx.DiGraph()
+    graph.add_node(n)
+
+    resolution = resolver_for(graph).resolve(n)
+    nt.ok_(not resolution.resolved)
+    nt.assert_is_none(resolution.targets)
+
+    nt.assert_is_none(resolver_for(graph).resolve(block_node(0x10, "ret")))
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,59 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+import os
+import tempfile
+
+from static_jump_resolution.live_vars import LiveVars, QualifiedLiveSet
+from static_jump_resolution.results import write_results, ResultsFile
+from static_jump_resolution.vars import StackVar, MemoryLocation, MEMORY_SUMMARY
+
+amd64 = archinfo.ArchAMD64()
+
+def test_results_round_trip():
+    vars = arbitrary_vars(70) + [ StackVar(0x100, -8, 8.0), MemoryLocation('0x4000', 4),
+            MEMORY_SUMMARY ]
+    uses = [ VarUse(v, CodeLocation(0x10 + i, i, ins_addr=0x10 + i)) for (i, v) in enumerate(vars) ]
+    ctx = arbitrary_call_string(2)
+
+    [n0, n1, n2] = [ CFGNode(0x20, 0), CFGNode(0x10, 0), CFGNode(0x100, 0x100) ]
+    states = {
+        n0: LiveVars(amd64, 0, [ QualifiedLiveSet(CallString(), uses[:3]),
+            QualifiedLiveSet(ctx, uses[60:70]) ]),
+        n1: LiveVars(amd64, 0, [ QualifiedLiveSet(CallString(), uses[:3]) ], sp=-16),
+        n2: LiveVars(amd64, 0x100, [ QualifiedLiveSet(CallString(), uses[70:]) ], bp=-8),
+        DummyNode(n0, 'Dummy_Call'): LiveVars(amd64, 0),
+    }
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'results.sjr')
+        write_results(path, states)
+
+        with ResultsFile(path) as results:
+            nt.eq_(len(results), 3)
+            nt.eq_(results.functions(), [0, 0x100])
+
+            fn0 = results.results_for_function(0)
+            nt.eq_([r.addr for r in fn0], [0x10, 0x20])
+            nt.eq_(fn0[0].sp, -16)
+            nt.eq_(fn0[0].livesets, [ ((), frozenset(uses[:3])) ])
+            nt.eq_(set(fn0[1].livesets), { ((), frozenset(uses[:3])),
+                ((0, 1), frozenset(uses[60:70])) })
+
+            r2 = results.results_for_node(0x100, 0x100)
+            nt.eq_(r2.bp, -8)
+            nt.eq_(r2.uses(), set(uses[70:]))
+            nt.assert_is_none(results.results_for_node(0x100, 0x104))
+            nt.eq_(results.results_for_function(0x200), [])
+
+def test_results_bad_file():
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(b'\0' * 64)
+        f.flush()
+        nt.assert_raises(ValueError, ResultsFile, f.name)
+
+if __name__ == '__main__':
+    nose.main()
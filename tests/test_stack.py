@@ -0,0 +1,63 @@
+import nose
+import nose.tools as nt
+
+import archinfo
+import keystone
+from keystone import KS_ARCH_X86, KS_MODE_64
+
+import static_jump_resolution
+from static_jump_resolution.engine import SimEngineSJRVEX
+from static_jump_resolution.stack import block_exit_offsets
+from static_jump_resolution.supergraph import SupergraphVisitor
+from static_jump_resolution.vars import StackVar
+
+from angr import Block
+
+import fixtures
+
+amd64 = archinfo.ArchAMD64()
+ks = keystone.Ks(KS_ARCH_X86, KS_MODE_64)
+
+def test_block_exit_offsets():
+    engine = SimEngineSJRVEX()
+    block = Block(0, arch=amd64,
+            byte_string=bytes(ks.asm("push rbp; mov rbp, rsp; sub rsp, 16; mov rbx, rax")[0]))
+
+    nt.eq_(block_exit_offsets(block, 0, None, engine, amd64), (-24, -8))
+    nt.eq_(block_exit_offsets(block, None, 4, engine, amd64), (None, None))
+
+    # The base pointer is overwritten with something other than a frame address
+    block = Block(0x100, arch=amd64, byte_string=bytes(ks.asm("mov rbp, rdi; add rsp, 8")[0]))
+    nt.eq_(block_exit_offsets(block, -16, -8, engine, amd64), (-8, None))
+
+def test_stack_deltas():
+    # main calls f1 and then f3, spilling its argument to two stack slots first
+    fixture = fixtures.generate(functions=4, calls=2, jump_tables=0.0, seed=3)
+    nt.eq_(fixture.calls['main'], ['f1', 'f3'])
+    (main, _) = fixture.functions['main']
+
+    (proj, cfg) = fixtures.load(fixture)
+
+    # Nothing of a lazy supergraph has been constructed yet when the offsets are computed
+    for lazy in (False, True):
+        analysis = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=True, analyze=False,
+                graph_visitor=SupergraphVisitor(cfg, lazy=lazy))
+
+        deltas = analysis.stack_deltas(main)
+        nodes = sorted(analysis.def_use_index(main).summaries(), key=lambda n: n.addr)
+        nt.eq_(len(nodes), 3)
+        nt.eq_(deltas.offsets(nodes[0].addr), (0, None))
+
+        # The return sites of both calls are back in the frame set up by the prologue
+        nt.eq_(deltas.offsets(nodes[1].addr), (-24, -8))
+        nt.eq_(deltas.offsets(nodes[2].addr), (-24, -8))
+
+        # The second slot, stored at [rbp - 16] by the prologue and loaded from it after the first
+        # call, is the same variable in both blocks
+        slot = StackVar(main, -24, 8)
+        index = analysis.def_use_index(main)
+        nt.ok_(slot in index.summary(nodes[0]).defs)
+        nt.ok_(slot in index.summary(nodes[1]).uses)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,142 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import static_jump_resolution
+from static_jump_resolution.engine import is_indirect_jump
+from static_jump_resolution.live_vars import VarUse
+from static_jump_resolution.supergraph import DummyNode, SupergraphVisitor
+from static_jump_resolution.vars import MemoryLocation, MEMORY_SUMMARY
+
+import fixtures
+
+def test_visit_budget():
+    (proj, cfg) = fixtures.load('simple_supergraph.o')
+
+    # Sparse mode visits too few nodes of this graph for a budget to cut short
+    full = proj.analyses.StaticJumpResolutionAnalysis(cfg)
+    nt.eq_(full.budget_exceeded, None)
+
+    limited = proj.analyses.StaticJumpResolutionAnalysis(cfg, max_visits=3)
+    nt.eq_(limited.budget_exceeded, 'visits')
+    nt.eq_(limited.iterations, 3)
+    nt.ok_(len(limited.visited_nodes) < len(full.visited_nodes))
+
+def test_exact_visit_budget():
+    (proj, cfg) = fixtures.load('simple_jump.o')
+
+    full = proj.analyses.StaticJumpResolutionAnalysis(cfg)
+    exact = proj.analyses.StaticJumpResolutionAnalysis(cfg, max_visits=full.iterations)
+    nt.eq_(exact.budget_exceeded, None)
+    nt.eq_(exact.iterations, full.iterations)
+    nt.eq_(exact.node_states, full.node_states)
+
+    short = proj.analyses.StaticJumpResolutionAnalysis(cfg, max_visits=full.iterations - 1)
+    nt.eq_(short.budget_exceeded, 'visits')
+
+def test_time_budget():
+    (proj, cfg) = fixtures.load('simple_supergraph.o')
+
+    analysis = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=True, analyze=False,
+            time_budget=0)
+    nt.ok_(not analysis.step())
+    nt.eq_(analysis.budget_exceeded, 'time')
+    nt.ok_(not analysis.step())
+
+def collapsed_uses(state):
+    return set(VarUse(MEMORY_SUMMARY, u.codeloc) if type(u.var) is MemoryLocation else u \
+            for u in state.unqualified_uses())
+
+def test_widening():
+    fixture = fixtures.generate(functions=6, calls=3, recursion=0.3, jump_tables=0.5, seed=2)
+    (proj, cfg) = fixtures.load(fixture)
+
+    full = proj.analyses.StaticJumpResolutionAnalysis(cfg, max_merges=1000)
+    nt.eq_(full.widened_nodes, {})
+
+    # Only joins of several input states are counted
+    graph = full._graph_visitor.graph
+    nt.ok_(len(full._merge_counts) > 0)
+    nt.ok_(all(graph.in_degree(n) > 1 for n in full._merge_counts))
+
+    widened = proj.analyses.StaticJumpResolutionAnalysis(cfg, max_merges=1)
+    nt.ok_(len(widened.widened_nodes) > 0)
+    nt.ok_(all(count == 2 for count in widened.widened_nodes.values()))
+
+    # Widened states over-approximate the full ones, with memory collapsed into its summary
+    for (node, state) in full.node_states.items():
+        nt.ok_(collapsed_uses(state) <= collapsed_uses(widened.node_states[node]))
+    nt.ok_(any(u.var is MEMORY_SUMMARY for n in widened.widened_nodes \
+            for u in widened.node_states[n].unqualified_uses()))
+
+    nt.eq_(dict((addr, sorted(r.targets)) for (addr, r) in widened.jump_resolutions.items()),
+            fixture.jump_tables)
+
+def test_simple_jump():
+    # main calls one of two functions through a pointer
+    (proj, cfg) = fixtures.load('simple_jump.o')
+    analysis = proj.analyses.StaticJumpResolutionAnalysis(cfg)
+
+    states = analysis._output_state
+    nt.ok_(all(type(u) is VarUse for s in states.values() for ls in s.livesets for u in ls.uses))
+
+    jump = next(n for n in states if type(n) is not DummyNode and not n.is_simprocedure \
+            and is_indirect_jump(n.block) is not None)
+    at_jump = [u for ls in states[jump].livesets for u in ls.uses \
+            if u.codeloc.block_addr == jump.addr and u.codeloc.stmt_idx is None]
+    nt.eq_(len(at_jump), 1)
+    nt.eq_(at_jump[0].codeloc.ins_addr, jump.block.instruction_addrs[-1])
+
+    # The slice of the call target flows on into the call
+    call = DummyNode(jump, 'Dummy_Call')
+    nt.ok_(at_jump[0] in states[call].unqualified_uses())
+
+def test_jump_sites_unresolved():
+    # Without resolution, the result index still finds the jump sites in the graph
+    (proj, cfg) = fixtures.load('simple_jump.o')
+    resolved = proj.analyses.StaticJumpResolutionAnalysis(cfg)
+    unresolved = proj.analyses.StaticJumpResolutionAnalysis(cfg, resolve=False)
+
+    nt.eq_(unresolved.jump_resolutions, {})
+    nt.ok_(len(resolved.result_index().jump_sites()) > 0)
+    nt.eq_(unresolved.result_index().jump_sites(), resolved.result_index().jump_sites())
+
+def test_delta():
+    # Several call sites per function, some of them recursive, so that nodes are revisited with
+    # growing states
+    fixture = fixtures.generate(functions=6, calls=3, recursion=0.3, jump_tables=0.5, seed=2)
+    (proj, cfg) = fixtures.load(fixture)
+
+    for sparse in (False, True):
+        full = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=sparse)
+        delta = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=sparse, delta=True)
+
+        nt.eq_(delta.node_states, full.node_states)
+        nt.eq_(dict((addr, sorted(r.targets)) for (addr, r) in delta.jump_resolutions.items()),
+                fixture.jump_tables)
+
+def test_lazy():
+    # Returns from recursive calls reach callers that the traversal has not entered yet
+    fixture = fixtures.generate(functions=8, calls=3, recursion=0.3, jump_tables=0.5, seed=3)
+    (proj, cfg) = fixtures.load(fixture)
+
+    for sparse in (False, True):
+        eager = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=sparse)
+        lazy = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=sparse,
+                graph_visitor=SupergraphVisitor(cfg, lazy=True))
+        nt.eq_(lazy.node_states, eager.node_states)
+        nt.eq_(lazy.jump_resolutions.keys(), eager.jump_resolutions.keys())
+
+def test_sparse():
+    # Sparse mode skips nodes, but reaches the same states as dense mode
+    for name in ('simple_supergraph.o', 'simple_jump.o'):
+        (proj, cfg) = fixtures.load(name)
+
+        dense = proj.analyses.StaticJumpResolutionAnalysis(cfg)
+        sparse = proj.analyses.StaticJumpResolutionAnalysis(cfg, sparse=True)
+        nt.eq_(sparse.node_states, dense.node_states)
+        nt.ok_(sparse.iterations < dense.iterations)
+
+if __name__ == '__main__':
+    nose.main()
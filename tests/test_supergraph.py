@@ -1,7 +1,8 @@
 import nose
 import nose.tools as nt
 import angr
-from static_jump_resolution.supergraph.supergraph import DummyNode, supergraph_from_cfg
+from static_jump_resolution.supergraph import SupergraphVisitor
+from static_jump_resolution.supergraph.supergraph import DummyNode, LazySupergraph, supergraph_from_cfg
 
 import os.path
 BIN_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bin')
@@ -29,8 +30,9 @@ def check_edges(bin_name, edges):
     'Ijk_Call', or 'Ijk_Ret'. When the source (resp. dest) node is a normal CFGNode, source (resp.
     dest) should be given as its start address. When it is a dummy node, it should be given as a
     pair of (parent_address, dummy_type), where parent_address is the start address of the parent
-    node and dummy_type is one of 'Dummy_Call' or 'Dummy_Ret'. When it is a simprocedure, it should
-    be given as the hooked symbol name.
+    node (or the hooked symbol name, for the exit node of a simprocedure) and dummy_type is one of
+    'Dummy_Call', 'Dummy_Ret' or 'Dummy_Exit'. When it is a simprocedure, it should be given as the
+    hooked symbol name.
 
     :param str bin_name: The path to the binary file under the tests/bin directory.
     :param list edges: A list of (source, dest, jumpkind) edges.
@@ -48,9 +50,8 @@ def check_edges(bin_name, edges):
         if type(nodedef) is int:
             return nodes[nodedef + base_addr]
         elif type(nodedef) is tuple:
-            par_addr, dummy_type = nodedef
-            parent = nodes[par_addr + base_addr]
-            return DummyNode(parent, dummy_type)
+            par_def, dummy_type = nodedef
+            return DummyNode(node_from_def(par_def), dummy_type)
         elif type(nodedef) is str:
             return nodes[proj.loader.find_symbol(nodedef).rebased_addr]
         else:
@@ -58,7 +59,7 @@ def check_edges(bin_name, edges):
 
     def def_from_node(node):
         if type(node) is DummyNode:
-            return (node.parent_node.addr - base_addr, node.dummy_type)
+            return (def_from_node(node.parent_node), node.dummy_type)
         elif node.is_simprocedure:
             return node.name
         else:
@@ -68,7 +69,7 @@ def check_edges(bin_name, edges):
         if type(nodedef) is int:
             return "0x%x" % nodedef
         elif type(nodedef) is tuple:
-            return "(0x%x, %s)" % nodedef
+            return "(%s, %s)" % (nodestr(nodedef[0]), nodedef[1])
         elif type(nodedef) is str:
             return nodedef
         else:
@@ -105,8 +106,10 @@ def test_simple():
     edges = [
         (0x0, (0x0, 'Dummy_Call'), 'Ijk_Boring'),
         ((0x0, 'Dummy_Call'), 0x10, 'Ijk_Call'),
-        (0x10, (0x0, 'Dummy_Ret'), 'Ijk_Ret'),
-        ((0x0, 'Dummy_Ret'), 0x9, 'Ijk_Boring')
+        (0x10, (0x10, 'Dummy_Exit'), 'Ijk_Ret'),
+        ((0x10, 'Dummy_Exit'), (0x0, 'Dummy_Ret'), 'Ijk_Ret'),
+        ((0x0, 'Dummy_Ret'), 0x9, 'Ijk_Boring'),
+        (0x9, (0x0, 'Dummy_Exit'), 'Ijk_Ret')
         ]
     check_edges(filename, edges)
 
@@ -115,14 +118,16 @@ def test_multiple_returns():
     edges = [
         (0x0, (0x0, 'Dummy_Call'), 'Ijk_Boring'),
         ((0x0, 'Dummy_Call'), 0x27, 'Ijk_Call'),
-        (0x27, (0x0, 'Dummy_Ret'), 'Ijk_Ret'),
+        (0x27, (0x27, 'Dummy_Exit'), 'Ijk_Ret'),
+        ((0x27, 'Dummy_Exit'), (0x0, 'Dummy_Ret'), 'Ijk_Ret'),
         ((0x0, 'Dummy_Ret'), 0xe, 'Ijk_Boring'),
         (0xe, 0x1b, 'Ijk_Boring'),
         (0x1b, 0x20, 'Ijk_Boring'),
+        (0x20, (0x0, 'Dummy_Exit'), 'Ijk_Ret'),
         (0x1b, 0x12, 'Ijk_Boring'),
         (0x12, (0x12, 'Dummy_Call'), 'Ijk_Boring'),
         ((0x12, 'Dummy_Call'), 0x27, 'Ijk_Call'),
-        (0x27, (0x12, 'Dummy_Ret'), 'Ijk_Ret'),
+        ((0x27, 'Dummy_Exit'), (0x12, 'Dummy_Ret'), 'Ijk_Ret'),
         ((0x12, 'Dummy_Ret'), 0x19, 'Ijk_Boring'),
         (0x19, 0x1b, 'Ijk_Boring')
         ]
@@ -135,14 +140,111 @@ def test_simprocs():
         (0x0, 0x13, 'Ijk_Boring'),
         (0x9, (0x9, 'Dummy_Call'), 'Ijk_Boring'),
         ((0x9, 'Dummy_Call'), 'exit', 'Ijk_Call'),
-        ('exit', (0x9, 'Dummy_Ret'), 'Ijk_Ret'),
+        ('exit', ('exit', 'Dummy_Exit'), 'Ijk_Ret'),
+        (('exit', 'Dummy_Exit'), (0x9, 'Dummy_Ret'), 'Ijk_Ret'),
         ((0x9, 'Dummy_Ret'), 0x13, 'Ijk_Boring'),
         (0x13, (0x13, 'Dummy_Call'), 'Ijk_Boring'),
         ((0x13, 'Dummy_Call'), 'puts', 'Ijk_Call'),
-        ('puts', (0x13, 'Dummy_Ret'), 'Ijk_Ret'),
-        ((0x13, 'Dummy_Ret'), 0x1c, 'Ijk_Boring')
+        ('puts', ('puts', 'Dummy_Exit'), 'Ijk_Ret'),
+        (('puts', 'Dummy_Exit'), (0x13, 'Dummy_Ret'), 'Ijk_Ret'),
+        ((0x13, 'Dummy_Ret'), 0x1c, 'Ijk_Boring'),
+        (0x1c, (0x0, 'Dummy_Exit'), 'Ijk_Ret')
     ]
     check_edges(filename, edges)
 
+def test_lazy_supergraph():
+    path = os.path.join(BIN_PATH, "multiple_returns.o")
+    proj = angr.Project(path, auto_load_libs=False)
+    base_addr = proj.loader.main_object.mapped_base
+    cfg = proj.analyses.CFGFast()
+
+    lazy = LazySupergraph(cfg)
+    nt.eq_(len(lazy), 0)
+
+    entry = cfg.model.get_any_node(base_addr)
+    succs = list(lazy.successors(entry))
+    nt.eq_(succs, [DummyNode(entry, 'Dummy_Call')])
+    nt.eq_(lazy.expanded_functions, {entry.function_address})
+
+    # Entering the callee expands it
+    callee = next(iter(lazy.successors(succs[0])))
+    list(lazy.successors(callee))
+    nt.eq_(lazy.expanded_functions, {entry.function_address, callee.function_address})
+
+    lazy.expand_all()
+    eager = supergraph_from_cfg(cfg)
+    nt.eq_(set(lazy.nodes), set(eager.nodes))
+    nt.eq_(dict(lazy.edges.items()), dict(eager.edges.items()))
+
+def test_start_points():
+    path = os.path.join(BIN_PATH, "multiple_returns.o")
+    proj = angr.Project(path, auto_load_libs=False)
+    base_addr = proj.loader.main_object.mapped_base
+    cfg = proj.analyses.CFGFast()
+
+    visitor = SupergraphVisitor(cfg)
+    main = cfg.model.get_any_node(base_addr)
+    fn = cfg.model.get_any_node(base_addr + 0x27)
+    nt.eq_(visitor.startpoints(), [main])
+    nt.eq_(visitor.sort_nodes()[0], main)
+
+    index = visitor.entry_index
+    nt.eq_(index.call_degree(fn.addr), 2)
+    nt.eq_(index.uncalled_entries(), [main])
+    nt.eq_(index.exit_nodes(fn.addr), [fn])
+
+    backward = SupergraphVisitor(cfg, direction='backward')
+    nt.eq_(backward.startpoints(), [DummyNode(main, 'Dummy_Exit')])
+
+    custom = SupergraphVisitor(cfg, start_points=['fn', base_addr])
+    nt.eq_(custom.startpoints(), [fn, main])
+    nt.assert_raises(ValueError, SupergraphVisitor, cfg, start_points=['nonexistent'])
+
+def test_restricted_functions():
+    path = os.path.join(BIN_PATH, "multiple_returns.o")
+    proj = angr.Project(path, auto_load_libs=False)
+    base_addr = proj.loader.main_object.mapped_base
+    cfg = proj.analyses.CFGFast()
+
+    main = cfg.model.get_any_node(base_addr)
+    fn = cfg.model.get_any_node(base_addr + 0x27)
+    nt.eq_(SupergraphVisitor(cfg, functions=[fn.function_address]).startpoints(), [])
+
+    visitor = SupergraphVisitor(cfg, functions=[main.function_address])
+    nt.eq_(visitor.startpoints(), [main])
+    nt.assert_false(visitor.traverses(fn))
+
+    # Calls out of the function are left out of the traversal, but returns into it are still
+    # traversal predecessors
+    nt.eq_(visitor.successors(DummyNode(main, 'Dummy_Call')), [])
+    nt.assert_in(DummyNode(fn, 'Dummy_Exit'), visitor.predecessors(DummyNode(main, 'Dummy_Ret')))
+
+def test_traversal_state():
+    path = os.path.join(BIN_PATH, "multiple_returns.o")
+    proj = angr.Project(path, auto_load_libs=False)
+    cfg = proj.analyses.CFGFast()
+
+    visitor = SupergraphVisitor(cfg)
+    visitor.reset()
+    state = visitor.traversal_state()
+    remaining = list(state['_worklist'])
+    nt.assert_true(len(remaining) > 0)
+
+    # Advancing the traversal leaves the saved state untouched
+    visitor.next_node()
+    visitor._nodes_set.add('other')
+    nt.eq_(list(state['_worklist']), remaining)
+    nt.assert_not_in('other', state['_nodes_set'])
+
+    # ... and so does advancing a traversal restored from it
+    visitor.restore_traversal_state(state)
+    visitor.next_node()
+    visitor._nodes_set.add('other')
+    nt.eq_(list(state['_worklist']), remaining)
+    nt.assert_not_in('other', state['_nodes_set'])
+
+    visitor.restore_traversal_state(state)
+    nt.eq_(list(visitor._worklist), remaining)
+
 if __name__ == '__main__':
     nose.main()
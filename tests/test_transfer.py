@@ -0,0 +1,75 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import archinfo
+
+from angr.analyses.code_location import CodeLocation
+
+from static_jump_resolution.def_use import StmtSummary, BlockSummary
+from static_jump_resolution.engine import SimEngineSJRVEX
+from static_jump_resolution.live_vars import LiveVars, QualifiedLiveSet, VarUse
+from static_jump_resolution.stack import StackDeltas
+from static_jump_resolution.transfer import BlockTransfer
+from static_jump_resolution.vars import MEMORY_SUMMARY
+
+import fixtures
+
+amd64 = archinfo.ArchAMD64()
+
+def uses_of(state):
+    return set(u for ls in state.livesets for u in ls.uses)
+
+def test_tables():
+    [a, b, c, d] = arbitrary_vars(4)
+    at = lambda var, idx: VarUse(var, CodeLocation(0x10, idx))
+
+    # 0: b = c; 1: a = b; 2: d = d
+    stmts = [ StmtSummary(0, [b], [c]), StmtSummary(1, [a], [b]), StmtSummary(2, [d], [d]) ]
+    transfer = BlockTransfer(BlockSummary(0x10, stmts))
+    nt.eq_(transfer.gen, frozenset())
+    nt.eq_(transfer.kill, {a, b, d})
+    nt.eq_(transfer.deps, {a: {at(c, 0)}, b: {at(c, 0)}, d: {at(d, 2)}})
+
+    outside = VarUse(c, CodeLocation(0x40, 0))
+    state = LiveVars(amd64, 0, [QualifiedLiveSet(CallString(), [at(a, 5), outside])])
+    nt.eq_(uses_of(transfer.apply(state)), {outside, at(c, 0)})
+    nt.eq_(uses_of(state), {at(a, 5), outside})
+
+    # The target of the jump is live whatever is live after the block
+    transfer = BlockTransfer(BlockSummary(0x10, stmts, jump_uses=[a]), 0x18)
+    nt.eq_(transfer.gen, {at(c, 0)})
+    nt.eq_(uses_of(transfer.apply(LiveVars(amd64, 0))), {at(c, 0)})
+
+def test_same_as_engine():
+    for name in ('simple_jump.o', 'multiple_returns.o'):
+        (proj, cfg) = fixtures.load(name)
+        engine = SimEngineSJRVEX()
+
+        for fn in cfg.kb.functions.values():
+            nodes = [n for n in cfg.graph.nodes if n.function_address == fn.addr]
+            deltas = StackDeltas.compute(fn.addr, nodes, cfg.graph.predecessors, engine, proj.arch)
+            for n in nodes:
+                if n.is_simprocedure:
+                    continue
+
+                ctx = deltas.ctx(n.addr)
+                summary = engine.summarize(n.block, ctx, proj.arch)
+                transfer = engine.transfer(n.block, ctx, proj.arch)
+
+                # Each variable of the block live alone, and all of them at once in another context
+                vars = set(summary.defs | summary.uses) | {MEMORY_SUMMARY}
+                loc = CodeLocation(0x40, 0)
+                states = [LiveVars(proj.arch, fn.addr, [QualifiedLiveSet(CallString(),
+                    [VarUse(v, loc)])]) for v in vars]
+                states.append(LiveVars(proj.arch, fn.addr, [QualifiedLiveSet(CallString(), []),
+                    QualifiedLiveSet(arbitrary_call_string(2),
+                        [VarUse(v, loc) for v in vars])]))
+
+                for state in states:
+                    expected = engine.process(state.copy(), block=n.block, ctx=ctx)
+                    nt.eq_(transfer.apply(state), expected)
+
+if __name__ == '__main__':
+    nose.main()
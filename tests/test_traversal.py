@@ -0,0 +1,76 @@
+import nose
+import nose.tools as nt
+
+from mock_nodes import *
+
+import networkx as nx
+import numpy as np
+import random
+
+from static_jump_resolution.supergraph import Worklist
+from static_jump_resolution.supergraph.traversal import CSRGraph
+
+def random_supergraph(seed, num_fns=6, fn_size=8):
+    """ A random graph of functions of mock nodes, with dummy call and return nodes and exit nodes.
+    """
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    fns = []
+
+    for f in range(num_fns):
+        base = f * 0x100
+        nodes = [ CFGNode(base + i, base, has_return=(i == fn_size - 1)) for i in range(fn_size) ]
+        fns.append(nodes)
+        graph.add_nodes_from(nodes)
+        for i in range(fn_size - 1):
+            graph.add_edge(nodes[i], nodes[i + 1])
+            if rng.random() < 0.3:
+                graph.add_edge(nodes[i + 1], nodes[rng.randrange(i + 1)])
+
+    for nodes in fns:
+        exit = DummyNode(nodes[0], 'Dummy_Exit')
+        graph.add_edge(nodes[-1], exit)
+
+    for (f, nodes) in enumerate(fns):
+        for i in range(1, len(nodes) - 1):
+            if rng.random() < 0.2:
+                callee = fns[rng.randrange(len(fns))]
+                call = DummyNode(nodes[i], 'Dummy_Call')
+                ret = DummyNode(nodes[i], 'Dummy_Ret')
+                graph.add_edge(nodes[i], call)
+                graph.add_edge(call, callee[0])
+                graph.add_edge(DummyNode(callee[0], 'Dummy_Exit'), ret)
+                graph.add_edge(ret, nodes[i + 1])
+
+    return graph, [ nodes[0] for nodes in fns ]
+
+def test_worklist_matches_reachable():
+    for seed in range(5):
+        (graph, entries) = random_supergraph(seed)
+        csr = CSRGraph(graph)
+
+        for direction in ('forward', 'backward'):
+            starts = entries[:1] if direction == 'forward' else \
+                    [ n for n in graph.nodes if graph.out_degree(n) == 0 ]
+            order = list(Worklist(direction, starts).exhaust(graph))
+
+            reached = csr.reachable(starts, reverse=(direction == 'backward'))
+            nt.eq_(len(order), len(set(order)))
+            nt.eq_(set(order), set(csr.nodes_of(np.flatnonzero(reached))))
+
+def test_reachable():
+    (graph, entries) = random_supergraph(0)
+    csr = CSRGraph(graph)
+
+    forward = set(csr.nodes_of(np.flatnonzero(csr.reachable(entries[:2]))))
+    expected = set(entries[:2])
+    for e in entries[:2]:
+        expected |= nx.descendants(graph, e)
+    nt.eq_(forward, expected)
+
+    target = entries[3]
+    backward = set(csr.nodes_of(np.flatnonzero(csr.reachable([target], reverse=True))))
+    nt.eq_(backward, nx.ancestors(graph, target) | {target})
+
+if __name__ == '__main__':
+    nose.main()
@@ -10,6 +10,7 @@ from static_jump_resolution.vars import \
 
 import pyvex
 import archinfo
+import pickle
 
 amd64 = archinfo.ArchAMD64()
 sp = amd64.sp_offset
@@ -78,5 +79,33 @@ def test_memory_location_general():
     expected = MemoryLocation(addr, 8)
     nt.eq_(expected, memory_location(addr, ctx, amd64, ty))
 
+def test_interning():
+    nt.ok_(Register(16, 8) is Register(16, 8.0))
+    nt.ok_(StackVar(0x400000, -8, 8) is not StackVar(0x400000, -16, 8))
+
+    rcx = amd64.get_register_by_name("rcx").vex_offset
+    loc = MemoryLocation(pyvex.IRExpr.Get(rcx, 'Ity_I64'), 8)
+    nt.ok_(loc is MemoryLocation(pyvex.IRExpr.Get(rcx, 'Ity_I64'), 8))
+    nt.eq_(hash(loc), loc._hash)
+
+    use = VarUse(Register(16, 8), CodeLocation(0x10, 2))
+    nt.ok_(use is VarUse(Register(16, 8), CodeLocation(0x10, 2)))
+    nt.ok_(pickle.loads(pickle.dumps(use)) is use)
+
+    [node] = arbitrary_call_nodes(1)
+    nt.ok_(DummyNode(node.parent_node, 'Dummy_Call') is node)
+
+    # Equal nodes of different functions have distinct dummy nodes
+    (n1, n2) = (CFGNode(0x20, 0x10), CFGNode(0x20, 0x18))
+    nt.eq_(n1, n2)
+    nt.ok_(DummyNode(n1, 'Dummy_Call') is not DummyNode(n2, 'Dummy_Call'))
+    nt.eq_(DummyNode(n2, 'Dummy_Call').fn_addr, 0x18)
+
+    # Records differing only in their stack and base pointers are distinct, but equal
+    (r1, r2) = (CtxRecord(node, -8, -8), CtxRecord(node, -16, -8))
+    nt.ok_(r1 is not r2)
+    nt.eq_(r1, r2)
+    nt.eq_(hash(r1), hash(r2))
+
 if __name__ == '__main__':
     nose.main()